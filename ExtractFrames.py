@@ -1,5 +1,130 @@
+import re
+
 import torch
 
+
+# 与其他批次节点一致的帧数上限
+_MAX_FRAMES = 0x7FFFFFFF
+
+_SLICE_PATTERN = re.compile(r"^(-?\d+)?:(-?\d+)?(?::(-?\d+))?$")
+_RANGE_PATTERN = re.compile(r"^(-?\d+)\s*-\s*(-?\d+)(?::(\d+))?$")
+_INDEX_PATTERN = re.compile(r"^-?\d+$")
+
+
+def _normalize_index(index, total_frames, item):
+    """负数索引从末尾倒数，超出批次范围时报错。"""
+    resolved = index + total_frames if index < 0 else index
+    if not 0 <= resolved < total_frames:
+        raise ValueError(f"ExtractFrames: 范围 '{item}' 中的索引 {index} 超出批次范围（共 {total_frames} 帧）。")
+    return resolved
+
+
+def parse_range_spec(spec, total_frames):
+    """
+    将范围描述解析为 range 对象列表，按书写顺序排列。
+
+    以逗号分隔多个片段，每个片段可以是：
+    - 单个索引：`5`、`-1`
+    - 闭区间 `a-b[:step]`：`0-47`、`120-200:2`，a 大于 b 时倒序提取
+    - Python 切片 `start:stop[:step]`：`-16:`、`::4`、`10:0:-1`
+    负数索引从批次末尾倒数；切片超出范围时与 Python 一样自动截断。
+    """
+    ranges = []
+    for item in (part.strip() for part in spec.split(",")):
+        if not item:
+            continue
+        if _INDEX_PATTERN.match(item):
+            index = _normalize_index(int(item), total_frames, item)
+            ranges.append(range(index, index + 1))
+            continue
+        match = _RANGE_PATTERN.match(item)
+        if match:
+            first = _normalize_index(int(match.group(1)), total_frames, item)
+            last = _normalize_index(int(match.group(2)), total_frames, item)
+            step = int(match.group(3) or 1)
+            if step == 0:
+                raise ValueError(f"ExtractFrames: 范围 '{item}' 的步长不能为 0。")
+            ranges.append(range(first, last + 1, step) if first <= last else range(first, last - 1, -step))
+            continue
+        match = _SLICE_PATTERN.match(item.replace(" ", ""))
+        if match:
+            start, stop, step = (int(value) if value is not None else None for value in match.groups())
+            if step == 0:
+                raise ValueError(f"ExtractFrames: 切片 '{item}' 的步长不能为 0。")
+            ranges.append(range(total_frames)[slice(start, stop, step)])
+            continue
+        raise ValueError(f"ExtractFrames: 无法解析范围 '{item}'，支持 5、0-47、120-200:2、-16: 等写法。")
+    return ranges
+
+
+def _as_selection(ranges):
+    """
+    合并各片段的索引。所有索引构成步长为正的等差数列时返回 slice，
+    可以直接切片得到视图；否则返回 int64 索引张量，由一次 index_select 完成提取。
+    """
+    pieces = [range_ for range_ in ranges if len(range_)]
+    if not pieces:
+        return slice(0, 0), []
+    if len(pieces) == 1 and pieces[0].step > 0:
+        piece = pieces[0]
+        return slice(piece.start, piece.stop, piece.step), list(piece)
+
+    indices = [index for piece in pieces for index in piece]
+    if len(indices) > 1:
+        step = indices[1] - indices[0]
+        if step > 0 and all(b - a == step for a, b in zip(indices, indices[1:])):
+            return slice(indices[0], indices[-1] + 1, step), indices
+    elif len(indices) == 1:
+        return slice(indices[0], indices[0] + 1), indices
+    return torch.tensor(indices, dtype=torch.long), indices
+
+
+def _take(batch, selection, total_frames, name, dim=0):
+    """
+    对任意张量沿帧维度 dim 应用同一选择；单帧批次视为对所有帧共用，原样返回。
+
+    batch 也可以是提供 shape 和 read() 的磁盘帧存储，此时只读取被选中的帧。
+    """
+    if batch is None:
+        return None
+    if not isinstance(batch, torch.Tensor):
+        return batch.read(selection)
+    if batch.shape[dim] == 1 and total_frames != 1:
+        return batch
+    if batch.shape[dim] != total_frames:
+        raise ValueError(f"ExtractFrames: {name} 为 {batch.shape[dim]} 帧，与批次的 {total_frames} 帧不一致。")
+    if isinstance(selection, slice):
+        return batch[(slice(None),) * dim + (selection,)]
+    return torch.index_select(batch, dim, selection.to(batch.device))
+
+
+def _latent_frame_dim(samples):
+    """图像 LATENT 为 (B, C, H, W)，帧在第 0 维；视频 LATENT 为 (B, C, T, H, W)，帧在第 2 维。"""
+    return 2 if samples.ndim == 5 else 0
+
+
+def _latent_frame_count(latent):
+    samples = latent["samples"]
+    return samples.shape[_latent_frame_dim(samples)]
+
+
+def _take_latent(latent, selection, total_frames):
+    """对 LATENT 字典中的 samples 及随帧变化的附加字段应用同一选择，视频 LATENT 沿帧维度选择。"""
+    if latent is None:
+        return None
+    result = dict(latent)
+    dim = _latent_frame_dim(latent["samples"])
+    result["samples"] = _take(latent["samples"], selection, total_frames, "LATENT", dim)
+    noise_mask = latent.get("noise_mask")
+    if isinstance(noise_mask, torch.Tensor) and noise_mask.ndim > dim and noise_mask.shape[dim] == total_frames:
+        result["noise_mask"] = _take(noise_mask, selection, total_frames, "LATENT noise_mask", dim)
+    batch_index = latent.get("batch_index")
+    if dim == 0 and batch_index is not None and len(batch_index) == total_frames:
+        positions = range(total_frames)[selection] if isinstance(selection, slice) else selection.tolist()
+        result["batch_index"] = [batch_index[i] for i in positions]
+    return result
+
+
 class ExtractFramesFromBatch:
     """
     一个ComfyUI节点，用于从图像批次中提取指定数量的帧。
@@ -11,9 +136,14 @@ class ExtractFramesFromBatch:
     - start_index: 起始帧的索引 (从0开始)
     - direction: 提取方向 ("forward" 或 "backward")
     - frame_count: 要提取的总帧数
+    - range_spec: 可选的范围描述，如 `0-47, 120-200:2, -16:`，填写后替代上面三个参数
+    - mask / latent: 可选的 MASK、LATENT 批次，按与图像相同的索引提取；视频 LATENT 沿帧维度提取
+    - frame_store: 可选的磁盘帧存储，连接后代替 image，只读取被选中的帧
+    所有输入均为可选，帧数取自第一个已连接的图像（或帧存储）、遮罩、LATENT。
     
     输出:
-    - image: 提取出的新图像批次
+    - image / mask / latent: 对应提取后的批次（未连接输入时为 None）
+    - indices: 实际提取的帧索引，逗号分隔，可直接作为 range_spec 使用
     """
     
     @classmethod
@@ -23,11 +153,10 @@ class ExtractFramesFromBatch:
         """
         return {
             "required": {
-                "image": ("IMAGE",),
                 "start_index": ("INT", {
                     "default": 0, 
                     "min": 0, 
-                    "max": 8192,  # 允许一个较大的最大值
+                    "max": _MAX_FRAMES,
                     "step": 1
                 }),
                 "direction": (["forward", "backward"], {
@@ -36,28 +165,54 @@ class ExtractFramesFromBatch:
                 "frame_count": ("INT", {
                     "default": 1, 
                     "min": 1,     # 至少提取1帧
-                    "max": 8192,
+                    "max": _MAX_FRAMES,
                     "step": 1
                 }),
+            },
+            "optional": {
+                "image": ("IMAGE", {"tooltip": "需要提取帧的 IMAGE 批次；也可以只连接帧存储、遮罩或 Latent。"}),
+                "frame_store": ("CK_FRAME_STORE", {"tooltip": "可选的磁盘帧存储，连接后代替图像批次，只读取被选中的帧。"}),
+                "range_spec": ("STRING", {
+                    "default": "",
+                    "tooltip": "可选的多段范围，如 0-47, 120-200:2, -16:。a-b 为闭区间，:step 为步长，start:stop:step 为 Python 切片，负数从末尾倒数。填写后忽略起始索引、方向和帧数。"
+                }),
+                "mask": ("MASK", {"tooltip": "可选，按与图像相同的索引提取的 MASK 批次；未连接图像时按遮罩自身的帧数提取。"}),
+                "latent": ("LATENT", {"tooltip": "可选，按与图像相同的索引提取的 LATENT 批次；视频 Latent (B, C, T, H, W) 沿帧维度 T 提取。"}),
             }
         }
 
-    RETURN_TYPES = ("IMAGE",)
+    RETURN_TYPES = ("IMAGE", "MASK", "LATENT", "STRING")
+    RETURN_NAMES = ("image", "mask", "latent", "indices")
     FUNCTION = "extract_frames"
     CATEGORY = "CK Nodes/Video/Batch"
 
-    def extract_frames(self, image, start_index, direction, frame_count):
+    def extract_frames(self, image=None, start_index=0, direction="forward", frame_count=1, range_spec="", mask=None, latent=None, frame_store=None):
         """
         主要的执行函数
         """
-        # 获取输入的图像批次总帧数
-        # image shape is (B, H, W, C)
-        total_frames = image.shape[0]
+        if frame_store is not None:
+            image = frame_store
+        # 获取总帧数：image shape is (B, H, W, C)，未连接图像时取遮罩或 latent 的帧数
+        if image is not None:
+            total_frames = image.shape[0]
+        elif mask is not None:
+            total_frames = mask.shape[0]
+        elif latent is not None:
+            total_frames = _latent_frame_count(latent)
+        else:
+            raise ValueError("ExtractFrames: 需要连接图像批次、帧存储、遮罩或 Latent 中的至少一个。")
 
         # 1. 处理空批次或无效输入的边缘情况
         if total_frames == 0:
             print("ExtractFrames: 输入批次为空，返回空批次。")
-            return (image,) # 直接返回空批次
+            return self._extract(image, mask, latent, slice(0, 0), [], 0) # 直接返回空批次
+
+        if range_spec and range_spec.strip():
+            selection, indices = _as_selection(parse_range_spec(range_spec, total_frames))
+            print(f"ExtractFrames: 原始批次大小: {total_frames} 帧")
+            print(f"ExtractFrames: 范围: {range_spec.strip()}，提取 {len(indices)} 帧"
+                  + ("（切片视图）" if isinstance(selection, slice) else "（索引提取）"))
+            return self._extract(image, mask, latent, selection, indices, total_frames)
 
         # 2. 确保参数有效
         # 确保 start_index 不会超过总帧数减1 (因为索引从0开始)
@@ -84,13 +239,23 @@ class ExtractFramesFromBatch:
         print(f"ExtractFrames: 模式: {direction}, 起始索引: {start_index}, 提取数量: {frame_count}")
         print(f"ExtractFrames: 实际切片范围: [{start_slicer}:{end_slicer}]")
         
-        extracted_batch = image[start_slicer:end_slicer]
+        selection = slice(start_slicer, end_slicer)
+        result = self._extract(image, mask, latent, selection, list(range(start_slicer, end_slicer)), total_frames)
         
-        print(f"ExtractFrames: 提取后批次大小: {extracted_batch.shape[0]} 帧")
+        print(f"ExtractFrames: 提取后批次大小: {end_slicer - start_slicer} 帧")
 
         # 5. 返回结果
         # 必须返回一个元组 (tuple)
-        return (extracted_batch,)
+        return result
+
+    def _extract(self, image, mask, latent, selection, indices, total_frames):
+        """对图像、遮罩和 latent 应用同一选择，并输出索引列表。"""
+        return (
+            _take(image, selection, total_frames, "IMAGE"),
+            _take(mask, selection, total_frames, "MASK"),
+            _take_latent(latent, selection, total_frames),
+            ",".join(str(index) for index in indices),
+        )
 
 # 注册节点到 ComfyUI
 NODE_CLASS_MAPPINGS = {
@@ -16,29 +16,189 @@ def _round_half_up(value):
     return (value.numerator * 2 + value.denominator) // (value.denominator * 2)
 
 
-def calculate_frame_indices(frame_count, input_fps, output_fps):
+_INT64_MAX = 2 ** 63 - 1
+
+
+def _source_step(input_fps, output_fps):
+    """每个输出帧在源时间轴上前进的帧数 input_fps / output_fps，以既约分数表示。"""
+    return _fps_fraction(input_fps) / _fps_fraction(output_fps)
+
+
+def _output_count(frame_count, step):
+    """N 帧输入对应的输出帧数：最接近 N / step 的整数，至少 1 帧。"""
+    return max(1, _round_half_up(frame_count / step))
+
+
+def _first_output_at(frame_index, step):
+    """第一个源索引 >= frame_index 的输出帧编号，即 (2 * j * P + Q) // (2 * Q) >= frame_index 的最小 j。"""
+    if frame_index <= 0:
+        return 0
+    numerator = (2 * frame_index - 1) * step.denominator
+    return -(-numerator // (2 * step.numerator))
+
+
+def _source_index_range(start, stop, step):
+    """输出帧 start..stop-1 未截断的源索引 round_half_up(j * step)，int64 张量。"""
+    numerator, denominator = step.numerator, step.denominator
+    if stop <= start:
+        return torch.empty(0, dtype=torch.long)
+    if 2 * (stop - 1) * numerator + denominator > _INT64_MAX:
+        # 极端的小数 FPS 组合会超出 int64，退回 Python 大整数逐帧计算
+        return torch.tensor([(2 * j * numerator + denominator) // (2 * denominator) for j in range(start, stop)], dtype=torch.long)
+    indices = torch.arange(start, stop, dtype=torch.long)
+    return indices.mul_(2 * numerator).add_(denominator).floor_divide_(2 * denominator)
+
+
+def calculate_frame_index_tensor(frame_count, input_fps, output_fps):
     """
-    按时间戳最近邻重采样计算源帧索引。
+    按时间戳最近邻重采样计算源帧索引，返回 int64 张量。
 
     输入的 N 帧被视为覆盖 N / input_fps 秒。输出帧数取最接近
     N * output_fps / input_fps 的整数；输出帧 j 对应时间 j / output_fps，
     并匹配时间上最近的输入帧。
+
+    记步进 input_fps / output_fps = P / Q（既约分数），则
+    round_half_up(j * P / Q) = (2 * j * P + Q) // (2 * Q)，
+    整个索引序列由一次整数张量运算得到，结果与逐帧有理数计算完全一致。
     """
     if frame_count < 0:
         raise ValueError("帧数不能为负数。")
     if frame_count == 0:
-        return []
+        return torch.empty(0, dtype=torch.long)
+
+    step = _source_step(input_fps, output_fps)
+    return _source_index_range(0, _output_count(frame_count, step), step).clamp_(max=frame_count - 1)
+
+
+def calculate_frame_indices(frame_count, input_fps, output_fps):
+    """与 calculate_frame_index_tensor 相同，返回 Python 整数列表。"""
+    return calculate_frame_index_tensor(frame_count, input_fps, output_fps).tolist()
+
+
+def calculate_blend_positions(frame_count, input_fps, output_fps):
+    """
+    线性混合插帧的时间位置：输出帧 j 位于源时间轴 j * input_fps / output_fps。
+
+    返回 (前一帧索引, 后一帧索引, 后一帧权重 remainder / denominator)。前两项为 int64 张量，
+    权重以整数余数和公分母给出，避免累计的浮点误差；超出最后一帧的位置保持最后一帧。
+    输出帧数与最近邻模式相同。
+    """
+    if frame_count == 0:
+        empty = torch.empty(0, dtype=torch.long)
+        return empty, empty, empty, 1
+
+    step = _source_step(input_fps, output_fps)
+    numerator, denominator = step.numerator, step.denominator
+    output_count = _output_count(frame_count, step)
+    if (output_count - 1) * numerator > _INT64_MAX:
+        positions = [j * numerator for j in range(output_count)]
+        lower = torch.tensor([position // denominator for position in positions], dtype=torch.long)
+        remainder = torch.tensor([position % denominator for position in positions], dtype=torch.long)
+    else:
+        positions = torch.arange(output_count, dtype=torch.long).mul_(numerator)
+        lower = torch.div(positions, denominator, rounding_mode="floor")
+        remainder = positions.sub_(lower * denominator)
+
+    last = frame_count - 1
+    remainder[lower >= last] = 0
+    lower.clamp_(max=last)
+    upper = (lower + 1).clamp_(max=last)
+    return lower, upper, remainder, denominator
+
+
+def _gather(images, selection):
+    """
+    按 slice 或 int64 索引张量取帧。
+
+    images 也可以是提供 shape 和 read() 的磁盘帧存储，此时只读取被选中的帧。
+    """
+    if not isinstance(images, torch.Tensor):
+        return images.read(selection)
+    if isinstance(selection, slice):
+        return images[selection]
+    return torch.index_select(images, 0, selection.to(images.device))
+
+
+def blend_frames(images, lower, upper, remainder, denominator, chunk_size=64):
+    """
+    按 calculate_blend_positions 的结果逐块混合相邻两帧，写入预分配的输出批次。
+
+    每块只取出 chunk_size 帧的前后帧，浮点中间结果不超过一块的大小。
+    """
+    dtype, device = (images.dtype, images.device) if isinstance(images, torch.Tensor) else (torch.float32, torch.device("cpu"))
+    output = torch.empty((len(lower),) + tuple(images.shape[1:]), dtype=dtype, device=device)
+    chunk_size = max(1, int(chunk_size))
+    weights = remainder.to(torch.float64).div_(denominator)
+    for start in range(0, len(lower), chunk_size):
+        stop = min(start + chunk_size, len(lower))
+        before = _gather(images, lower[start:stop])
+        after = _gather(images, upper[start:stop])
+        weight = weights[start:stop].to(device=device, dtype=dtype).view((-1,) + (1,) * (len(images.shape) - 1))
+        torch.lerp(before, after, weight, out=output[start:stop])
+    return output
+
+
+def calculate_chunk_frame_indices(frame_offset, chunk_length, input_fps, output_fps, is_last_chunk=False, total_frame_count=0):
+    """
+    计算整段序列中 [frame_offset, frame_offset + chunk_length) 这一块应输出的帧。
+
+    返回 (first_output_index, 块内源帧索引张量)。各块依次拼接的结果与一次性处理整段
+    序列完全一致：块只输出源帧落在本块内且已能确定属于最终输出的帧。
+
+    总帧数未知时，非最后一块只知道 N >= 块结束位置 + 1。抽帧倍数不超过 3 时这已足够
+    确定本块的全部输出；超过 3 倍时块尾的输出可能要到知道总帧数后才能确定，
+    此时必须提供 total_frame_count。
+    """
+    if frame_offset < 0 or chunk_length < 0:
+        raise ValueError("帧偏移和块长度不能为负数。")
+    step = _source_step(input_fps, output_fps)
+    chunk_end = frame_offset + chunk_length
+    if total_frame_count > 0:
+        if chunk_end > total_frame_count:
+            raise ValueError(f"块结束位置 {chunk_end} 超过总帧数 {total_frame_count}。")
+        is_last_chunk = is_last_chunk or chunk_end == total_frame_count
+
+    def emitted_before(frame_index, last):
+        """源帧索引小于 frame_index 的部分处理完后，已经输出的帧数。"""
+        if total_frame_count > 0:
+            limit = _output_count(total_frame_count, step)
+        elif last:
+            limit = _output_count(frame_index, step)
+        else:
+            limit = _output_count(frame_index + 1, step)
+        if last:
+            return limit
+        first = _first_output_at(frame_index, step)
+        if first > limit and total_frame_count <= 0:
+            raise ValueError(
+                "抽帧倍数超过 3 倍时，块尾输出取决于总帧数，请提供 total_frame_count 或将该块标记为最后一块。"
+            )
+        return min(first, limit)
+
+    start = emitted_before(frame_offset, False) if frame_offset > 0 else 0
+    stop = emitted_before(chunk_end, is_last_chunk) if chunk_length > 0 else start
+    indices = _source_index_range(start, stop, step)
+    if is_last_chunk:
+        indices.clamp_(max=chunk_end - 1)
+    return start, indices.sub_(frame_offset)
 
-    input_rate = _fps_fraction(input_fps)
-    output_rate = _fps_fraction(output_fps)
-    output_count = max(1, _round_half_up(frame_count * output_rate / input_rate))
 
-    indices = []
-    for output_index in range(output_count):
-        source_position = Fraction(output_index) * input_rate / output_rate
-        source_index = _round_half_up(source_position)
-        indices.append(min(source_index, frame_count - 1))
-    return indices
+def _regular_slice(indices):
+    """
+    索引为等差递增序列（原样输出、整数倍抽帧、连续区间）时返回对应的 slice，否则返回 None。
+
+    对 dim 0 做基本切片得到的是原批次的视图，不会复制帧数据。
+    """
+    count = int(indices.numel())
+    if count == 0:
+        return None
+    start = int(indices[0])
+    if count == 1:
+        return slice(start, start + 1)
+    stride = int(indices[1]) - start
+    if stride < 1 or not bool((indices[1:] - indices[:-1] == stride).all()):
+        return None
+    return slice(start, start + (count - 1) * stride + 1, stride)
 
 
 def _compact_indices(indices):
@@ -77,7 +237,7 @@ def _compact_indices(indices):
     return ", ".join(groups)
 
 
-def build_match_info(frame_count, indices, input_fps, output_fps):
+def build_match_info(frame_count, indices, input_fps, output_fps, blended_count=None):
     input_duration = frame_count / float(input_fps) if frame_count else 0.0
     output_duration = len(indices) / float(output_fps) if indices else 0.0
     duration_error = output_duration - input_duration
@@ -85,20 +245,29 @@ def build_match_info(frame_count, indices, input_fps, output_fps):
     duplicate_count = len(indices) - unique_count
     dropped_count = max(0, frame_count - unique_count)
     mode = "抽帧" if output_fps < input_fps else "重复帧补齐" if output_fps > input_fps else "原样输出"
+    if blended_count is None:
+        method = "时间轴最近邻匹配，无插值"
+    else:
+        mode = "插帧" if output_fps > input_fps else mode
+        method = f"时间轴线性混合插值，{blended_count} 帧由相邻两帧混合生成"
 
     return "\n".join(
         [
             "CK 帧率匹配结果",
-            f"模式: {mode}（时间轴最近邻匹配，无插值）",
+            f"模式: {mode}（{method}）",
             f"输入: {frame_count} 帧 @ {float(input_fps):.6g} FPS，时长 {input_duration:.6f} 秒",
             f"输出: {len(indices)} 帧 @ {float(output_fps):.6g} FPS，时长 {output_duration:.6f} 秒",
             f"时长误差: {duration_error:+.9f} 秒",
-            f"使用源帧: {unique_count} 帧；丢弃: {dropped_count} 帧；重复输出: {duplicate_count} 帧",
-            f"源帧索引（从 0 开始）: {_compact_indices(indices)}",
+            f"使用源帧: {unique_count} 帧；丢弃: {dropped_count} 帧；"
+            + (f"重复输出: {duplicate_count} 帧" if blended_count is None else f"混合生成: {blended_count} 帧"),
+            f"{'前一源帧索引' if blended_count is not None else '源帧索引'}（从 0 开始）: {_compact_indices(indices)}",
         ]
     )
 
 
+_INTERPOLATION_MODES = ["Nearest (Duplicate)", "Linear Blend"]
+
+
 class MatchBatchFrameRate:
     """将 IMAGE 批次按输入、输出 FPS 进行时间轴匹配。"""
 
@@ -106,7 +275,6 @@ class MatchBatchFrameRate:
     def INPUT_TYPES(cls):
         return {
             "required": {
-                "images": ("IMAGE", {"tooltip": "按时间顺序排列的输入帧批次。"}),
                 "input_fps": (
                     "FLOAT",
                     {
@@ -129,7 +297,27 @@ class MatchBatchFrameRate:
                         "tooltip": "希望输出帧序列对应的帧率。高于输入 FPS 时会重复帧。",
                     },
                 ),
-            }
+            },
+            "optional": {
+                "images": ("IMAGE", {"tooltip": "按时间顺序排列的输入帧批次；连接帧存储时可以不连接。"}),
+                "frame_store": ("CK_FRAME_STORE", {"tooltip": "可选的磁盘帧存储，连接后代替输入帧批次，只读取匹配到的帧。"}),
+                "interpolation": (
+                    _INTERPOLATION_MODES,
+                    {
+                        "default": "Nearest (Duplicate)",
+                        "tooltip": "Nearest (Duplicate): 取时间轴上最近的源帧，升帧时重复帧。Linear Blend: 按精确的小数时间位置线性混合相邻两帧。",
+                    },
+                ),
+                "interpolation_chunk_size": (
+                    "INT",
+                    {
+                        "default": 64,
+                        "min": 1,
+                        "max": 4096,
+                        "tooltip": "Linear Blend 每次生成的帧数，决定混合时浮点中间结果的内存上限。",
+                    },
+                ),
+            },
         }
 
     RETURN_TYPES = ("IMAGE", "STRING")
@@ -142,25 +330,148 @@ class MatchBatchFrameRate:
     CATEGORY = "CK Nodes/Video/Batch"
     DESCRIPTION = "依据输入和输出 FPS，在时间轴上自动匹配最接近的源帧，避免固定间隔抽帧造成累计漂移。"
 
-    def match_frame_rate(self, images, input_fps, output_fps):
+    def match_frame_rate(self, images=None, input_fps=30.0, output_fps=24.0, interpolation="Nearest (Duplicate)", interpolation_chunk_size=64, frame_store=None):
+        if frame_store is not None:
+            images = frame_store
+        if images is None:
+            raise ValueError("需要连接输入帧批次或帧存储。")
         frame_count = int(images.shape[0])
-        indices = calculate_frame_indices(frame_count, input_fps, output_fps)
+        if interpolation == "Linear Blend" and frame_count:
+            lower, upper, remainder, denominator = calculate_blend_positions(frame_count, input_fps, output_fps)
+            blended = int(torch.count_nonzero(remainder))
+            info = build_match_info(frame_count, lower.tolist(), input_fps, output_fps, blended_count=blended)
+            if blended:
+                output_images = blend_frames(images, lower, upper, remainder, denominator, interpolation_chunk_size)
+            else:
+                # 没有小数位置时与最近邻结果相同，沿用视图
+                regular = _regular_slice(lower)
+                output_images = _gather(images, regular if regular is not None else lower)
+            print(info)
+            return output_images, info
+
+        index_tensor = calculate_frame_index_tensor(frame_count, input_fps, output_fps)
+        indices = index_tensor.tolist()
         info = build_match_info(frame_count, indices, input_fps, output_fps)
 
-        if indices:
-            index_tensor = torch.tensor(indices, dtype=torch.long, device=images.device)
-            output_images = torch.index_select(images, 0, index_tensor)
+        regular = _regular_slice(index_tensor)
+        if regular is not None:
+            # 规则映射直接返回切片视图，只有不规则映射才需要复制
+            output_images = images if regular == slice(0, frame_count, 1) and isinstance(images, torch.Tensor) else _gather(images, regular)
+        elif indices:
+            output_images = _gather(images, index_tensor)
         else:
-            output_images = images
+            output_images = _gather(images, slice(0, 0))
 
         print(info)
         return output_images, info
 
 
+class MatchBatchFrameRateChunk:
+    """分块流式版本：按整段序列的时间轴处理其中一块，结果与一次性处理整段完全一致。"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "images": ("IMAGE", {"tooltip": "当前块的输入帧，各块按时间顺序依次输入。"}),
+                "input_fps": (
+                    "FLOAT",
+                    {
+                        "default": 30.0,
+                        "min": 0.001,
+                        "max": 1000.0,
+                        "step": 0.001,
+                        "round": 0.000001,
+                        "tooltip": "输入帧序列原本对应的帧率。",
+                    },
+                ),
+                "output_fps": (
+                    "FLOAT",
+                    {
+                        "default": 24.0,
+                        "min": 0.001,
+                        "max": 1000.0,
+                        "step": 0.001,
+                        "round": 0.000001,
+                        "tooltip": "希望输出帧序列对应的帧率。高于输入 FPS 时会重复帧。",
+                    },
+                ),
+                "frame_offset": (
+                    "INT",
+                    {
+                        "default": 0,
+                        "min": 0,
+                        "max": 0x7FFFFFFF,
+                        "tooltip": "当前块第一帧在整段序列中的位置。第一块为 0，之后连接上一块输出的 next_frame_offset。",
+                    },
+                ),
+                "is_last_chunk": (
+                    "BOOLEAN",
+                    {
+                        "default": False,
+                        "tooltip": "当前块是否为整段序列的最后一块。最后一块会输出末尾剩余的帧。",
+                    },
+                ),
+            },
+            "optional": {
+                "total_frame_count": (
+                    "INT",
+                    {
+                        "default": 0,
+                        "min": 0,
+                        "max": 0x7FFFFFFF,
+                        "tooltip": "整段序列的总帧数，0 表示未知。抽帧倍数超过 3 倍时必须提供。",
+                    },
+                ),
+            },
+        }
+
+    RETURN_TYPES = ("IMAGE", "INT", "STRING")
+    RETURN_NAMES = ("images", "next_frame_offset", "info")
+    OUTPUT_TOOLTIPS = (
+        "当前块完成帧率匹配后的帧，可能为空批次。",
+        "下一块的 frame_offset。",
+        "当前块的输出帧范围与源帧索引。",
+    )
+    FUNCTION = "match_frame_rate_chunk"
+    CATEGORY = "CK Nodes/Video/Batch"
+    DESCRIPTION = "分块处理长视频的帧率匹配：传入帧偏移并输出下一块的偏移，各块结果拼接后与整段一次性处理完全一致，内存只取决于块大小。"
+
+    def match_frame_rate_chunk(self, images, input_fps, output_fps, frame_offset, is_last_chunk, total_frame_count=0):
+        chunk_length = int(images.shape[0])
+        first_output, index_tensor = calculate_chunk_frame_indices(
+            frame_offset, chunk_length, input_fps, output_fps, is_last_chunk, total_frame_count
+        )
+
+        regular = _regular_slice(index_tensor)
+        if regular is not None:
+            output_images = images if regular == slice(0, chunk_length, 1) else images[regular]
+        elif index_tensor.numel():
+            output_images = torch.index_select(images, 0, index_tensor.to(images.device))
+        else:
+            output_images = images[:0]
+
+        next_frame_offset = frame_offset + chunk_length
+        source_indices = (index_tensor + frame_offset).tolist()
+        info = "\n".join(
+            [
+                "CK 帧率匹配（分块）",
+                f"输入块: 第 {frame_offset} - {next_frame_offset - 1} 帧，共 {chunk_length} 帧 @ {float(input_fps):.6g} FPS",
+                f"输出: 第 {first_output} - {first_output + len(source_indices) - 1} 帧，共 {len(source_indices)} 帧 @ {float(output_fps):.6g} FPS",
+                f"下一块帧偏移: {next_frame_offset}{'（最后一块）' if is_last_chunk else ''}",
+                f"源帧索引（整段序列，从 0 开始）: {_compact_indices(source_indices)}",
+            ]
+        )
+        print(info)
+        return output_images, next_frame_offset, info
+
+
 NODE_CLASS_MAPPINGS = {
     "CKMatchBatchFrameRate": MatchBatchFrameRate,
+    "CKMatchBatchFrameRateChunk": MatchBatchFrameRateChunk,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "CKMatchBatchFrameRate": "CK Match Batch Frame Rate",
+    "CKMatchBatchFrameRateChunk": "CK Match Batch Frame Rate (Chunked)",
 }
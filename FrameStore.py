@@ -0,0 +1,313 @@
+import json
+import os
+import tempfile
+import threading
+import uuid
+import weakref
+
+import numpy as np
+import torch
+
+
+_STORAGE_DTYPES = {"uint8": np.uint8, "float16": np.float16}
+_MAX_FRAMES = 0x7FFFFFFF
+
+
+def _default_directory():
+    return os.path.join(tempfile.gettempdir(), "ck_frame_store")
+
+
+def _remove_segment_files(path, mapping):
+    """先关闭内存映射再删除文件；Windows 上仍被其他进程或视图占用时保留文件。"""
+    mapping.clear()
+    for file_path in (path, os.path.splitext(path)[0] + ".json"):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"FrameStore: 删除临时文件 {file_path} 失败：{e}")
+
+
+class _Segment:
+    """
+    一次写入产生的数据文件，写完后只读。
+
+    文件名包含进程号和随机 ID，不同工作流、不同 ComfyUI 实例之间不会重名。
+    临时段在不再被任何存储引用或解释器退出时删除自己的文件；文件从不被截断或覆盖。
+    """
+
+    def __init__(self, path, frame_count, frame_shape, storage_dtype, temporary=False):
+        self.path = path
+        self.frame_count = int(frame_count)
+        self.frame_shape = frame_shape
+        self.storage_dtype = storage_dtype
+        self._lock = threading.Lock()
+        # 内存映射放在独立的列表中，删除文件前可以先由清理函数关闭
+        self._mapping = []
+        self._finalizer = weakref.finalize(self, _remove_segment_files, path, self._mapping) if temporary else None
+
+    @classmethod
+    def write(cls, directory, images, storage_dtype, chunk_size, temporary):
+        directory = directory or _default_directory()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"frames_{os.getpid()}_{uuid.uuid4().hex}.bin")
+        chunk_size = max(1, int(chunk_size))
+        with open(path, "xb") as f:
+            for start in range(0, images.shape[0], chunk_size):
+                f.write(np.ascontiguousarray(_encode(images[start:start + chunk_size], storage_dtype)).tobytes())
+        return cls(path, images.shape[0], tuple(images.shape[1:]), storage_dtype, temporary)
+
+    def keep(self):
+        if self._finalizer is not None:
+            self._finalizer.detach()
+            self._finalizer = None
+
+    def array(self):
+        with self._lock:
+            if not self._mapping:
+                shape = (self.frame_count,) + self.frame_shape
+                self._mapping.append(np.memmap(self.path, dtype=_STORAGE_DTYPES[self.storage_dtype], mode="r", shape=shape))
+            return self._mapping[0]
+
+
+def _encode(images, storage_dtype):
+    """在图像所在设备上完成量化，只把存储格式的数据拷回 CPU。"""
+    if storage_dtype == "uint8":
+        encoded = images.mul(255.0).round_().clamp_(0, 255).to(torch.uint8)
+    else:
+        encoded = images.to(torch.float16)
+    return encoded.cpu().numpy()
+
+
+class FrameStore:
+    """
+    磁盘上的 IMAGE 帧存储：若干按 (N, H, W, C) 连续排列的原始数组文件，加一个 JSON 描述文件。
+
+    每次追加写入一个新的数据段，返回引用全部数据段的新实例；已写入的文件不再修改，
+    因此 ComfyUI 缓存的上游输出、同一上游的多个分支以及正在读取的内存映射都保持有效。
+    读取时通过 numpy.memmap 只访问所需帧，返回 float32 张量。
+    其他节点只依赖 shape、read() 两个接口，不需要导入本模块。
+    """
+
+    def __init__(self, frame_shape, storage_dtype, segments=()):
+        if storage_dtype not in _STORAGE_DTYPES:
+            raise ValueError(f"FrameStore: 不支持的存储类型 {storage_dtype}。")
+        self.frame_shape = tuple(int(size) for size in frame_shape)
+        self.storage_dtype = storage_dtype
+        self.segments = tuple(segments)
+        self.frame_count = sum(segment.frame_count for segment in self.segments)
+        self._offsets = np.cumsum([0] + [segment.frame_count for segment in self.segments])
+
+    @classmethod
+    def open(cls, path):
+        """根据最后一个数据段旁的 JSON 描述文件重新打开已有的存储。"""
+        with open(os.path.splitext(path)[0] + ".json", "r", encoding="utf-8") as f:
+            description = json.load(f)
+        frame_shape = tuple(description["frame_shape"])
+        directory = os.path.dirname(path)
+        segments = [
+            _Segment(os.path.join(directory, name), frame_count, frame_shape, description["storage_dtype"])
+            for name, frame_count in description["segments"]
+        ]
+        return cls(frame_shape, description["storage_dtype"], segments)
+
+    @property
+    def path(self):
+        return self.segments[-1].path if self.segments else None
+
+    @property
+    def shape(self):
+        return (self.frame_count,) + self.frame_shape
+
+    @property
+    def frame_bytes(self):
+        return int(np.prod(self.frame_shape)) * np.dtype(_STORAGE_DTYPES[self.storage_dtype]).itemsize
+
+    def __len__(self):
+        return self.frame_count
+
+    def _write_description(self):
+        description = {
+            "frame_shape": list(self.frame_shape),
+            "storage_dtype": self.storage_dtype,
+            "frame_count": self.frame_count,
+            "segments": [[os.path.basename(segment.path), segment.frame_count] for segment in self.segments],
+        }
+        with open(os.path.splitext(self.path)[0] + ".json", "w", encoding="utf-8") as f:
+            json.dump(description, f)
+
+    def extended(self, images, directory="", chunk_size=64, keep_file=False):
+        """
+        返回在本存储之后追加 IMAGE 批次的新存储，每次只转换 chunk_size 帧。
+
+        新的帧写入单独的数据段文件，本实例和它引用的文件都不被修改。
+        keep_file 为 True 时新存储引用的全部文件都会保留，否则在不再被引用时删除。
+        """
+        if self.segments and tuple(images.shape[1:]) != self.frame_shape:
+            raise ValueError(f"FrameStore: 帧尺寸 {tuple(images.shape[1:])} 与存储的 {self.frame_shape} 不一致。")
+        if not directory and self.segments:
+            directory = os.path.dirname(self.path)
+        segment = _Segment.write(directory, images, self.storage_dtype, chunk_size, temporary=not keep_file)
+        store = FrameStore(images.shape[1:], self.storage_dtype, self.segments + (segment,))
+        if keep_file:
+            for kept in store.segments:
+                kept.keep()
+        store._write_description()
+        return store
+
+    def read(self, selection):
+        """
+        读取指定帧并转换为 float32 张量。
+
+        selection 可以是 slice、整数列表或 int64 张量；只有被选中的帧会从磁盘读入内存。
+        """
+        if isinstance(selection, slice):
+            indices = np.arange(*selection.indices(self.frame_count), dtype=np.int64)
+        else:
+            if isinstance(selection, torch.Tensor):
+                selection = selection.cpu().numpy()
+            indices = np.asarray(selection, dtype=np.int64).reshape(-1)
+            indices = np.where(indices < 0, indices + self.frame_count, indices)
+            if indices.size and (indices.min() < 0 or indices.max() >= self.frame_count):
+                raise IndexError(f"FrameStore: 帧序号超出范围，存储共 {self.frame_count} 帧。")
+
+        frames = np.empty((indices.size,) + self.frame_shape, dtype=_STORAGE_DTYPES[self.storage_dtype])
+        owners = np.searchsorted(self._offsets, indices, side="right") - 1
+        for number in np.unique(owners):
+            picked = owners == number
+            frames[picked] = self.segments[number].array()[indices[picked] - self._offsets[number]]
+        frames = torch.from_numpy(frames)
+        if self.storage_dtype == "uint8":
+            return frames.to(torch.float32).div_(255.0)
+        return frames.to(torch.float32)
+
+
+class SpillFramesToStore:
+    """将 IMAGE 批次写入磁盘帧存储，后续节点按需读取帧范围。"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "images": ("IMAGE", {"tooltip": "需要写入磁盘的 IMAGE 批次。"}),
+                "storage_dtype": (
+                    list(_STORAGE_DTYPES),
+                    {
+                        "default": "uint8",
+                        "tooltip": "uint8 每像素 1 字节，与 8 位图像无损；float16 每像素 2 字节，保留更高精度。float32 批次分别缩小为 1/4 与 1/2。",
+                    },
+                ),
+            },
+            "optional": {
+                "store": ("CK_FRAME_STORE", {"tooltip": "可选，追加写入已有的存储，用于分块写入长视频。"}),
+                "directory": (
+                    "STRING",
+                    {
+                        "default": "",
+                        "tooltip": "本次写入的数据文件所在目录，留空时追加写入沿用上游存储的目录，新建存储使用系统临时目录下的 ck_frame_store。",
+                    },
+                ),
+                "chunk_size": (
+                    "INT",
+                    {
+                        "default": 64,
+                        "min": 1,
+                        "max": 4096,
+                        "tooltip": "每次转换并写入的帧数，决定写入时临时数组的大小。",
+                    },
+                ),
+                "keep_file": (
+                    "BOOLEAN",
+                    {
+                        "default": False,
+                        "tooltip": "关闭时，本节点写入的文件在输出不再被引用或 ComfyUI 退出时删除；开启后保留输出存储用到的全部文件，之后可按描述文件重新打开。",
+                    },
+                ),
+            },
+        }
+
+    RETURN_TYPES = ("CK_FRAME_STORE", "STRING")
+    RETURN_NAMES = ("store", "info")
+    OUTPUT_TOOLTIPS = (
+        "磁盘帧存储，可连接到读取节点或支持帧存储输入的批次节点。",
+        "存储路径、帧数、尺寸与占用空间。",
+    )
+    FUNCTION = "spill"
+    CATEGORY = "CK Nodes/Video/Batch"
+    DESCRIPTION = "将 IMAGE 批次以 uint8 或 float16 写入磁盘上的内存映射文件，后续节点只读取需要的帧，避免整段视频常驻内存。"
+
+    def spill(self, images, storage_dtype, store=None, directory="", chunk_size=64, keep_file=False):
+        if store is None:
+            store = FrameStore(images.shape[1:], storage_dtype)
+        elif store.storage_dtype != storage_dtype:
+            raise ValueError(f"FrameStore: 追加写入的存储类型为 {store.storage_dtype}，与所选的 {storage_dtype} 不一致。")
+        store = store.extended(images, directory, chunk_size, keep_file)
+
+        height, width, channels = store.frame_shape
+        info = "\n".join(
+            [
+                "CK 帧存储",
+                f"路径: {store.path}",
+                f"帧数: {len(store)}（本次写入 {images.shape[0]} 帧）",
+                f"尺寸: {width}x{height}x{channels}，{storage_dtype}",
+                f"占用空间: {len(store) * store.frame_bytes / 1024 / 1024:.1f} MB",
+            ]
+        )
+        print(info)
+        return store, info
+
+
+class LoadFramesFromStore:
+    """从磁盘帧存储中读取一段帧，作为普通 IMAGE 批次输出。"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "store": ("CK_FRAME_STORE", {"tooltip": "由写入节点创建的磁盘帧存储。"}),
+                "start_index": (
+                    "INT",
+                    {"default": 0, "min": 0, "max": _MAX_FRAMES, "tooltip": "读取的第一帧，从 0 开始。"},
+                ),
+                "frame_count": (
+                    "INT",
+                    {"default": 0, "min": 0, "max": _MAX_FRAMES, "tooltip": "读取的帧数，0 表示读取到末尾。"},
+                ),
+                "step": (
+                    "INT",
+                    {"default": 1, "min": 1, "max": _MAX_FRAMES, "tooltip": "帧间隔，1 表示连续读取。"},
+                ),
+            },
+        }
+
+    RETURN_TYPES = ("IMAGE", "STRING")
+    RETURN_NAMES = ("images", "info")
+    OUTPUT_TOOLTIPS = (
+        "读取出的 float32 IMAGE 批次。",
+        "实际读取的帧范围。",
+    )
+    FUNCTION = "load"
+    CATEGORY = "CK Nodes/Video/Batch"
+    DESCRIPTION = "按起始帧、帧数和间隔从磁盘帧存储读取一段帧，只有这段帧会载入内存。"
+
+    def load(self, store, start_index, frame_count, step):
+        total_frames = len(store)
+        start = min(int(start_index), total_frames)
+        stop = total_frames if frame_count <= 0 else min(total_frames, start + int(frame_count) * int(step))
+        selection = slice(start, stop, int(step))
+        images = store.read(selection)
+        info = f"CK 帧存储读取: 第 {start} - {max(start, stop - 1)} 帧，间隔 {step}，共 {images.shape[0]} 帧（存储共 {total_frames} 帧）"
+        print(info)
+        return images, info
+
+
+NODE_CLASS_MAPPINGS = {
+    "CKSpillFramesToStore": SpillFramesToStore,
+    "CKLoadFramesFromStore": LoadFramesFromStore,
+}
+
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "CKSpillFramesToStore": "CK Spill Frames To Store",
+    "CKLoadFramesFromStore": "CK Load Frames From Store",
+}
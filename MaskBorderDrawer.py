@@ -1,9 +1,94 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
 import numpy as np
 import torch
-from PIL import Image, ImageDraw
 import cv2
 
 
+_REGION_CACHE_SIZE = 512
+
+
+class _RegionCache:
+    """按二值遮罩指纹缓存连通区域分析结果，静态遮罩在视频批次和重复执行之间只分析一次。"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            regions = self._entries.get(key)
+            if regions is not None:
+                self._entries.move_to_end(key)
+            return regions
+
+    def put(self, key, regions):
+        with self._lock:
+            self._entries[key] = regions
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_REGION_CACHE = _RegionCache(_REGION_CACHE_SIZE)
+
+
+def _mask_regions(mask, min_area=0, max_regions=0, analysis_max_side=0):
+    """
+    用带统计信息的连通域分析提取遮罩中的区域
+    返回: ((x, y, w, h, area), ...) 元组，按从上到下、从左到右的标记顺序排列
+
+    analysis_max_side > 0 且遮罩更大时，先用 INTER_AREA 缩小再分析，
+    细小区域在缩小后仍保留非零值，边界按缩放比例向外取整，结果只会略大不会丢失区域。
+    """
+    binary = (np.asarray(mask) > 0).view(np.uint8)
+    # 指纹取自按位打包的二值遮罩，数据量只有原来的 1/8
+    fingerprint = hashlib.blake2b(np.packbits(binary).data, digest_size=16).hexdigest()
+    key = (binary.shape, fingerprint, min_area, max_regions, analysis_max_side)
+    regions = _REGION_CACHE.get(key)
+    if regions is not None:
+        return regions
+
+    height, width = binary.shape
+    scale_x = scale_y = 1.0
+    analysis = binary
+    if analysis_max_side > 0 and max(height, width) > analysis_max_side:
+        factor = analysis_max_side / float(max(height, width))
+        size = (max(1, round(width * factor)), max(1, round(height * factor)))
+        # 用浮点缩放，单个像素缩小任意倍后仍大于 0
+        analysis = (cv2.resize(binary.astype(np.float32), size, interpolation=cv2.INTER_AREA) > 0).view(np.uint8)
+        scale_x, scale_y = width / float(size[0]), height / float(size[1])
+
+    count, _, stats, _ = cv2.connectedComponentsWithStats(analysis, connectivity=8)
+    regions = []
+    for label in range(1, count):
+        x, y, w, h, area = (int(v) for v in stats[label])
+        if scale_x != 1.0 or scale_y != 1.0:
+            x1, y1 = int(np.floor(x * scale_x)), int(np.floor(y * scale_y))
+            x2, y2 = min(width, int(np.ceil((x + w) * scale_x))), min(height, int(np.ceil((y + h) * scale_y)))
+            x, y, w, h = x1, y1, x2 - x1, y2 - y1
+            area = int(round(area * scale_x * scale_y))
+        if area >= min_area:
+            regions.append((x, y, w, h, area))
+
+    if max_regions > 0 and len(regions) > max_regions:
+        # 只保留面积最大的若干个区域，保持原有顺序
+        keep = set(sorted(range(len(regions)), key=lambda i: regions[i][4], reverse=True)[:max_regions])
+        regions = [region for i, region in enumerate(regions) if i in keep]
+
+    regions = tuple(regions)
+    _REGION_CACHE.put(key, regions)
+    return regions
+
+
 class MaskBorderDrawer:
     """
     根据遮罩范围在图像上绘制线框边框描边
@@ -70,188 +155,238 @@ class MaskBorderDrawer:
                     "tooltip": "绘制模式：separate=分别为每个不连通区域绘制边框，combined=合并所有区域绘制一个整体边框"
                 }),
             },
+            "optional": {
+                "min_area": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 100000000,
+                    "step": 1,
+                    "tooltip": "忽略面积（像素数）小于该值的区域，用于过滤噪点"
+                }),
+                "max_regions": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 4096,
+                    "step": 1,
+                    "tooltip": "最多保留的区域数量（按面积从大到小），0 为不限制"
+                }),
+                "analysis_max_side": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 16384,
+                    "step": 64,
+                    "tooltip": "遮罩长边超过该值时先缩小再分析区域以加快速度，边界会略微外扩；0 为使用原始分辨率"
+                }),
+            },
         }
 
-    RETURN_TYPES = ("IMAGE",)
-    RETURN_NAMES = ("image_with_border",)
+    RETURN_TYPES = ("IMAGE", "STRING")
+    RETURN_NAMES = ("image_with_border", "bounds_json")
     FUNCTION = "draw_border"
     CATEGORY = "CK Nodes/Image/Mask"
     DESCRIPTION = "根据遮罩范围在图像上绘制线框边框描边"
 
-    def get_mask_bounds(self, mask, expand_pixels=0, mode="separate"):
+    def get_mask_bounds(self, mask, expand_pixels=0, mode="separate", min_area=0, max_regions=0, analysis_max_side=0):
         """
         获取遮罩的边界框，并支持扩展
         mode: "separate" 返回多个边界框列表，"combined" 返回合并后的单个边界框
+        min_area / max_regions / analysis_max_side 见节点输入说明
         返回: [(x1, y1, x2, y2), ...] 列表 或 None（如果没有有效区域）
         """
+        regions = self._region_bounds(mask, expand_pixels, mode, min_area, max_regions, analysis_max_side)
+        return [region[:4] for region in regions] if regions else None
+
+    def _region_bounds(self, mask, expand_pixels=0, mode="separate", min_area=0, max_regions=0, analysis_max_side=0):
+        """与 get_mask_bounds 相同，但每个边界框附带区域面积: [(x1, y1, x2, y2, area), ...]"""
         # 确保mask是numpy数组
         if torch.is_tensor(mask):
             mask = mask.cpu().numpy()
-        
+
         # 处理batch维度，取第一个
         if len(mask.shape) == 3:
             mask = mask[0]
-        
-        # 二值化mask
-        binary_mask = (mask > 0).astype(np.uint8) * 255
-        
-        # 查找轮廓
-        contours, _ = cv2.findContours(binary_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        if not contours:
-            return None
-        
-        height, width = binary_mask.shape
-        bounds_list = []
-        
+
+        regions = _mask_regions(mask, min_area, max_regions, analysis_max_side)
+        if not regions:
+            return []
+
+        height, width = mask.shape
         if mode == "combined":
-            # 合并所有轮廓，找到整体边界框
-            all_points = np.vstack(contours)
-            x, y, w, h = cv2.boundingRect(all_points)
-            
+            # 合并所有区域，找到整体边界框
+            x = min(region[0] for region in regions)
+            y = min(region[1] for region in regions)
+            w = max(region[0] + region[2] for region in regions) - x
+            h = max(region[1] + region[3] for region in regions) - y
+            regions = [(x, y, w, h, sum(region[4] for region in regions))]
+
+        bounds_list = []
+        for x, y, w, h, area in regions:
             # 应用扩展
             x1 = max(0, x - expand_pixels)
             y1 = max(0, y - expand_pixels)
             x2 = min(width, x + w + expand_pixels)
             y2 = min(height, y + h + expand_pixels)
-            
-            bounds_list.append((x1, y1, x2, y2))
-        else:
-            # 分别为每个轮廓计算边界框
-            for contour in contours:
-                x, y, w, h = cv2.boundingRect(contour)
-                
-                # 应用扩展
-                x1 = max(0, x - expand_pixels)
-                y1 = max(0, y - expand_pixels)
-                x2 = min(width, x + w + expand_pixels)
-                y2 = min(height, y + h + expand_pixels)
-                
-                # 过滤掉太小的区域
-                if x2 > x1 and y2 > y1:
-                    bounds_list.append((x1, y1, x2, y2))
-        
-        return bounds_list if bounds_list else None
-
-    def draw_border(self, image, mask, stroke_width, box_type, expand_pixels, red, green, blue, corner_radius, draw_mode):
+
+            # 过滤掉太小的区域
+            if x2 > x1 and y2 > y1:
+                bounds_list.append((x1, y1, x2, y2, area))
+        return bounds_list
+
+    def _stroke_canvas(self, bounds_list, width, height, stroke_width, box_type, corner_radius):
         """
-        在图像上绘制边框
+        把所有边界框的描边画到一张 uint8 画布上，只覆盖描边所在的子区域
+        返回: (x0, y0, canvas)，canvas 中非零像素即描边；没有可绘制的边框时返回 None
         """
-        # 转换tensor到numpy
-        if torch.is_tensor(image):
-            image_np = image.cpu().numpy()
-        else:
-            image_np = image
-        
-        # 处理batch，假设batch size为1
-        if len(image_np.shape) == 4:
-            image_np = image_np[0]
-        
-        # 转换为PIL Image (0-255范围)
-        if image_np.max() <= 1.0:
-            image_np = (image_np * 255).astype(np.uint8)
-        else:
-            image_np = image_np.astype(np.uint8)
-        
-        # 获取图像尺寸
-        height, width = image_np.shape[:2]
-        
-        # 创建PIL Image
-        pil_image = Image.fromarray(image_np)
-        draw = ImageDraw.Draw(pil_image)
-        
-        # 获取边界框列表
-        bounds_list = self.get_mask_bounds(mask, expand_pixels, draw_mode)
-        
-        if bounds_list is None:
-            # 如果没有找到遮罩区域，返回原图
-            print("[MaskBorderDrawer] Warning: No mask region found, returning original image")
-            result = np.array(pil_image).astype(np.float32) / 255.0
-            result = torch.from_numpy(result).unsqueeze(0)
-            return (result,)
-        
-        # 边框颜色
-        stroke_color = (red, green, blue)
-        
-        # 遍历所有边界框并绘制
+        boxes = []
         for bounds in bounds_list:
             x1, y1, x2, y2 = bounds
-            
+
             # 确保坐标在图像范围内
             x1 = max(0, min(x1, width - 1))
             y1 = max(0, min(y1, height - 1))
             x2 = max(0, min(x2, width - 1))
             y2 = max(0, min(y2, height - 1))
-            
+
             # 确保x1 < x2, y1 < y2
             if x1 > x2:
                 x1, x2 = x2, x1
             if y1 > y2:
                 y1, y2 = y2, y1
-            
+
             # 跳过太小的区域
             if x2 - x1 < 2 or y2 - y1 < 2:
                 continue
-            
-            # 绘制边框
+            boxes.append((x1, y1, x2, y2))
+
+        if not boxes:
+            return None
+
+        # 方框描边以边界线为中心向内外各扩展一半，画布留出外扩部分
+        outset = stroke_width // 2 if box_type == "rectangle" else 0
+        x0 = max(0, min(box[0] for box in boxes) - outset)
+        y0 = max(0, min(box[1] for box in boxes) - outset)
+        cx2 = min(width, max(box[2] for box in boxes) + outset + 1)
+        cy2 = min(height, max(box[3] for box in boxes) + outset + 1)
+        canvas = np.zeros((cy2 - y0, cx2 - x0), dtype=np.uint8)
+
+        for x1, y1, x2, y2 in boxes:
+            x1, y1, x2, y2 = x1 - x0, y1 - y0, x2 - x0, y2 - y0
             if box_type == "rectangle":
-                # 绘制方框
-                # 使用多线方式绘制指定粗细的边框
-                for i in range(stroke_width):
-                    offset = i - stroke_width // 2
-                    draw.rectangle(
-                        [x1 + offset, y1 + offset, x2 - offset, y2 - offset],
-                        outline=stroke_color
-                    )
+                # 与逐像素叠加 stroke_width 个 1px 方框的结果一致：外框减去内框
+                inset = stroke_width - 1 - outset
+                outer = (x1 - outset, y1 - outset, x2 + outset, y2 + outset)
+                inner = (x1 + inset + 1, y1 + inset + 1, x2 - inset - 1, y2 - inset - 1)
+                radius, inner_radius = 0, 0
             else:
-                # 绘制圆框（圆角矩形）
-                # 计算圆角半径，不能超过宽高的一半
-                max_radius = min((x2 - x1) // 2, (y2 - y1) // 2)
-                radius = min(corner_radius, max_radius)
-                
-                # PIL的rounded_rectangle方法需要较新版本
-                try:
-                    draw.rounded_rectangle(
-                        [x1, y1, x2, y2],
-                        radius=radius,
-                        outline=stroke_color,
-                        width=stroke_width
-                    )
-                except AttributeError:
-                    # 如果PIL版本不支持rounded_rectangle，手动绘制
-                    self._draw_rounded_rectangle(draw, x1, y1, x2, y2, radius, stroke_color, stroke_width)
-        
-        # 转换回tensor格式
-        result_np = np.array(pil_image).astype(np.float32) / 255.0
-        result_tensor = torch.from_numpy(result_np).unsqueeze(0)
-        
-        return (result_tensor,)
-
-    def _draw_rounded_rectangle(self, draw, x1, y1, x2, y2, radius, color, width):
+                # 圆框描边向内绘制，圆角半径不能超过宽高的一半
+                radius = min(corner_radius, (x2 - x1) // 2, (y2 - y1) // 2)
+                outer = (x1, y1, x2, y2)
+                inner = (x1 + stroke_width, y1 + stroke_width, x2 - stroke_width, y2 - stroke_width)
+                inner_radius = max(0, radius - stroke_width)
+
+            # 每个边框先画在自己的局部画布上再合并，避免内框挖空其他边框的描边
+            ox1, oy1 = max(0, outer[0]), max(0, outer[1])
+            ox2, oy2 = min(canvas.shape[1] - 1, outer[2]), min(canvas.shape[0] - 1, outer[3])
+            band = np.zeros((oy2 - oy1 + 1, ox2 - ox1 + 1), dtype=np.uint8)
+            _fill_rounded_rectangle(band, [v - o for v, o in zip(outer, (ox1, oy1, ox1, oy1))], radius, 255)
+            _fill_rounded_rectangle(band, [v - o for v, o in zip(inner, (ox1, oy1, ox1, oy1))], inner_radius, 0)
+            region = canvas[oy1:oy2 + 1, ox1:ox2 + 1]
+            np.maximum(region, band, out=region)
+
+        return x0, y0, canvas
+
+    def draw_border(self, image, mask, stroke_width, box_type, expand_pixels, red, green, blue, corner_radius, draw_mode, min_area=0, max_regions=0, analysis_max_side=0):
         """
-        手动绘制圆角矩形（兼容旧版本PIL）
+        在整个图像批次上绘制边框
+
+        单帧遮罩会广播到所有帧（单帧图像也可配合多帧遮罩），此时边框只计算一次，
+        一次索引赋值写入全部帧。描边直接写入浮点输出，描边以外的像素保持不变。
+        同时以 JSON 输出每帧的边界框，供下游节点使用。
         """
-        # 绘制四条直线边
-        for i in range(width):
-            offset = i - width // 2
-            # 上边
-            draw.line([(x1 + radius, y1 + offset), (x2 - radius, y1 + offset)], fill=color, width=1)
-            # 下边
-            draw.line([(x1 + radius, y2 - offset), (x2 - radius, y2 - offset)], fill=color, width=1)
-            # 左边
-            draw.line([(x1 + offset, y1 + radius), (x1 + offset, y2 - radius)], fill=color, width=1)
-            # 右边
-            draw.line([(x2 - offset, y1 + radius), (x2 - offset, y2 - radius)], fill=color, width=1)
-        
-        # 绘制四个圆角
-        # 左上角
-        draw.arc([x1, y1, x1 + radius * 2, y1 + radius * 2], 180, 270, fill=color, width=width)
-        # 右上角
-        draw.arc([x2 - radius * 2, y1, x2, y1 + radius * 2], 270, 360, fill=color, width=width)
-        # 左下角
-        draw.arc([x1, y2 - radius * 2, x1 + radius * 2, y2], 90, 180, fill=color, width=width)
-        # 右下角
-        draw.arc([x2 - radius * 2, y2 - radius * 2, x2, y2], 0, 90, fill=color, width=width)
+        if not torch.is_tensor(image):
+            image = torch.from_numpy(np.asarray(image, dtype=np.float32))
+        if image.dim() == 3:
+            image = image.unsqueeze(0)
+        if not torch.is_tensor(mask):
+            mask = torch.from_numpy(np.asarray(mask, dtype=np.float32))
+        if mask.dim() == 2:
+            mask = mask.unsqueeze(0)
+
+        image_count, mask_count = image.shape[0], mask.shape[0]
+        if image_count == 1 or mask_count == 1:
+            batch_size = max(image_count, mask_count)
+        else:
+            batch_size = min(image_count, mask_count)
+            if image_count != mask_count:
+                print(f"[MaskBorderDrawer] Warning: image batch ({image_count}) and mask batch ({mask_count}) differ, using first {batch_size} frames")
+
+        height, width = image.shape[1:3]
+        result = image[:batch_size].to(torch.float32).expand(batch_size, -1, -1, -1).clone()
+
+        # 边框颜色，按通道数截取；RGBA 图像的 alpha 取不透明
+        channels = result.shape[-1]
+        stroke_color = torch.tensor([red, green, blue, 255][:channels], dtype=torch.float32) / 255.0
+        if channels > 4:
+            stroke_color = torch.cat([stroke_color, torch.ones(channels - 4)])
+
+        mask_np = mask.detach().cpu().numpy()
+        frame_groups = [range(batch_size)] if mask_count == 1 else [range(i, i + 1) for i in range(batch_size)]
+
+        drawn = 0
+        frame_regions = []
+        strokes = {}
+        for frames in frame_groups:
+            regions = self._region_bounds(mask_np[0 if mask_count == 1 else frames[0]], expand_pixels, draw_mode, min_area, max_regions, analysis_max_side)
+            frame_regions.extend([regions] * len(frames))
+            if not regions:
+                continue
+            # 相同边界框的帧共用同一张描边画布
+            bounds_key = tuple(region[:4] for region in regions)
+            if bounds_key not in strokes:
+                strokes[bounds_key] = self._stroke_canvas(bounds_key, width, height, stroke_width, box_type, corner_radius)
+            stroke = strokes[bounds_key]
+            if stroke is None:
+                continue
+            x0, y0, canvas = stroke
+            region = result[frames.start:frames.stop, y0:y0 + canvas.shape[0], x0:x0 + canvas.shape[1]]
+            region[:, torch.from_numpy(canvas > 0)] = stroke_color
+            drawn += len(frames)
+
+        if drawn == 0:
+            # 如果没有找到遮罩区域，返回原图
+            print("[MaskBorderDrawer] Warning: No mask region found, returning original image")
+
+        bounds_json = json.dumps({
+            "width": int(width),
+            "height": int(height),
+            "frames": [
+                {
+                    "index": i,
+                    "regions": [{"x1": x1, "y1": y1, "x2": x2, "y2": y2, "area": area} for x1, y1, x2, y2, area in regions],
+                }
+                for i, regions in enumerate(frame_regions)
+            ],
+        }, ensure_ascii=False)
+
+        return (result, bounds_json)
+
+
+def _fill_rounded_rectangle(canvas, box, radius, value):
+    """
+    在 canvas 上填充圆角矩形，box 为 (x1, y1, x2, y2) 闭区间坐标，可超出画布
+    radius 为 0 时即普通矩形；box 为空时不做任何事
+    """
+    x1, y1, x2, y2 = box
+    if x2 < x1 or y2 < y1:
+        return
+    radius = max(0, min(radius, (x2 - x1) // 2, (y2 - y1) // 2))
+    if radius == 0:
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), value, -1)
+        return
+    cv2.rectangle(canvas, (x1 + radius, y1), (x2 - radius, y2), value, -1)
+    cv2.rectangle(canvas, (x1, y1 + radius), (x2, y2 - radius), value, -1)
+    for cx, cy in ((x1 + radius, y1 + radius), (x2 - radius, y1 + radius), (x1 + radius, y2 - radius), (x2 - radius, y2 - radius)):
+        cv2.circle(canvas, (cx, cy), radius, value, -1)
 
 
 NODE_CLASS_MAPPINGS = {
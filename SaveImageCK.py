@@ -1,11 +1,407 @@
 import os
+import io
+import re
 import json
+import time
+import atexit
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 import numpy as np
+import torch
 from PIL import Image
 from PIL.PngImagePlugin import PngInfo
 import folder_paths
 from comfy.cli_args import args
 
+
+def _to_uint8_batch(images):
+    """
+    整批转换为 uint8，结果与逐帧 np.clip(255. * x, 0, 255).astype(np.uint8) 相同。
+
+    GPU 张量在设备上一次完成缩放、截断和类型转换，只同步一次并传回 1/4 大小的 uint8 数据。
+    CPU 张量逐帧复用同一块 float32 临时缓冲区写入预分配的输出，不再为每帧分配三份临时数组。
+    返回的数组与输入张量不共享内存，逐帧取 batch[i] 即为零拷贝视图。
+    """
+    with torch.no_grad():
+        if images.device.type != "cpu":
+            return images.mul(255.0).clamp_(0, 255).to(torch.uint8).cpu().numpy()
+        source = images.detach().to(torch.float32).numpy()
+    pixels = np.empty(source.shape, dtype=np.uint8)
+    scratch = np.empty(source.shape[1:], dtype=np.float32)
+    for i in range(source.shape[0]):
+        np.multiply(source[i], 255.0, out=scratch)
+        np.clip(scratch, 0, 255, out=scratch)
+        pixels[i] = scratch
+    return pixels
+
+
+def _write_caption(file_path, caption, encoding):
+    try:
+        # 使用传入的 encoding 参数
+        with open(file_path, 'w', encoding=encoding) as f:
+            f.write(caption)
+    except UnicodeEncodeError:
+        print(f"[Warning] Failed to encode caption using {encoding}. Falling back to utf-8.")
+        # 如果用户选了 ascii 这种存不了中文的格式导致报错，回退到 utf-8 避免节点崩溃
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(caption)
+
+
+_FILE_FORMATS = ["PNG", "WebP (Lossless)", "WebP", "JPEG", "TIFF (Uncompressed)"]
+
+# JPEG 的 EXIF 存放在单个 APP1 段中，最大 65533 字节
+_JPEG_EXIF_LIMIT = 65533
+
+
+class _ImageEncoder:
+    """
+    一种输出格式及其编码参数。
+
+    metadata 为 (键, 文本) 列表：PNG 写入文本块；其他格式按 ComfyUI 保存 WebP 的约定写入 EXIF，
+    prompt 放在 0x0110，其余条目从 0x010F 起递减，可以被 ComfyUI 直接读回工作流。
+    """
+
+    def __init__(self, file_format, png_compress_level=4, quality=90):
+        self.file_format = file_format
+        if file_format == "PNG":
+            self.pil_format, self.extension = "PNG", ".png"
+            self.options = {"compress_level": int(png_compress_level)}
+            self.label = f"PNG level {int(png_compress_level)}"
+        elif file_format == "WebP (Lossless)":
+            # 无损模式下 quality 表示压缩力度，越低越快
+            self.pil_format, self.extension = "WEBP", ".webp"
+            self.options = {"lossless": True, "quality": int(quality), "method": 4}
+            self.label = f"WebP lossless effort {int(quality)}"
+        elif file_format == "WebP":
+            self.pil_format, self.extension = "WEBP", ".webp"
+            self.options = {"quality": int(quality), "method": 4}
+            self.label = f"WebP quality {int(quality)}"
+        elif file_format == "JPEG":
+            self.pil_format, self.extension = "JPEG", ".jpg"
+            self.options = {"quality": int(quality)}
+            self.label = f"JPEG quality {int(quality)}"
+        elif file_format == "TIFF (Uncompressed)":
+            self.pil_format, self.extension = "TIFF", ".tiff"
+            self.options = {"compression": "raw"}
+            self.label = "TIFF uncompressed"
+        else:
+            raise ValueError(f"Unsupported file format: {file_format}")
+
+    def encode(self, pixels, metadata=None):
+        image = Image.fromarray(pixels)
+        if self.pil_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        options = dict(self.options)
+        if metadata:
+            if self.pil_format == "PNG":
+                pnginfo = PngInfo()
+                for key, text in metadata:
+                    pnginfo.add_text(key, text)
+                options["pnginfo"] = pnginfo
+            else:
+                exif = Image.Exif()
+                tag = 0x010F
+                for key, text in metadata:
+                    if key == "prompt":
+                        exif[0x0110] = f"prompt:{text}"
+                    else:
+                        exif[tag] = f"{key}:{text}"
+                        tag -= 1
+                if self.pil_format == "JPEG" and len(exif.tobytes()) > _JPEG_EXIF_LIMIT:
+                    print(f"[Warning] Metadata is larger than the JPEG EXIF limit ({_JPEG_EXIF_LIMIT} bytes); saving without metadata.")
+                else:
+                    options["exif"] = exif
+        buffer = io.BytesIO()
+        image.save(buffer, format=self.pil_format, **options)
+        return buffer.getvalue()
+
+
+_METADATA_MODES = ["Sidecar JSON", "Sidecar JSONL", "Embed Per Image", "None"]
+
+
+def _write_sidecar(full_output_folder, filename, counter, metadata_mode, prompt, extra_pnginfo, entries):
+    """
+    每批只序列化一次工作流，写入共享的 workflow 文件，并写出列出所有文件的清单。
+
+    Sidecar JSON 每批一个清单；Sidecar JSONL 按文件名前缀追加到同一个清单，每行一个文件。
+    每个条目通过 workflow 字段引用共享的工作流文件。返回清单文件名。
+    """
+    base_name = f"{filename.replace('%batch_num%', 'batch')}_{counter:05}_"
+    workflow_file = f"{base_name}workflow.json"
+    workflow = {"prompt": prompt}
+    if extra_pnginfo is not None:
+        workflow.update(extra_pnginfo)
+    with open(os.path.join(full_output_folder, workflow_file), "w", encoding="utf-8") as f:
+        json.dump(workflow, f)
+
+    for entry in entries:
+        entry["workflow"] = workflow_file
+    if metadata_mode == "Sidecar JSONL":
+        manifest_file = f"{filename.replace('%batch_num%', 'batch')}_manifest.jsonl"
+        with open(os.path.join(full_output_folder, manifest_file), "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    else:
+        manifest_file = f"{base_name}manifest.json"
+        with open(os.path.join(full_output_folder, manifest_file), "w", encoding="utf-8") as f:
+            json.dump({"workflow": workflow_file, "files": entries}, f, ensure_ascii=False, indent=1)
+    return manifest_file
+
+
+class _EncodeStats:
+    """累计一批图片的编码耗时和文件大小，后台线程同样可以安全写入。"""
+
+    def __init__(self, label):
+        self.label = label
+        self._lock = threading.Lock()
+        self.files = 0
+        self.encode_seconds = 0.0
+        self.bytes = 0
+
+    def add(self, seconds, size):
+        with self._lock:
+            self.files += 1
+            self.encode_seconds += seconds
+            self.bytes += size
+
+    def summary(self, total):
+        with self._lock:
+            files, seconds, size = self.files, self.encode_seconds, self.bytes
+        if not files:
+            return f"{self.label}: 0/{total} encoded"
+        return (f"{self.label}: {files}/{total} encoded, {size / 1024 / 1024:.2f} MB "
+                f"({size / files / 1024:.1f} KB/image), encode {seconds:.3f} s ({seconds / files * 1000:.1f} ms/image)")
+
+
+def _encode_caption(caption, encoding):
+    try:
+        return caption.encode(encoding)
+    except UnicodeEncodeError:
+        print(f"[Warning] Failed to encode caption using {encoding}. Falling back to utf-8.")
+        return caption.encode("utf-8")
+
+
+_OUTPUT_MODES = ["Files", "Tar Shards"]
+
+
+class _TarShardWriter:
+    """
+    按文件名前缀滚动写入 WebDataset 风格的 tar 分片：<prefix>-000000.tar、<prefix>-000001.tar ……
+
+    同一样本的图片和 Caption 以相同的 key 连续写入同一分片，分片超过大小上限时换下一个。
+    写入在锁内进行，可被多个后台线程同时调用。分片在 close() 后补上结束块，
+    下次写入时以追加模式重新打开，因此跨提示可以继续写满同一个分片。
+    """
+
+    def __init__(self, folder, prefix):
+        self.folder = folder
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._tar = None
+        self._index = None
+        self.shard = -1
+        self.next_counter = 1
+        self.shards_written = set()
+        self._resume()
+
+    def _shard_name(self, shard):
+        return f"{self.prefix}-{shard:06}.tar"
+
+    def _resume(self):
+        """从已有分片中找到最后一个分片和已使用的最大序号，避免 key 重复。"""
+        pattern = re.compile(re.escape(self.prefix) + r"-(\d{6})\.tar$")
+        shards = sorted(int(match.group(1)) for match in map(pattern.match, os.listdir(self.folder)) if match)
+        if not shards:
+            return
+        self.shard = shards[-1]
+        with tarfile.open(os.path.join(self.folder, self._shard_name(self.shard))) as tar:
+            counters = [int(match.group(1)) for match in (re.search(r"_(\d+)_\.", name) for name in tar.getnames()) if match]
+        if counters:
+            self.next_counter = max(counters) + 1
+
+    def reserve(self, counter, count):
+        """为一批样本预留 count 个连续序号，返回第一个；同时重新记录本批写入的分片。"""
+        with self._lock:
+            start = max(counter, self.next_counter)
+            self.next_counter = start + count
+            self.shards_written = set()
+            return start
+
+    def _open(self, sample_bytes, max_bytes, write_index):
+        path = os.path.join(self.folder, self._shard_name(self.shard)) if self.shard >= 0 else None
+        if path is not None and os.path.exists(path) and os.path.getsize(path) + sample_bytes <= max_bytes:
+            self._tar = tarfile.open(path, "a")
+        else:
+            self.shard += 1
+            path = os.path.join(self.folder, self._shard_name(self.shard))
+            self._tar = tarfile.open(path, "w")
+        if write_index:
+            self._index = open(os.path.splitext(path)[0] + ".index.jsonl", "a", encoding="utf-8")
+        self.shards_written.add(self._shard_name(self.shard))
+
+    def add(self, key, members, max_bytes, write_index=False):
+        """写入一个样本。members 为 [(扩展名, bytes)]；可选索引记录每个成员数据在分片中的偏移和大小。"""
+        sample_bytes = sum(512 + -(-len(data) // 512) * 512 for _, data in members)
+        with self._lock:
+            if self._tar is not None and self._tar.offset > 0 and self._tar.offset + sample_bytes > max_bytes:
+                self._close()
+            if self._tar is None:
+                self._open(sample_bytes, max_bytes, write_index)
+            for extension, data in members:
+                info = tarfile.TarInfo(key + extension)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                info.mode = 0o644
+                self._tar.addfile(info, io.BytesIO(data))
+                if self._index is not None:
+                    data_offset = self._tar.offset - -(-len(data) // 512) * 512
+                    self._index.write(json.dumps({"key": key, "name": info.name, "offset": data_offset, "size": len(data)}) + "\n")
+
+    def _close(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+_TAR_SHARDS = {}
+_TAR_SHARDS_LOCK = threading.Lock()
+
+
+def _tar_shard_writer(folder, prefix):
+    key = (os.path.abspath(folder), prefix)
+    with _TAR_SHARDS_LOCK:
+        if key not in _TAR_SHARDS:
+            _TAR_SHARDS[key] = _TarShardWriter(folder, prefix)
+        return _TAR_SHARDS[key]
+
+
+def _close_tar_shards():
+    """为所有打开的分片写入结束块，分片文件随即可被读取。"""
+    with _TAR_SHARDS_LOCK:
+        writers = list(_TAR_SHARDS.values())
+    for writer in writers:
+        writer.close()
+
+
+def _save_frame_to_shard(shard_writer, key, pixels, encoder, metadata, stats, caption_extension, caption, encoding, max_bytes, write_index):
+    """编码一帧图片和可选的 Caption，作为同一个样本写入 tar 分片。"""
+    start = time.perf_counter()
+    data = encoder.encode(pixels, metadata)
+    stats.add(time.perf_counter() - start, len(data))
+    members = [(encoder.extension, data)]
+    if caption is not None:
+        members.append((caption_extension, _encode_caption(caption, encoding)))
+    shard_writer.add(key, members, max_bytes, write_index)
+
+
+def _save_frame(image_path, pixels, encoder, metadata, stats, caption_path=None, caption=None, encoding="utf-8"):
+    """编码并写入一帧图片，以及可选的 Caption 文本。编码耗时不含磁盘写入。"""
+    start = time.perf_counter()
+    data = encoder.encode(pixels, metadata)
+    stats.add(time.perf_counter() - start, len(data))
+    with open(image_path, "wb") as f:
+        f.write(data)
+    if caption_path is not None:
+        _write_caption(caption_path, caption, encoding)
+
+
+class _BackgroundWriter:
+    """
+    有界的后台写入线程池。
+
+    排队中的任务达到上限时提交方阻塞，避免未写入的帧无限堆积在内存中。
+    写入错误会立即打印，并保留到下一次 flush 时统一返回。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = None
+        self._slots = None
+        self._settings = None
+        self._pending = set()
+        self._errors = []
+        self._prompt = None
+
+    def _configure(self, threads, max_pending):
+        settings = (max(1, int(threads)), max(1, int(max_pending)))
+        if settings == self._settings:
+            return []
+        errors = self.flush()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        self._pool = ThreadPoolExecutor(max_workers=settings[0], thread_name_prefix="ck_save_image")
+        self._slots = threading.BoundedSemaphore(settings[1])
+        self._settings = settings
+        return errors
+
+    def begin(self, prompt, threads, max_pending):
+        """
+        开始处理一批图片。prompt 对象与上一批不同说明进入了新的提示执行，
+        先等待上一次提示的写入全部完成。返回此前累积的写入错误。
+        """
+        errors = []
+        if prompt is not None and self._prompt is not None and prompt is not self._prompt:
+            errors = self.flush()
+        self._prompt = prompt
+        return errors + self._configure(threads, max_pending)
+
+    def submit(self, description, function, *arguments):
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(function, *arguments)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(lambda done: self._finished(done, description))
+
+    def _finished(self, future, description):
+        error = future.exception()
+        with self._lock:
+            self._pending.discard(future)
+            if error is not None:
+                self._errors.append(f"{description}: {error}")
+        if error is not None:
+            print(f"[SaveImageCK] Background write failed for {description}: {error}")
+        self._slots.release()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """等待所有已提交的写入完成，返回并清空累积的错误。"""
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending)
+        # 排队的写入都已完成，结束打开的 tar 分片
+        _close_tar_shards()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        return errors
+
+    def shutdown(self):
+        errors = self.flush()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        for error in errors:
+            print(f"[SaveImageCK] Background write failed for {error}")
+
+
+_BACKGROUND_WRITER = _BackgroundWriter()
+# 进程退出前写完所有排队中的图片
+atexit.register(_BACKGROUND_WRITER.shutdown)
+
+
 class SaveImageCK:
     def __init__(self):
         self.type = "output"
@@ -28,14 +424,26 @@ class SaveImageCK:
                     ["utf-8", "gbk", "utf-16", "ascii", "shift_jis", "latin-1"], 
                     {"default": "utf-8", "tooltip": "The encoding to use for the caption file. Use 'gbk' for legacy Windows software in China."}
                 ),
+                "file_format": (_FILE_FORMATS, {"default": "PNG", "tooltip": "Image format. PNG and lossless WebP are lossless; WebP and JPEG are lossy; uncompressed TIFF is the fastest to write but the largest."}),
+                "png_compress_level": ("INT", {"default": 4, "min": 0, "max": 9, "tooltip": "PNG zlib level. 0 stores raw data (fastest, largest), 1 is a good speed preset, 9 is the smallest and slowest."}),
+                "quality": ("INT", {"default": 90, "min": 1, "max": 100, "tooltip": "JPEG / WebP quality. For lossless WebP it sets compression effort: lower is faster."}),
+                "output_mode": (_OUTPUT_MODES, {"default": "Files", "tooltip": "Files: one image (and caption) file per frame. Tar Shards: stream image/caption pairs into rolling WebDataset-style <prefix>-000000.tar shards."}),
+                "shard_max_mb": ("INT", {"default": 1024, "min": 1, "max": 65536, "tooltip": "Maximum size of one tar shard in MB. A new shard is started when the next sample would exceed it."}),
+                "shard_index": ("BOOLEAN", {"default": False, "tooltip": "Write <shard>.index.jsonl next to each tar shard with the byte offset and size of every member."}),
+                "metadata_mode": (_METADATA_MODES, {"default": "Embed Per Image", "tooltip": "Embed Per Image: store the workflow inside every image so it can be dragged back into ComfyUI. Sidecar JSON / JSONL: serialize the workflow once per batch into a shared file and write a manifest listing every image with its batch index and caption; the images themselves carry no workflow. Disabled entirely by --disable-metadata."}),
+                "async_write": ("BOOLEAN", {"default": False, "tooltip": "Encode and write files on a background thread pool, several frames at a time. By default the node still waits for the batch (see wait_for_writes)."}),
+                "writer_threads": ("INT", {"default": 4, "min": 1, "max": 64, "tooltip": "Number of background writer threads used by async_write."}),
+                "max_pending": ("INT", {"default": 32, "min": 1, "max": 4096, "tooltip": "Maximum number of frames waiting to be written. The node blocks when the queue is full."}),
+                "wait_for_writes": ("BOOLEAN", {"default": True, "tooltip": "With async_write, wait until this batch has been written before the node finishes, so errors are reported and tar shards are closed in this run. When off the node returns immediately; queued writes are only flushed when the next async save prompt starts or at exit, so until then tar shards stay unterminated and write errors only appear in the console."}),
             },
             "hidden": {
                 "prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"
             },
         }
 
-    RETURN_TYPES = ("STRING",)
-    RETURN_NAMES = ("filename",)
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("filename", "report")
+    OUTPUT_TOOLTIPS = ("The last saved file name.", "Write summary and any background write errors.")
     FUNCTION = "save_images"
 
     OUTPUT_NODE = True
@@ -43,8 +451,11 @@ class SaveImageCK:
     CATEGORY = "CK Nodes/Image/Output"
     DESCRIPTION = "Saves the input images to your ComfyUI output directory."
 
-    def save_images(self, images, output_folder, filename_prefix="ComfyUI", prompt=None, extra_pnginfo=None, caption=None, caption_file_extension=".txt", encoding="utf-8"):
+    def save_images(self, images, output_folder, filename_prefix="ComfyUI", prompt=None, extra_pnginfo=None, caption=None, caption_file_extension=".txt", encoding="utf-8", file_format="PNG", png_compress_level=None, quality=90, output_mode="Files", shard_max_mb=1024, shard_index=False, metadata_mode="Embed Per Image", async_write=False, writer_threads=4, max_pending=32, wait_for_writes=True):
         filename_prefix += self.prefix_append
+        errors = _BACKGROUND_WRITER.begin(prompt, writer_threads, max_pending) if async_write else []
+        encoder = _ImageEncoder(file_format, self.compress_level if png_compress_level is None else png_compress_level, quality)
+        stats = _EncodeStats(encoder.label)
 
         # 处理输出路径
         if os.path.isabs(output_folder):
@@ -57,49 +468,83 @@ class SaveImageCK:
             full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0])
 
         results = list()
-        
-        for (batch_number, image) in enumerate(images):
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-            metadata = None
-            
-            if not args.disable_metadata:
-                metadata = PngInfo()
-                if prompt is not None:
-                    metadata.add_text("prompt", json.dumps(prompt))
-                if extra_pnginfo is not None:
-                    for x in extra_pnginfo:
-                        metadata.add_text(x, json.dumps(extra_pnginfo[x]))
+        manifest_entries = []
+        shard_writer = None
+        if output_mode == "Tar Shards":
+            # 分片模式不在输出目录中生成逐帧文件，序号由分片写入器延续
+            shard_writer = _tar_shard_writer(full_output_folder, filename.replace("%batch_num%", "batch"))
+            counter = shard_writer.reserve(counter, len(images))
+            max_bytes = int(shard_max_mb) * 1024 * 1024
+        first_counter = counter
+        if args.disable_metadata:
+            metadata_mode = "None"
 
+        # 工作流只序列化一次，每张图片共享同一份文本
+        metadata = None
+        if metadata_mode == "Embed Per Image":
+            metadata = []
+            if prompt is not None:
+                metadata.append(("prompt", json.dumps(prompt)))
+            if extra_pnginfo is not None:
+                for x in extra_pnginfo:
+                    metadata.append((x, json.dumps(extra_pnginfo[x])))
+        
+        batch_pixels = _to_uint8_batch(images)
+        for (batch_number, pixels) in enumerate(batch_pixels):
             filename_with_batch_num = filename.replace("%batch_num%", str(batch_number))
             base_file_name = f"{filename_with_batch_num}_{counter:05}_"
-            file = f"{base_file_name}.png"
+            file = f"{base_file_name}{encoder.extension}"
             
-            img.save(os.path.join(full_output_folder, file), pnginfo=metadata, compress_level=self.compress_level)
+            # 保存 Caption 文本
+            caption_path = None
+            if caption is not None:
+                txt_file = base_file_name + caption_file_extension
+                caption_path = os.path.join(full_output_folder, txt_file)
+
+            if shard_writer is not None:
+                task = (_save_frame_to_shard, shard_writer, base_file_name, pixels, encoder, metadata, stats, caption_file_extension, caption, encoding, max_bytes, shard_index)
+            else:
+                task = (_save_frame, os.path.join(full_output_folder, file), pixels, encoder, metadata, stats, caption_path, caption, encoding)
+            if async_write:
+                # pixels 是整批 uint8 副本中的视图，后台编码不受上游张量后续修改的影响
+                _BACKGROUND_WRITER.submit(file, *task)
+            else:
+                task[0](*task[1:])
             
             results.append({
                 "filename": file,
                 "subfolder": subfolder,
                 "type": self.type
             })
-            
-            # 保存 Caption 文本
-            if caption is not None:
-                txt_file = base_file_name + caption_file_extension
-                file_path = os.path.join(full_output_folder, txt_file)
-                try:
-                    # 使用传入的 encoding 参数
-                    with open(file_path, 'w', encoding=encoding) as f:
-                        f.write(caption)
-                except UnicodeEncodeError:
-                    print(f"[Warning] Failed to encode caption using {encoding}. Falling back to utf-8.")
-                    # 如果用户选了 ascii 这种存不了中文的格式导致报错，回退到 utf-8 避免节点崩溃
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(caption)
+            manifest_entries.append({
+                "file": file,
+                "batch_index": batch_number,
+                "caption": caption,
+                "caption_file": os.path.basename(caption_path) if caption_path is not None else None,
+            })
 
             counter += 1
 
-        return (file,)
+        manifest_file = None
+        if metadata_mode in ("Sidecar JSON", "Sidecar JSONL"):
+            manifest_file = _write_sidecar(full_output_folder, filename, first_counter, metadata_mode, prompt, extra_pnginfo, manifest_entries)
+
+        if async_write and wait_for_writes:
+            errors += _BACKGROUND_WRITER.flush()
+        elif shard_writer is not None and not async_write:
+            shard_writer.close()
+        queued = async_write and not wait_for_writes
+        report = [f"{'Queued' if queued else 'Saved'} {len(results)} image(s) to {full_output_folder}", stats.summary(len(results))]
+        if shard_writer is not None:
+            report.append(f"Tar shards: {', '.join(sorted(shard_writer.shards_written)) or shard_writer.prefix + '-*.tar (pending)'}")
+        if manifest_file is not None:
+            report.append(f"Metadata manifest: {manifest_file}")
+        if async_write:
+            report.append(f"Background writer: {_BACKGROUND_WRITER.pending_count()} file(s) pending")
+        if errors:
+            report.append(f"Write errors ({len(errors)}):")
+            report.extend(errors)
+        return (file, "\n".join(report))
 
 NODE_CLASS_MAPPINGS = {
     "SaveImageCK": SaveImageCK
@@ -1,7 +1,553 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
 import torch
 import numpy as np
 import cv2
 
+
+def _resolve_worker_count(workers, batch_size):
+    """workers 为 0 时按 CPU 核数自动选择，且不超过批次帧数。"""
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return max(1, min(int(workers), batch_size))
+
+
+_CACHE_MISS = object()
+
+# 每个计算所得条目额外计入的名义开销（键、元组等），
+# 使对齐失败的 None 单应矩阵和无特征点的空结果也占用预算、能被淘汰，而不是无限累积
+_ENTRY_OVERHEAD_BYTES = 256
+
+
+class _PendingEntry:
+    """正在计算中的缓存条目；计算完成后 value 为结果，计算出错时仍为 _CACHE_MISS。"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = _CACHE_MISS
+
+
+class _AlignmentCache:
+    """
+    按图像内容指纹缓存特征点、描述子、已训练的 FLANN 索引和单应矩阵。
+
+    超出字节预算时按最近最少使用顺序淘汰；预算为 0 时不缓存。
+    get_or_compute 保证同一键同时只有一个线程在计算，其余线程等待并复用其结果。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def set_budget(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max(0, int(max_bytes))
+            self._evict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _CACHE_MISS
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        with self._lock:
+            if not self.enabled or nbytes > self.max_bytes:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous[1]
+            self._entries[key] = (value, nbytes)
+            self.total_bytes += nbytes
+            self._evict()
+
+    def get_or_compute(self, key, compute, size_of):
+        """
+        返回 key 对应的缓存值，未命中时调用 compute() 并按 size_of(value) 加条目开销存入。
+
+        多个线程同时未命中同一键时只有第一个线程计算，其余线程等待其结果；
+        计算出错时等待者重新争取计算。缓存关闭时每次都直接计算。
+        """
+        if not self.enabled:
+            return compute()
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry[0]
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = _PendingEntry()
+                    break
+            pending.done.wait()
+            if pending.value is not _CACHE_MISS:
+                return pending.value
+        try:
+            value = compute()
+            self.put(key, value, size_of(value) + _ENTRY_OVERHEAD_BYTES)
+            pending.value = value
+            return value
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def _evict(self):
+        while self._entries and self.total_bytes > self.max_bytes:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.total_bytes -= nbytes
+
+
+_ALIGNMENT_CACHE = _AlignmentCache(256 * 1024 * 1024)
+
+
+def _image_fingerprint(img):
+    """以形状、类型和像素内容的哈希作为缓存键。"""
+    digest = hashlib.blake2b(np.ascontiguousarray(img), digest_size=16).hexdigest()
+    return img.shape, img.dtype.str, digest
+
+
+class _FrameSource:
+    """
+    按帧读取 IMAGE 批次并转换为 uint8。
+
+    broadcast 为 True 时单帧批次会广播到每一帧：其 uint8 图像和内容指纹只计算一次并在整批共享。
+    否则按帧索引读取，单帧的裁剪图 A 在后续帧越界，与原先一样由逐帧错误处理退回背景。
+    """
+
+    def __init__(self, images, broadcast=False):
+        self.images = images
+        self.broadcast = broadcast and images.shape[0] == 1
+        self._lock = threading.Lock()
+        self._shared_uint8 = None
+        self._shared_fingerprint = None
+
+    def __len__(self):
+        return self.images.shape[0]
+
+    def tensor(self, i):
+        return self.images[0 if self.broadcast else i]
+
+    def uint8(self, i):
+        if not self.broadcast:
+            return (self.images[i].numpy() * 255).astype(np.uint8)
+        with self._lock:
+            if self._shared_uint8 is None:
+                self._shared_uint8 = (self.images[0].numpy() * 255).astype(np.uint8)
+                # 共享帧被多帧同时读取，禁止原地修改
+                self._shared_uint8.flags.writeable = False
+            return self._shared_uint8
+
+    def fingerprint(self, i):
+        """广播帧返回共享指纹；普通帧返回 None，由对齐阶段按需计算。"""
+        if not self.broadcast:
+            return None
+        shared = self.uint8(i)
+        with self._lock:
+            if self._shared_fingerprint is None:
+                self._shared_fingerprint = _image_fingerprint(shared)
+            return self._shared_fingerprint
+
+
+def _resolve_batch_size(sizes, broadcast):
+    """默认取最短批次；广播模式下单帧输入与其余批次逐帧配对。"""
+    if broadcast:
+        longest = max(sizes)
+        if all(size in (1, longest) for size in sizes):
+            return longest
+        print(f"[Smart Merge] 批次长度 {sizes} 无法广播（只有单帧输入可以广播），改为按最短批次处理。")
+    return min(sizes)
+
+
+def _mask_bbox(mask_bool):
+    """返回布尔遮罩非零区域的外接矩形 (x1, y1, x2, y2)，遮罩为空时返回 None。"""
+    x, y, w, h = cv2.boundingRect(mask_bool.view(np.uint8))
+    if w == 0 or h == 0:
+        return None
+    return x, y, x + w, y + h
+
+
+def _roi_margin(feather_kernel):
+    """
+    子窗口相对遮罩外接矩形的余量。
+
+    需要覆盖羽化腐蚀/模糊以及自适应差异遮罩的闭运算、膨胀和模糊半径，
+    使遮罩内像素的结果与整帧处理一致；泊松融合另需 5 像素安全边距。
+    """
+    return 2 * int(feather_kernel) + 16
+
+
+def _expand_bounds(bounds, margin, width, height):
+    """外扩矩形并裁剪到画面内，结果为空时返回 None。"""
+    x1, y1, x2, y2 = bounds
+    x1, y1 = max(0, x1 - margin), max(0, y1 - margin)
+    x2, y2 = min(width, x2 + margin), min(height, y2 + margin)
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return x1, y1, x2, y2
+
+
+def _warped_bounds(H, src_w, src_h, width, height, margin):
+    """计算 src 四角经单应变换后在目标画面中的外接矩形；透视退化时退回整帧。"""
+    corners = np.array([[0, 0, 1], [src_w, 0, 1], [src_w, src_h, 1], [0, src_h, 1]], dtype=np.float64)
+    projected = corners @ H.T
+    if not np.all(np.isfinite(projected)) or np.any(projected[:, 2] <= 1e-8):
+        return 0, 0, width, height
+    points = projected[:, :2] / projected[:, 2:]
+    # 多留 1 像素给插值的边缘
+    x1, y1 = np.floor(points.min(axis=0)).astype(np.int64) - 1
+    x2, y2 = np.ceil(points.max(axis=0)).astype(np.int64) + 2
+    if x2 <= 0 or y2 <= 0 or x1 >= width or y1 >= height:
+        return None
+    bounds = (max(0, int(x1)), max(0, int(y1)), min(width, int(x2)), min(height, int(y2)))
+    return _expand_bounds(bounds, margin, width, height)
+
+
+def _blend_uint8(fg, bg, alpha8):
+    """
+    8 位定点 alpha 混合：fg * a + bg * (255 - a)，再四舍五入除以 255。
+
+    全程使用 uint16 原地运算，最大中间值 65407 不会溢出。
+    """
+    alpha = alpha8.astype(np.uint16)[:, :, np.newaxis]
+    out = fg.astype(np.uint16)
+    out *= alpha
+    out += (255 - alpha) * bg
+    out += 128
+    out += out >> 8
+    out >>= 8
+    return out.astype(np.uint8)
+
+
+def _feather_alpha8(mask_8u, blur_size, bounds_mask_8u):
+    """对 uint8 遮罩做高斯羽化，并限制在对齐区域内，结果仍为 uint8 alpha。"""
+    blurred = cv2.GaussianBlur(mask_8u, (blur_size, blur_size), 0)
+    return cv2.multiply(blurred, bounds_mask_8u, scale=1.0 / 255.0)
+
+
+def _laplacian_blend(fg, bg, mask, bounds_mask, levels):
+    """
+    多频段拉普拉斯金字塔混合，返回 uint8 结果。
+
+    金字塔是线性的，因此只需分解 fg - bg 的差值：每层乘以对应尺度的高斯遮罩后
+    重建，再叠加回背景，结果等价于分别分解前景与背景再逐层混合。
+    差值在对齐区域外置零，每层高斯再除以同样下采样的区域遮罩（归一化卷积），
+    接缝附近的低频只由区域内的像素决定，不会被区域外拉向背景色。
+    第 k 层上采样回原图最多扩散 2^(k+1) 像素，因此每层遮罩只保留离区域边缘至少这么远的部分，
+    结果在区域外严格等于背景，无需最后截断低频，也就不会留下硬接缝。
+    """
+    bounds = bounds_mask.astype(np.float32)
+    diff = fg.astype(np.float32) - bg.astype(np.float32)
+    diff *= bounds[:, :, np.newaxis]
+    # 到对齐区域外最近像素的棋盘距离，与金字塔核的方形扩散范围一致
+    distance = cv2.distanceTransform((bounds >= 0.999).astype(np.uint8), cv2.DIST_C, 3)
+    max_distance = float(distance.max())
+
+    weighted, weights = [diff], [bounds]
+    masks = [mask * (distance >= 1)]
+    mask_pyramid = mask
+    # 第 k 层的第 i 个像素对应原图的第 step * i 个像素，step = 2^k；
+    # 最粗一层的过渡带 2 * step 不超过区域最大深度的 1/3，过渡宽度与区域大小相称
+    step = 2
+    while len(masks) <= levels and min(weights[-1].shape[:2]) > 1 and 6 * step <= max_distance:
+        weighted.append(cv2.pyrDown(weighted[-1]))
+        weights.append(cv2.pyrDown(weights[-1]))
+        mask_pyramid = cv2.pyrDown(mask_pyramid)
+        masks.append(mask_pyramid * (distance[::step, ::step] >= 2 * step))
+        step *= 2
+    gaussians = [
+        np.where(weight[:, :, np.newaxis] > 1e-3, values / np.maximum(weight, 1e-3)[:, :, np.newaxis], 0).astype(np.float32)
+        for values, weight in zip(weighted, weights)
+    ]
+
+    blended = gaussians[-1] * masks[-1][:, :, np.newaxis]
+    for k in range(len(gaussians) - 2, -1, -1):
+        size = (gaussians[k].shape[1], gaussians[k].shape[0])
+        laplacian = gaussians[k] - cv2.pyrUp(gaussians[k + 1], dstsize=size)
+        blended = cv2.pyrUp(blended, dstsize=size)
+        blended += laplacian * masks[k][:, :, np.newaxis]
+
+    blended += bg
+    return np.clip(blended, 0, 255).astype(np.uint8)
+
+
+def _pixel_cdf(pixels, channels):
+    """对 (N, channels) 的 uint8 像素逐通道求归一化 CDF，所有通道用一次 bincount 完成。"""
+    offsets = np.arange(channels) * 256
+    hist = np.bincount((pixels + offsets).ravel(), minlength=channels * 256).reshape(channels, 256)
+    cdf = hist.cumsum(axis=1)
+    return cdf / (cdf[:, -1:] + 1e-8)
+
+
+class _ColorStats:
+    """
+    单帧（ROI）颜色统计量，按需计算并缓存。
+
+    LAB 转换、遮罩内均值/标准差与直方图 CDF 各只计算一次，
+    在差异检测和各颜色匹配模式之间共享。
+    """
+
+    def __init__(self, img, mask_8u, mask_float):
+        self.img = img
+        self.mask_8u = mask_8u
+        self.mask_float = mask_float
+        self._cache = {}
+
+    def _memo(self, key, compute):
+        value = self._cache.get(key, _CACHE_MISS)
+        if value is _CACHE_MISS:
+            value = self._cache[key] = compute()
+        return value
+
+    def lab_u8(self):
+        return self._memo("lab_u8", lambda: cv2.cvtColor(self.img, cv2.COLOR_RGB2LAB))
+
+    def lab(self):
+        return self._memo("lab", lambda: self.lab_u8().astype(np.float32))
+
+    def lab_mean_std(self):
+        """遮罩内 LAB 各通道的均值与标准差，返回两个长度为 3 的一维数组（只读共享，勿原地修改）。"""
+        def compute():
+            mean, std = cv2.meanStdDev(self.lab_u8(), mask=self.mask_8u)
+            return mean.flatten(), std.flatten()
+        return self._memo("lab_mean_std", compute)
+
+    def rgb_mean(self):
+        return self._memo("rgb_mean", lambda: np.array(cv2.mean(self.img, mask=self.mask_8u)[:3], dtype=np.float32))
+
+    def cdf(self, space):
+        """遮罩（> 0.5）内的逐通道 CDF；space 为 "rgb" 或 "lab_ab"（LAB 的 a/b 通道）。遮罩为空时返回 None。"""
+        def compute():
+            bbox = _mask_bbox(self.mask_float > 0.5)
+            if bbox is None:
+                return None
+            img = self.img if space == "rgb" else self.lab_u8()[:, :, 1:]
+            x1, y1, x2, y2 = bbox
+            pixels = img[y1:y2, x1:x2][self.mask_float[y1:y2, x1:x2] > 0.5]
+            return _pixel_cdf(pixels, img.shape[-1])
+        return self._memo(("cdf", space), compute)
+
+
+class _SharedColorReference:
+    """
+    整批共用的参考颜色统计量。
+
+    参考固定取自第 0 帧（smart_merge 会在其余帧开始前单独处理第 0 帧），
+    之后各帧的颜色匹配都以它为目标，既保证视频颜色一致，也省去逐帧统计。
+    第 0 帧未走到颜色匹配（出错或遮罩落在画面外）时没有参考，各帧退回自身的统计量，
+    结果不随线程调度变化。
+    """
+
+    def __init__(self):
+        self.stats = None
+
+    def resolve(self, i, stats):
+        if i == 0:
+            self.stats = stats
+        return stats if self.stats is None else self.stats
+
+
+_COLOR_REFERENCES = ["Per Frame", "Batch (First Frame)"]
+_BLEND_BACKENDS = ["Float32", "Fixed-point uint8"]
+
+
+class _FrameProfile:
+    """
+    单帧性能记录。
+
+    采用分段计时：每次 lap(stage) 把距上一次 lap 的耗时计入该阶段，
+    各阶段之和即为该帧总耗时，不需要为计时改动代码缩进。
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.stages = {}
+        self.notes = {"result": "aligned", "alignment": {}}
+        self.counters = {}
+        self._start = self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self._last)
+        self._last = now
+
+    def note(self, key, value):
+        self.notes[key] = value
+
+    def align(self, kind, status):
+        self.notes["alignment"][kind] = status
+
+    def count(self, key):
+        self.counters[key] = self.counters.get(key, 0) + 1
+
+    def as_dict(self):
+        return {
+            "index": self.index,
+            "total_s": round(self._last - self._start, 6),
+            "stages_s": {stage: round(seconds, 6) for stage, seconds in self.stages.items()},
+            **self.notes,
+            "counters": dict(self.counters),
+        }
+
+
+class _NullProfile:
+    """未开启性能分析时使用的空记录，所有操作均为空操作。"""
+
+    def lap(self, stage):
+        pass
+
+    def note(self, key, value):
+        pass
+
+    def align(self, kind, status):
+        pass
+
+    def count(self, key):
+        pass
+
+
+_NULL_PROFILE = _NullProfile()
+_PROFILE_STATE = threading.local()
+
+
+def _current_profile():
+    """返回当前线程正在处理的帧的性能记录；未开启时返回空记录。"""
+    return getattr(_PROFILE_STATE, "profile", None) or _NULL_PROFILE
+
+
+def _profile_report(profiles, wall_time, peak_bytes, workers):
+    """汇总各帧记录为 JSON 字符串。多线程时各阶段耗时之和可能大于总墙钟时间。"""
+    frames = [profiles[i].as_dict() for i in sorted(profiles)]
+    stages, results, alignment, counters = {}, {}, {}, {}
+    for frame in frames:
+        for stage, seconds in frame["stages_s"].items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+        results[frame["result"]] = results.get(frame["result"], 0) + 1
+        for kind, status in frame["alignment"].items():
+            alignment.setdefault(kind, {})
+            alignment[kind][status] = alignment[kind].get(status, 0) + 1
+        for key, value in frame["counters"].items():
+            counters[key] = counters.get(key, 0) + value
+    aggregate = {
+        "frames": len(frames),
+        "workers": workers,
+        "wall_time_s": round(wall_time, 6),
+        "frame_time_s": round(sum(frame["total_s"] for frame in frames), 6),
+        "stages_s": {stage: round(seconds, 6) for stage, seconds in stages.items()},
+        "results": results,
+        "alignment": alignment,
+        "counters": counters,
+        "peak_traced_bytes": peak_bytes,
+    }
+    return json.dumps({"aggregate": aggregate, "frames": frames}, ensure_ascii=False, indent=2)
+
+
+_TRACKING_MAX_SIDE = 256
+
+_AlignmentOptions = namedtuple("_AlignmentOptions", ["detector", "level", "refine_native"])
+_DEFAULT_ALIGNMENT = _AlignmentOptions("SIFT", 0, False)
+_DETECTION_LEVELS = {"Native": 0, "1/2": 1, "1/4": 2, "1/8": 3}
+_MISSING_DETECTORS_WARNED = set()
+
+
+def _create_detector(detector):
+    if detector == "ORB":
+        return cv2.ORB_create(nfeatures=5000)
+    if detector == "AKAZE":
+        if hasattr(cv2, "AKAZE_create"):
+            return cv2.AKAZE_create()
+        if "AKAZE" not in _MISSING_DETECTORS_WARNED:
+            _MISSING_DETECTORS_WARNED.add("AKAZE")
+            print("[Smart Merge] 当前 OpenCV 未提供 AKAZE，改用 ORB。")
+        return cv2.ORB_create(nfeatures=5000)
+    return cv2.SIFT_create()
+
+
+def _translation(dx, dy):
+    return np.array([[1, 0, dx], [0, 1, dy], [0, 0, 1]], dtype=np.float64)
+
+
+def _refine_homography_ecc(query_img, train_img, H, max_side=_TRACKING_MAX_SIDE, iterations=50):
+    """
+    以 H 为初值，用 ECC 在 train 中预测位置附近的局部窗口上细化 query→train 的单应矩阵。
+
+    两幅图按同一比例缩小到 query 长边不超过 max_side 后求解。返回 (H, 相关系数)，
+    窗口为空或 ECC 不收敛时返回 (None, 0.0)。
+    """
+    h_q, w_q = query_img.shape[:2]
+    h_t, w_t = train_img.shape[:2]
+    window = _warped_bounds(H, w_q, h_q, w_t, h_t, max(8, max(h_q, w_q) // 4))
+    if window is None:
+        return None, 0.0
+    x1, y1, x2, y2 = window
+    scale = min(1.0, max_side / float(max(h_q, w_q)))
+
+    gray_query = cv2.cvtColor(query_img, cv2.COLOR_RGB2GRAY)
+    gray_train = cv2.cvtColor(train_img[y1:y2, x1:x2], cv2.COLOR_RGB2GRAY)
+    if scale < 1.0:
+        gray_query = cv2.resize(gray_query, (max(1, round(w_q * scale)), max(1, round(h_q * scale))), interpolation=cv2.INTER_AREA)
+        gray_train = cv2.resize(gray_train, (max(1, round((x2 - x1) * scale)), max(1, round((y2 - y1) * scale))), interpolation=cv2.INTER_AREA)
+
+    S = np.diag([scale, scale, 1.0])
+    S_inv = np.diag([1.0 / scale, 1.0 / scale, 1.0])
+    warp = S @ _translation(-x1, -y1) @ H @ S_inv
+    warp = (warp / warp[2, 2]).astype(np.float32)
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, iterations, 1e-4)
+    try:
+        rho, warp = cv2.findTransformECC(gray_query, gray_train, warp, cv2.MOTION_HOMOGRAPHY, criteria, None, 5)
+    except cv2.error:
+        return None, 0.0
+    refined = _translation(x1, y1) @ S_inv @ warp.astype(np.float64) @ S
+    return refined / refined[2, 2], float(rho)
+
+
+class _HomographyTracker:
+    """
+    关键帧片段内的单应矩阵跟踪状态。
+
+    片段首帧做完整 SIFT 求解；之后每帧以上一帧结果为初值做 ECC 细化，
+    相关系数低于阈值时退回完整求解。
+    """
+
+    def __init__(self, min_correlation):
+        self.min_correlation = min_correlation
+        self._previous = {}
+
+    def track(self, kind, query_img, train_img):
+        H_prev = self._previous.get(kind)
+        if H_prev is None:
+            return None
+        H, rho = _refine_homography_ecc(query_img, train_img, H_prev)
+        if H is None or rho < self.min_correlation:
+            return None
+        return H
+
+    def update(self, kind, H):
+        self._previous[kind] = H
+
+
 class SmartMergeImages:
     @classmethod
     def INPUT_TYPES(cls):
@@ -19,6 +565,7 @@ class SmartMergeImages:
                 "color_match": (
                     [
                         "SeamlessClone (PS Auto Blend)", 
+                        "Laplacian Pyramid Blend",
                         "Adaptive Local (strong)", 
                         "Histogram", 
                         "LAB_Mean", 
@@ -54,54 +601,207 @@ class SmartMergeImages:
             },
             "optional": {
                 "original_crop_A": ("IMAGE",),  
+                "workers": ("INT", {
+                    "default": 1,
+                    "min": 0,
+                    "max": 64,
+                    "step": 1,
+                    "tooltip": "并行处理帧的线程数。1 为逐帧串行，0 为按 CPU 核数自动选择。",
+                }),
+                "temporal_mode": (["Per Frame", "Keyframe Tracking"], {
+                    "default": "Per Frame",
+                    "tooltip": "视频批次的对齐方式。关键帧跟踪只在关键帧做完整 SIFT，其余帧沿用上一帧结果并用 ECC 细化。",
+                }),
+                "keyframe_interval": ("INT", {
+                    "default": 12,
+                    "min": 1,
+                    "max": 1000,
+                    "step": 1,
+                    "tooltip": "关键帧跟踪模式下每隔多少帧重新做一次完整 SIFT 对齐。",
+                }),
+                "tracking_threshold": ("FLOAT", {
+                    "default": 0.9,
+                    "min": 0.0,
+                    "max": 1.0,
+                    "step": 0.01,
+                    "tooltip": "ECC 跟踪的最低相关系数，低于该值时当前帧退回完整 SIFT 对齐。",
+                }),
+                "feature_detector": (["SIFT", "ORB", "AKAZE"], {
+                    "default": "SIFT",
+                    "tooltip": "特征检测算法。SIFT 最准确；ORB 最快；AKAZE 介于两者之间。ORB/AKAZE 使用汉明距离匹配。",
+                }),
+                "detection_resolution": (["Native", "1/2", "1/4", "1/8"], {
+                    "default": "Native",
+                    "tooltip": "在缩小的金字塔层上检测特征点以加快对齐，单应矩阵会换算回原始分辨率。",
+                }),
+                "refine_native": ("BOOLEAN", {
+                    "default": True,
+                    "tooltip": "缩小分辨率检测后，在原始分辨率下只对预测位置附近的窗口重新匹配以提高精度。",
+                }),
+                "batch_mode": (["Shortest Batch", "Broadcast Single Frame"], {
+                    "default": "Shortest Batch",
+                    "tooltip": "批次长度不一致时的处理方式。广播模式下单帧原图或裁剪图 A 会与每一帧裁剪图 B 配对，且只做一次转换和特征提取。最短批次模式下不广播：裁剪图 A 的帧数少于批次时，超出的帧会因索引越界出错，输出未合成的原图。",
+                }),
+                "alignment_cache_mb": ("INT", {
+                    "default": 256,
+                    "min": 0,
+                    "max": 16384,
+                    "step": 16,
+                    "tooltip": "特征点与单应矩阵缓存的内存上限（MB）。相同图像重复执行时跳过对齐，0 为关闭缓存。",
+                }),
+                "pyramid_levels": ("INT", {
+                    "default": 5,
+                    "min": 1,
+                    "max": 10,
+                    "step": 1,
+                    "tooltip": "拉普拉斯金字塔混合的层数。层数越多，低频颜色过渡越宽、越柔和；实际层数受对齐区域大小限制，过渡带不超过区域深度的 1/3。",
+                }),
+                "color_reference": (_COLOR_REFERENCES, {
+                    "default": "Per Frame",
+                    "tooltip": "颜色匹配的参考统计量来源。Per Frame 逐帧统计背景；Batch (First Frame) 只统计第一帧背景并用于整批，视频颜色更一致且更快；第一帧未能合成时各帧退回逐帧统计。差异检测仍使用每帧自身的背景。",
+                }),
+                "profiling": ("BOOLEAN", {
+                    "default": False,
+                    "tooltip": "输出每帧及汇总的分阶段耗时、对齐结果和峰值数组内存（JSON）。关闭时 Profile 输出为空字符串。",
+                }),
+                "blend_backend": (_BLEND_BACKENDS, {
+                    "default": "Float32",
+                    "tooltip": "羽化混合的计算方式。Float32 为原始浮点实现；Fixed-point uint8 全程使用 8 位 alpha 定点运算，速度更快，与浮点结果只有取整误差（每次混合最多 1 级灰度）。",
+                }),
             }
         }
 
-    RETURN_TYPES = ("IMAGE",)
-    RETURN_NAMES = ("Merged_Image",)
+    RETURN_TYPES = ("IMAGE", "STRING")
+    RETURN_NAMES = ("Merged_Image", "Profile")
     FUNCTION = "smart_merge"
     CATEGORY = "CK Nodes/Image/Composition"
 
-    def exact_histogram_match(self, src, ref, mask):
+    def exact_histogram_match(self, src, ref, mask, ref_cdf=None):
+        """
+        在遮罩范围内把 src 的直方图匹配到 ref，所有通道一次完成。
+
+        只读取遮罩外接矩形内的像素，查找表由 CDF 比较矩阵直接得到，
+        结果与逐通道逐级查找的实现一致。ref_cdf 为预先算好的参考 CDF，
+        提供时不再读取 ref。
+        """
         matched = np.copy(src)
         mask_bool = mask > 0.5
-        for c in range(src.shape[-1]):
-            src_channel = src[:, :, c]
-            ref_channel = ref[:, :, c]
-            src_pixels = src_channel[mask_bool]
-            ref_pixels = ref_channel[mask_bool]
-            if len(src_pixels) == 0 or len(ref_pixels) == 0:
-                continue
-            src_hist, _ = np.histogram(src_pixels, 256, [0, 256])
-            ref_hist, _ = np.histogram(ref_pixels, 256, [0, 256])
-            src_cdf = src_hist.cumsum()
-            ref_cdf = ref_hist.cumsum()
-            src_cdf = src_cdf / (src_cdf[-1] + 1e-8)
-            ref_cdf = ref_cdf / (ref_cdf[-1] + 1e-8)
-            lookup_table = np.zeros(256)
-            j = 0
-            for i in range(256):
-                while j < 256 and ref_cdf[j] < src_cdf[i]:
-                    j += 1
-                lookup_table[i] = j
-            src_matched = cv2.LUT(src_channel, lookup_table.astype(np.uint8))
-            matched[:, :, c] = np.where(mask_bool, src_matched, src_channel)
+        bbox = _mask_bbox(mask_bool)
+        if bbox is None:
+            return matched
+
+        x1, y1, x2, y2 = bbox
+        roi_mask = mask_bool[y1:y2, x1:x2]
+        src_pixels = src[y1:y2, x1:x2][roi_mask]
+
+        channels = src.shape[-1]
+        src_cdf = _pixel_cdf(src_pixels, channels)
+        if ref_cdf is None:
+            ref_cdf = _pixel_cdf(ref[y1:y2, x1:x2][roi_mask], channels)
+
+        # lookup[c, i] = 第一个满足 ref_cdf[c, j] >= src_cdf[c, i] 的 j
+        lookup_table = (ref_cdf[:, np.newaxis, :] < src_cdf[:, :, np.newaxis]).sum(axis=2)
+        lookup_table = np.minimum(lookup_table, 255).astype(src.dtype)
+
+        matched[y1:y2, x1:x2][roi_mask] = lookup_table[np.arange(channels), src_pixels]
         return matched
 
-    def perform_sift_alignment(self, query_img, train_img):
-        gray_query = cv2.cvtColor(query_img, cv2.COLOR_RGB2GRAY)
-        gray_train = cv2.cvtColor(train_img, cv2.COLOR_RGB2GRAY)
+    def _detect_features(self, img, detector="SIFT", level=0):
+        """在第 level 层金字塔上检测特征点，坐标换算回原始分辨率。"""
+        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        levels_done = 0
+        while levels_done < level and min(gray.shape[:2]) >= 128:
+            gray = cv2.pyrDown(gray)
+            levels_done += 1
         clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        
-        sift = cv2.SIFT_create()
-        kp_q, des_q = sift.detectAndCompute(clahe.apply(gray_query), None)
-        kp_t, des_t = sift.detectAndCompute(clahe.apply(gray_train), None)
+        keypoints, descriptors = _create_detector(detector).detectAndCompute(clahe.apply(gray), None)
+        points = np.float32([kp.pt for kp in keypoints]).reshape(-1, 2) * np.float32(2 ** levels_done)
+        return points, descriptors
+
+    def _features(self, img, key, detector="SIFT", level=0, cache=_ALIGNMENT_CACHE):
+        if key is None:
+            return self._detect_features(img, detector, level)
+        return cache.get_or_compute(
+            ("features", key, detector, level),
+            lambda: self._detect_features(img, detector, level),
+            lambda features: features[0].nbytes + (features[1].nbytes if features[1] is not None else 0),
+        )
+
+    def _train_matcher(self, des_t, key, detector="SIFT", level=0, cache=_ALIGNMENT_CACHE):
+        """返回 (已训练的匹配器, 锁)；同一背景的索引在多次执行间复用。"""
+        def train():
+            if detector == "SIFT":
+                index = cv2.FlannBasedMatcher(dict(algorithm=1, trees=5), dict(checks=50))
+            else:
+                # ORB / AKAZE 为二进制描述子，使用汉明距离暴力匹配
+                index = cv2.BFMatcher(cv2.NORM_HAMMING)
+            index.add([des_t])
+            index.train()
+            return index, threading.Lock()
+
+        if key is None:
+            return train()
+        # 索引大小大致与描述子同量级
+        return cache.get_or_compute(("matcher", key, detector, level), train, lambda matcher: des_t.nbytes * 2)
+
+    def perform_sift_alignment(self, query_img, train_img, options=_DEFAULT_ALIGNMENT, query_key=None, train_key=None, cache=None):
+        """
+        求 query→train 的单应矩阵。
+
+        query_key / train_key 为预先算好的图像指纹（例如广播的单帧背景），
+        未提供且缓存启用时现场计算。cache 默认为模块级缓存。
+        """
+        cache = _ALIGNMENT_CACHE if cache is None else cache
+        if cache.enabled:
+            query_key = query_key or _image_fingerprint(query_img)
+            train_key = train_key or _image_fingerprint(train_img)
+            homography_key = ("homography", query_key, train_key, options)
+            cached = cache.get(homography_key)
+            _current_profile().lap("fingerprint")
+            if cached is not _CACHE_MISS:
+                _current_profile().count("homography_cache_hits")
+                return None if cached is None else cached.copy()
+        else:
+            query_key = train_key = None
+
+        def solve():
+            H = self._solve_homography(query_img, train_img, query_key, train_key, options.detector, options.level, cache)
+            if H is not None and options.level > 0 and options.refine_native:
+                H = self._refine_native(query_img, train_img, H, query_key, options.detector, cache)
+            return H
+
+        if query_key is None:
+            H = solve()
+        else:
+            H = cache.get_or_compute(homography_key, solve, lambda H: 0 if H is None else H.nbytes)
+        return None if H is None else H.copy()
+
+    def _refine_native(self, query_img, train_img, H, query_key=None, detector="SIFT", cache=_ALIGNMENT_CACHE):
+        """在原始分辨率下只对预测位置附近的背景窗口重新检测匹配，求得更精确的单应矩阵。"""
+        h_q, w_q = query_img.shape[:2]
+        h_t, w_t = train_img.shape[:2]
+        window = _warped_bounds(H, w_q, h_q, w_t, h_t, max(16, max(h_q, w_q) // 8))
+        if window is None:
+            return H
+        x1, y1, x2, y2 = window
+        train_window = np.ascontiguousarray(train_img[y1:y2, x1:x2])
+        H_local = self._solve_homography(query_img, train_window, query_key, None, detector, 0, cache)
+        if H_local is None:
+            return H
+        return _translation(x1, y1) @ H_local
+
+    def _solve_homography(self, query_img, train_img, query_key=None, train_key=None, detector="SIFT", level=0, cache=_ALIGNMENT_CACHE):
+        profile = _current_profile()
+        pts_q, des_q = self._features(query_img, query_key, detector, level, cache)
+        pts_t, des_t = self._features(train_img, train_key, detector, level, cache)
+        profile.lap("detect")
 
         if des_q is None or des_t is None or len(des_q) < 4 or len(des_t) < 4:
             return None
 
-        flann = cv2.FlannBasedMatcher(dict(algorithm=1, trees=5), dict(checks=50))
-        matches = flann.knnMatch(des_q, des_t, k=2)
+        index, index_lock = self._train_matcher(des_t, train_key, detector, level, cache)
+        with index_lock:
+            matches = index.knnMatch(des_q, k=2)
 
         good_matches = []
         for match_pair in matches:
@@ -109,247 +809,396 @@ class SmartMergeImages:
                 m, n = match_pair
                 if m.distance < 0.75 * n.distance:
                     good_matches.append(m)
+        profile.lap("match")
 
         if len(good_matches) >= 10:
-            src_pts = np.float32([kp_q[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-            dst_pts = np.float32([kp_t[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
+            src_pts = pts_q[[m.queryIdx for m in good_matches]].reshape(-1, 1, 2)
+            dst_pts = pts_t[[m.trainIdx for m in good_matches]].reshape(-1, 1, 2)
             H, _ = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
+            profile.lap("homography")
             return H
         return None
 
-    def smart_merge(self, original_image, edited_crop_B, alignment_mode, color_match, feather_kernel, adapt_thresh, adapt_align, adapt_local_match, original_crop_A=None):
-        batch_size = min(original_image.shape[0], edited_crop_B.shape[0])
-        result_images = []
+    def _align(self, query_img, train_img, tracker=None, kind="B", options=_DEFAULT_ALIGNMENT, query_key=None, train_key=None, cache=None):
+        profile = _current_profile()
+        H = None
+        if tracker is not None:
+            H = tracker.track(kind, query_img, train_img)
+            profile.lap("track")
+        status = "tracked"
+        if H is None:
+            H = self.perform_sift_alignment(query_img, train_img, options, query_key, train_key, cache)
+            status = "aligned" if H is not None else "failed"
+        profile.align(kind, status)
+        if tracker is not None:
+            tracker.update(kind, H)
+        return H
+
+    def _merge_frame(self, i, bg_source, fg_source, alignment_mode, color_match, feather_kernel, adapt_thresh, adapt_align, adapt_local_match, bridge_source=None, tracker=None, align_options=_DEFAULT_ALIGNMENT, align_cache=None, blend_backend="Float32", pyramid_levels=5, color_reference=None):
+        profile = _current_profile()
+        frame_bg = bg_source.uint8(i)
+        img_fg = fg_source.uint8(i)
+        profile.lap("uint8")
+
+        h_bg, w_bg = frame_bg.shape[:2]
+        h_fg, w_fg = img_fg.shape[:2]
+
+        if h_bg == 0 or w_bg == 0 or h_fg == 0 or w_fg == 0:
+            profile.note("result", "empty")
+            return bg_source.tensor(i)
+
+        H_FG_to_BG = None
+        bg_key = bg_source.fingerprint(i)
+
+        if alignment_mode in ["Force Bridge(Ref A & B)", "Auto"] and bridge_source is not None:
+            img_bridge_A = bridge_source.uint8(i)
+            profile.lap("uint8")
+            h_A, w_A = img_bridge_A.shape[:2]
+            if h_A > 0 and w_A > 0:
+                H_A_to_BG = self._align(img_bridge_A, frame_bg, tracker, "A", align_options, bridge_source.fingerprint(i), bg_key, align_cache)
+                if H_A_to_BG is not None:
+                    scale_x = w_A / float(w_fg)
+                    scale_y = h_A / float(h_fg)
+                    H_FG_to_A = np.array([[scale_x, 0, 0], [0, scale_y, 0], [0, 0, 1]], dtype=np.float64)
+                    H_FG_to_BG = np.dot(H_A_to_BG, H_FG_to_A)
+
+        if H_FG_to_BG is None:
+            H_FG_to_BG = self._align(img_fg, frame_bg, tracker, "B", align_options, fg_source.fingerprint(i), bg_key, align_cache)
+
+        # 后续颜色匹配、羽化与混合只在遮罩外接矩形加羽化余量的子窗口内进行
+        margin = _roi_margin(feather_kernel)
+        base_mask = np.ones((h_fg, w_fg), dtype=np.float32)
+        if H_FG_to_BG is not None:
+            roi = _warped_bounds(H_FG_to_BG, w_fg, h_fg, w_bg, h_bg, margin)
+        else:
+            profile.note("result", "fallback")
+            y_off = max(0, (h_bg - h_fg) // 2)
+            x_off = max(0, (w_bg - w_fg) // 2)
+            paste_x2, paste_y2 = min(x_off + w_fg, w_bg), min(y_off + h_fg, h_bg)
+            roi = _expand_bounds((x_off, y_off, paste_x2, paste_y2), margin, w_bg, h_bg)
+
+        if roi is None:
+            profile.note("result", "off_frame")
+            return bg_source.tensor(i)
+
+        roi_x1, roi_y1, roi_x2, roi_y2 = roi
+        roi_w, roi_h = roi_x2 - roi_x1, roi_y2 - roi_y1
+        img_bg = frame_bg[roi_y1:roi_y2, roi_x1:roi_x2]
+
+        if H_FG_to_BG is not None:
+            H_ROI = np.array([[1, 0, -roi_x1], [0, 1, -roi_y1], [0, 0, 1]], dtype=np.float64) @ H_FG_to_BG
+            warped_fg = cv2.warpPerspective(img_fg, H_ROI, (roi_w, roi_h), flags=cv2.INTER_LANCZOS4, borderMode=cv2.BORDER_REFLECT101)
+            warped_mask = cv2.warpPerspective(base_mask, H_ROI, (roi_w, roi_h), flags=cv2.INTER_LINEAR)
+        else:
+            warped_fg = np.zeros_like(img_bg)
+            warped_mask = np.zeros((roi_h, roi_w), dtype=np.float32)
+            y1, x1 = y_off - roi_y1, x_off - roi_x1
+            crop_h, crop_w = paste_y2 - y_off, paste_x2 - x_off
+            warped_fg[y1:y1 + crop_h, x1:x1 + crop_w] = img_fg[:crop_h, :crop_w]
+            warped_mask[y1:y1 + crop_h, x1:x1 + crop_w] = base_mask[:crop_h, :crop_w]
+
+        img_result = img_bg.copy()
+        fixed_point = blend_backend == "Fixed-point uint8"
+        profile.lap("warp")
+
+        bounds_mask_float = warped_mask.copy()
+        bounds_mask_8u = (bounds_mask_float * 255).astype(np.uint8)
+
+        # 背景与前景的颜色统计量按需计算、各模式共享；参考统计量可来自整批共用的第一帧
+        bg_stats = _ColorStats(img_bg, bounds_mask_8u, bounds_mask_float)
+        fg_stats = _ColorStats(warped_fg, bounds_mask_8u, bounds_mask_float)
+        ref_stats = color_reference.resolve(i, bg_stats) if color_reference is not None else bg_stats
 
-        for i in range(batch_size):
+        if color_match == "Histogram":
+            warped_fg = self.exact_histogram_match(warped_fg, img_bg, bounds_mask_float, ref_cdf=ref_stats.cdf("rgb"))
+
+        elif color_match == "LAB_Mean":
+            mean_bg, std_bg = ref_stats.lab_mean_std()
+            mean_fg, std_fg = fg_stats.lab_mean_std()
+            std_fg = np.where(std_fg == 0, 1.0, std_fg)
+            lab_fg = (fg_stats.lab() - mean_fg) * (std_bg / std_fg) + mean_bg
+            lab_fg = np.clip(lab_fg, 0, 255).astype(np.uint8)
+            matched_fg = cv2.cvtColor(lab_fg, cv2.COLOR_LAB2RGB)
+            if fixed_point:
+                warped_fg = _blend_uint8(matched_fg, warped_fg, bounds_mask_8u)
+            else:
+                mask_3d = bounds_mask_float[:, :, np.newaxis]
+                warped_fg = (matched_fg * mask_3d + warped_fg * (1 - mask_3d)).astype(np.uint8)
+
+        elif color_match == "Adaptive Local (strong)":
+
+            fg_float = warped_fg.astype(np.float32)
+            bg_float = img_bg.astype(np.float32)
+
+            if adapt_align > 0.0:
+                # 预对齐只用于差异检测，目标是当前帧自身的背景
+                mean_bg = bg_stats.rgb_mean()
+                mean_fg = fg_stats.rgb_mean()
+
+                aligned_mean = (1.0 - adapt_align) * mean_fg + adapt_align * mean_bg
+                diff_offset = aligned_mean - mean_fg
+
+                aligned_fg = np.clip(fg_float + diff_offset, 0, 255).astype(np.uint8)
+                aligned_stats = _ColorStats(aligned_fg, bounds_mask_8u, bounds_mask_float)
+            else:
+                aligned_fg = warped_fg
+                aligned_stats = fg_stats
+
+            lab_bg = bg_stats.lab()
+            lab_fg = aligned_stats.lab()
+            diff_lab = np.sqrt(np.sum((lab_bg - lab_fg) ** 2, axis=2))
+
+            diff_rgb = np.max(np.abs(bg_float - aligned_fg.astype(np.float32)), axis=2)
+
+            diff_combined = np.maximum(diff_lab, diff_rgb)
+
+            diff_blur = cv2.GaussianBlur(diff_combined, (5, 5), 0)
+
+            threshold_value = float(adapt_thresh)
+
+            _, thresh = cv2.threshold(diff_blur, threshold_value, 255.0, cv2.THRESH_BINARY)
+            thresh_8u = thresh.astype(np.uint8)
+
+            k_size = int(feather_kernel) | 1 
+            kernel_close = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k_size, k_size))
+            closed_mask = cv2.morphologyEx(thresh_8u, cv2.MORPH_CLOSE, kernel_close)
+
+            dilate_size = max(3, (k_size // 2) | 1)
+            kernel_dilate = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (dilate_size, dilate_size))
+            dilated_mask = cv2.dilate(closed_mask, kernel_dilate, iterations=1)
+
+            blur_size = max(3, (k_size // 2) | 1) * 2 - 1
+            if fixed_point:
+                diff_alpha8 = _feather_alpha8(dilated_mask, blur_size, bounds_mask_8u)
+            else:
+                final_diff_mask = cv2.GaussianBlur(dilated_mask.astype(np.float32) / 255.0, (blur_size, blur_size), 0)
+                diff_mask_3d = final_diff_mask[:, :, np.newaxis] * bounds_mask_float[:, :, np.newaxis]
+
+            # ==================== 色彩匹配部分 adapt_local_match） ====================
+            matched_fg = warped_fg.copy() 
+
+            match_mode = adapt_local_match
+
+            if match_mode == "LAB_Mean":
+                mean_bg_lab = ref_stats.lab_mean_std()[0]
+                mean_fg_lab = fg_stats.lab_mean_std()[0]
+
+                lab_matched = fg_stats.lab() - mean_fg_lab + mean_bg_lab
+                lab_matched = np.clip(lab_matched, 0, 255).astype(np.uint8)
+                matched_fg = cv2.cvtColor(lab_matched, cv2.COLOR_LAB2RGB)
+
+            elif match_mode == "Histogram":
+                matched_fg = self.exact_histogram_match(warped_fg, img_bg, bounds_mask_float, ref_cdf=ref_stats.cdf("rgb"))
+
+            elif match_mode == "Reinhard":
+                lab_fg = fg_stats.lab()
+                mean_bg, std_bg = ref_stats.lab_mean_std()
+                mean_fg, std_fg = fg_stats.lab_mean_std()
+
+                std_fg = np.maximum(std_fg, 1.0)
+                std_bg = np.maximum(std_bg, 1.0)
+
+                if np.mean(std_fg) < 8.0:
+                    lab_matched = lab_fg - mean_fg + mean_bg
+                else:
+                    lab_matched = (lab_fg - mean_fg) * (std_bg / std_fg) + mean_bg
+
+                lab_matched = np.clip(lab_matched, 0, 255).astype(np.uint8)
+                matched_fg = cv2.cvtColor(lab_matched, cv2.COLOR_LAB2RGB)
+
+            elif match_mode == "Adaptive Histogram":
+                lab_bg = bg_stats.lab_u8()
+                lab_fg = fg_stats.lab_u8()
+
+                lab_matched = lab_fg.copy()
+                lab_matched[:, :, 1:] = self.exact_histogram_match(lab_fg[:, :, 1:], lab_bg[:, :, 1:], bounds_mask_float, ref_cdf=ref_stats.cdf("lab_ab"))
+
+                matched_fg = cv2.cvtColor(lab_matched, cv2.COLOR_LAB2RGB)
+
+            if fixed_point:
+                warped_fg = _blend_uint8(matched_fg, img_bg, diff_alpha8)
+            else:
+                matched_fg_float = matched_fg.astype(np.float32)
+
+                adaptive_fg = (matched_fg_float * diff_mask_3d) + (bg_float * (1.0 - diff_mask_3d))
+                warped_fg = np.clip(adaptive_fg, 0, 255).astype(np.uint8)
+            # ===========================================================================
+
+        profile.lap("color_match")
+
+        if color_match == "SeamlessClone (PS Auto Blend)":
+            shrink_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+            clone_mask_8u = cv2.erode(bounds_mask_8u, shrink_kernel, iterations=1)
+            x, y, w, h = cv2.boundingRect(clone_mask_8u)
+            safe_pad = 5
+            # 边界判断仍以整帧坐标为准
+            frame_x, frame_y = x + roi_x1, y + roi_y1
+            if w > 10 and h > 10 and frame_x > safe_pad and frame_y > safe_pad and (frame_x + w) < (w_bg - safe_pad) and (frame_y + h) < (h_bg - safe_pad):
+                x1, y1 = x - safe_pad, y - safe_pad
+                x2, y2 = x + w + safe_pad, y + h + safe_pad
+                src_crop = warped_fg[y1:y2, x1:x2]
+                dst_crop = img_bg[y1:y2, x1:x2]
+                mask_crop = clone_mask_8u[y1:y2, x1:x2]
+                center = ((x2 - x1) // 2, (y2 - y1) // 2)
+                try:
+                    cloned_crop = cv2.seamlessClone(src_crop, dst_crop, mask_crop, center, cv2.NORMAL_CLONE)
+                    img_result[y1:y2, x1:x2] = cloned_crop
+                except Exception as e:
+                    print(f"[Smart Merge] 泊松融合失败: {e}")
+                    color_match = "Alpha Soft Blend" 
+            else:
+                color_match = "Alpha Soft Blend"
+            profile.lap("seamless_clone")
+
+        if color_match == "Laplacian Pyramid Blend":
+            # 在收缩后的遮罩上做多频段混合：高频接缝窄，低频颜色在更宽的范围内过渡
+            if feather_kernel > 0:
+                erode_size = max(3, feather_kernel)
+                kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (erode_size, erode_size))
+                pyramid_mask = cv2.erode(bounds_mask_8u, kernel, iterations=1).astype(np.float32) / 255.0
+            else:
+                pyramid_mask = bounds_mask_float
+            profile.lap("feather")
+            img_result = _laplacian_blend(warped_fg, img_bg, pyramid_mask, bounds_mask_float, pyramid_levels)
+
+        elif color_match != "SeamlessClone (PS Auto Blend)" and fixed_point:
+            if feather_kernel > 0:
+                erode_size = max(3, feather_kernel)
+                kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (erode_size, erode_size))
+                eroded_mask_8u = cv2.erode(bounds_mask_8u, kernel, iterations=1)
+                alpha8 = _feather_alpha8(eroded_mask_8u, (feather_kernel * 2) | 1, bounds_mask_8u)
+            else:
+                alpha8 = bounds_mask_8u
+            profile.lap("feather")
+            img_result = _blend_uint8(warped_fg, img_bg, alpha8)
+
+        elif color_match != "SeamlessClone (PS Auto Blend)":
+            if feather_kernel > 0:
+                erode_size = max(3, feather_kernel)
+                kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (erode_size, erode_size))
+                eroded_mask_8u = cv2.erode(bounds_mask_8u, kernel, iterations=1)
+                blur_size = (feather_kernel * 2) | 1
+                soft_mask = cv2.GaussianBlur(eroded_mask_8u.astype(np.float32) / 255.0, (blur_size, blur_size), 0)
+                soft_mask = soft_mask * bounds_mask_float
+            else:
+                soft_mask = bounds_mask_float
+
+            soft_mask_3d = soft_mask[:, :, np.newaxis]
+            profile.lap("feather")
+            fg_float = warped_fg.astype(np.float32)
+            bg_float = img_bg.astype(np.float32)
+
+            blended = (fg_float * soft_mask_3d) + (bg_float * (1.0 - soft_mask_3d))
+            img_result = np.clip(blended, 0, 255).astype(np.uint8)
+
+        profile.lap("blend")
+
+        # 只转换 ROI 内的像素，ROI 之外直接沿用输入帧
+        out_tensor = bg_source.tensor(i).clone()
+        out_tensor[roi_y1:roi_y2, roi_x1:roi_x2] = torch.from_numpy(img_result).to(torch.float32).div_(255.0)
+        profile.lap("output")
+        return out_tensor
+
+    def _merge_frame_safe(self, i, bg_source, *args, **kwargs):
+        try:
+            return self._merge_frame(i, bg_source, *args, **kwargs)
+        except Exception as e:
+            import traceback
+            print(f"[Smart Merge 致命错误] 第 {i} 帧: {e}")
+            _current_profile().note("result", "error")
+            _current_profile().note("error", f"{type(e).__name__}: {e}")
+            traceback.print_exc()
+            return bg_source.tensor(i)
+
+    def _merge_segment(self, frame_indices, frame_args, frame_kwargs, tracking_threshold=None, profiles=None):
+        """
+        按顺序处理一个片段；启用跟踪时片段内各帧共享同一个跟踪状态。
+
+        profiles 不为 None 时为每帧创建性能记录，并通过线程局部变量交给各阶段计时。
+        """
+        tracker = _HomographyTracker(tracking_threshold) if tracking_threshold is not None else None
+        if profiles is None:
+            return [self._merge_frame_safe(i, *frame_args, tracker=tracker, **frame_kwargs) for i in frame_indices]
+        results = []
+        for i in frame_indices:
+            profile = profiles[i] = _PROFILE_STATE.profile = _FrameProfile(i)
             try:
-                img_bg = (original_image[i].numpy() * 255).astype(np.uint8)  
-                img_fg = (edited_crop_B[i].numpy() * 255).astype(np.uint8)   
-                
-                h_bg, w_bg = img_bg.shape[:2]
-                h_fg, w_fg = img_fg.shape[:2]
-                
-                if h_bg == 0 or w_bg == 0 or h_fg == 0 or w_fg == 0:
-                    result_images.append(original_image[i])
-                    continue
-
-                img_result = img_bg.copy()
-                warped_fg = np.zeros_like(img_bg)
-                warped_mask = np.zeros((h_bg, w_bg), dtype=np.float32)
-
-                success_align = False
-                base_mask = np.ones((h_fg, w_fg), dtype=np.float32)
-
-                if alignment_mode in ["Force Bridge(Ref A & B)", "Auto"] and original_crop_A is not None:
-                    img_bridge_A = (original_crop_A[i].numpy() * 255).astype(np.uint8)
-                    h_A, w_A = img_bridge_A.shape[:2]
-                    if h_A > 0 and w_A > 0:
-                        H_A_to_BG = self.perform_sift_alignment(img_bridge_A, img_bg)
-                        if H_A_to_BG is not None:
-                            scale_x = w_A / float(w_fg)
-                            scale_y = h_A / float(h_fg)
-                            H_FG_to_A = np.array([[scale_x, 0, 0], [0, scale_y, 0], [0, 0, 1]], dtype=np.float64)
-                            H_Total = np.dot(H_A_to_BG, H_FG_to_A)
-                            warped_fg = cv2.warpPerspective(img_fg, H_Total, (w_bg, h_bg), flags=cv2.INTER_LANCZOS4, borderMode=cv2.BORDER_REFLECT101)
-                            warped_mask = cv2.warpPerspective(base_mask, H_Total, (w_bg, h_bg), flags=cv2.INTER_LINEAR)
-                            success_align = True
-
-                if not success_align:
-                    H_FG_to_BG = self.perform_sift_alignment(img_fg, img_bg)
-                    if H_FG_to_BG is not None:
-                        warped_fg = cv2.warpPerspective(img_fg, H_FG_to_BG, (w_bg, h_bg), flags=cv2.INTER_LANCZOS4, borderMode=cv2.BORDER_REFLECT101)
-                        warped_mask = cv2.warpPerspective(base_mask, H_FG_to_BG, (w_bg, h_bg), flags=cv2.INTER_LINEAR)
-                        success_align = True
-
-                if not success_align:
-                    y_off = max(0, (h_bg - h_fg) // 2)
-                    x_off = max(0, (w_bg - w_fg) // 2)
-                    y1, y2 = y_off, min(y_off + h_fg, h_bg)
-                    x1, x2 = x_off, min(x_off + w_fg, w_bg)
-                    crop_h, crop_w = y2 - y1, x2 - x1
-                    if crop_h > 0 and crop_w > 0:
-                        warped_fg[y1:y2, x1:x2] = img_fg[:crop_h, :crop_w]
-                        warped_mask[y1:y2, x1:x2] = base_mask[:crop_h, :crop_w]
-
-                bounds_mask_float = warped_mask.copy()
-                bounds_mask_8u = (bounds_mask_float * 255).astype(np.uint8)
-
-                if color_match == "Histogram":
-                    warped_fg = self.exact_histogram_match(warped_fg, img_bg, bounds_mask_float)
-                    
-                elif color_match == "LAB_Mean":
-                    lab_bg = cv2.cvtColor(img_bg, cv2.COLOR_RGB2LAB).astype(np.float32)
-                    lab_fg = cv2.cvtColor(warped_fg, cv2.COLOR_RGB2LAB).astype(np.float32)
-                    mean_bg, std_bg = cv2.meanStdDev(lab_bg, mask=bounds_mask_8u)
-                    mean_fg, std_fg = cv2.meanStdDev(lab_fg, mask=bounds_mask_8u)
-                    std_fg[std_fg == 0] = 1.0
-                    lab_fg = (lab_fg - mean_fg.flatten()) * (std_bg.flatten() / std_fg.flatten()) + mean_bg.flatten()
-                    lab_fg = np.clip(lab_fg, 0, 255).astype(np.uint8)
-                    matched_fg = cv2.cvtColor(lab_fg, cv2.COLOR_LAB2RGB)
-                    mask_3d = bounds_mask_float[:, :, np.newaxis]
-                    warped_fg = (matched_fg * mask_3d + warped_fg * (1 - mask_3d)).astype(np.uint8)
-                    
-                elif color_match == "Adaptive Local (strong)":
-
-                    fg_float = warped_fg.astype(np.float32)
-                    bg_float = img_bg.astype(np.float32)
-                    bounds_mask_8u = (bounds_mask_float * 255).astype(np.uint8)
-                    
-                    if adapt_align > 0.0:
-                        mean_bg = np.array(cv2.mean(img_bg, mask=bounds_mask_8u)[:3], dtype=np.float32)
-                        mean_fg = np.array(cv2.mean(warped_fg, mask=bounds_mask_8u)[:3], dtype=np.float32)
-                        
-                        aligned_mean = (1.0 - adapt_align) * mean_fg + adapt_align * mean_bg
-                        diff_offset = aligned_mean - mean_fg
-                        
-                        aligned_fg = np.clip(fg_float + diff_offset, 0, 255).astype(np.uint8)
-                    else:
-                        aligned_fg = warped_fg.copy()
-                    
-                    lab_bg = cv2.cvtColor(img_bg, cv2.COLOR_RGB2LAB).astype(np.float32)
-                    lab_fg = cv2.cvtColor(aligned_fg, cv2.COLOR_RGB2LAB).astype(np.float32)
-                    diff_lab = np.sqrt(np.sum((lab_bg - lab_fg) ** 2, axis=2))
-                    
-                    diff_rgb = np.max(np.abs(bg_float - aligned_fg.astype(np.float32)), axis=2)
-                    
-                    diff_combined = np.maximum(diff_lab, diff_rgb)
-                    
-                    diff_blur = cv2.GaussianBlur(diff_combined, (5, 5), 0)
-                    
-                    threshold_value = float(adapt_thresh)
-                    
-                    _, thresh = cv2.threshold(diff_blur, threshold_value, 255.0, cv2.THRESH_BINARY)
-                    thresh_8u = thresh.astype(np.uint8)
-                    
-                    k_size = int(feather_kernel) | 1 
-                    kernel_close = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k_size, k_size))
-                    closed_mask = cv2.morphologyEx(thresh_8u, cv2.MORPH_CLOSE, kernel_close)
-                    
-                    dilate_size = max(3, (k_size // 2) | 1)
-                    kernel_dilate = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (dilate_size, dilate_size))
-                    dilated_mask = cv2.dilate(closed_mask, kernel_dilate, iterations=1)
-                    
-                    blur_size = max(3, (k_size // 2) | 1) * 2 - 1
-                    final_diff_mask = cv2.GaussianBlur(dilated_mask.astype(np.float32) / 255.0, (blur_size, blur_size), 0)
-                    diff_mask_3d = final_diff_mask[:, :, np.newaxis] * bounds_mask_float[:, :, np.newaxis]
-                    
-                    # ==================== 色彩匹配部分 adapt_local_match） ====================
-                    matched_fg = warped_fg.copy() 
-
-                    match_mode = adapt_local_match
-
-                    if match_mode == "LAB_Mean":
-                        lab_bg = cv2.cvtColor(img_bg, cv2.COLOR_RGB2LAB).astype(np.float32)
-                        lab_fg = cv2.cvtColor(warped_fg, cv2.COLOR_RGB2LAB).astype(np.float32)
-                        
-                        mean_bg_lab = cv2.mean(lab_bg, mask=bounds_mask_8u)[:3]
-                        mean_fg_lab = cv2.mean(lab_fg, mask=bounds_mask_8u)[:3]
-                        
-                        lab_matched = lab_fg - np.array(mean_fg_lab) + np.array(mean_bg_lab)
-                        lab_matched = np.clip(lab_matched, 0, 255).astype(np.uint8)
-                        matched_fg = cv2.cvtColor(lab_matched, cv2.COLOR_LAB2RGB)
-
-                    elif match_mode == "Histogram":
-                        matched_fg = self.exact_histogram_match(warped_fg, img_bg, bounds_mask_float)
-
-                    elif match_mode == "Reinhard":
-                        lab_bg = cv2.cvtColor(img_bg, cv2.COLOR_RGB2LAB).astype(np.float32)
-                        lab_fg = cv2.cvtColor(warped_fg, cv2.COLOR_RGB2LAB).astype(np.float32)
-                        
-                        mean_bg, std_bg = cv2.meanStdDev(lab_bg, mask=bounds_mask_8u)
-                        mean_fg, std_fg = cv2.meanStdDev(lab_fg, mask=bounds_mask_8u)
-                        
-                        mean_bg = mean_bg.flatten()
-                        std_bg = std_bg.flatten()
-                        mean_fg = mean_fg.flatten()
-                        std_fg = std_fg.flatten()
-                        
-                        std_fg = np.maximum(std_fg, 1.0)
-                        std_bg = np.maximum(std_bg, 1.0)
-                        
-                        if np.mean(std_fg) < 8.0:
-                            lab_matched = lab_fg - mean_fg + mean_bg
-                        else:
-                            lab_matched = (lab_fg - mean_fg) * (std_bg / std_fg) + mean_bg
-                        
-                        lab_matched = np.clip(lab_matched, 0, 255).astype(np.uint8)
-                        matched_fg = cv2.cvtColor(lab_matched, cv2.COLOR_LAB2RGB)
-
-                    elif match_mode == "Adaptive Histogram":
-                        lab_bg = cv2.cvtColor(img_bg, cv2.COLOR_RGB2LAB).astype(np.float32)
-                        lab_fg = cv2.cvtColor(warped_fg, cv2.COLOR_RGB2LAB).astype(np.float32)
-                        
-                        lab_matched = lab_fg.copy()  
-                        
-                        for c in [1, 2]:
-                            fg_ch = lab_fg[:, :, c].astype(np.uint8)
-                            bg_ch = lab_bg[:, :, c].astype(np.uint8)
-                            
-                            temp = self.exact_histogram_match(
-                                np.expand_dims(fg_ch, axis=2),
-                                np.expand_dims(bg_ch, axis=2),
-                                bounds_mask_float
-                            )
-                            lab_matched[:, :, c] = temp[:, :, 0]
-                        
-                        matched_fg = cv2.cvtColor(lab_matched.astype(np.uint8), cv2.COLOR_LAB2RGB)
-
-                    matched_fg_float = matched_fg.astype(np.float32)
-
-                    adaptive_fg = (matched_fg_float * diff_mask_3d) + (bg_float * (1.0 - diff_mask_3d))
-                    warped_fg = np.clip(adaptive_fg, 0, 255).astype(np.uint8)
-                    # ===========================================================================
-                    
-                if color_match == "SeamlessClone (PS Auto Blend)":
-                    shrink_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-                    clone_mask_8u = cv2.erode(bounds_mask_8u, shrink_kernel, iterations=1)
-                    x, y, w, h = cv2.boundingRect(clone_mask_8u)
-                    safe_pad = 5
-                    if w > 10 and h > 10 and x > safe_pad and y > safe_pad and (x + w) < (w_bg - safe_pad) and (y + h) < (h_bg - safe_pad):
-                        x1, y1 = x - safe_pad, y - safe_pad
-                        x2, y2 = x + w + safe_pad, y + h + safe_pad
-                        src_crop = warped_fg[y1:y2, x1:x2]
-                        dst_crop = img_bg[y1:y2, x1:x2]
-                        mask_crop = clone_mask_8u[y1:y2, x1:x2]
-                        center = ((x2 - x1) // 2, (y2 - y1) // 2)
-                        try:
-                            cloned_crop = cv2.seamlessClone(src_crop, dst_crop, mask_crop, center, cv2.NORMAL_CLONE)
-                            img_result[y1:y2, x1:x2] = cloned_crop
-                        except Exception as e:
-                            print(f"[Smart Merge] 泊松融合失败: {e}")
-                            color_match = "Alpha Soft Blend" 
-                    else:
-                        color_match = "Alpha Soft Blend"
-
-                if color_match != "SeamlessClone (PS Auto Blend)":
-                    if feather_kernel > 0:
-                        erode_size = max(3, feather_kernel)
-                        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (erode_size, erode_size))
-                        eroded_mask_8u = cv2.erode(bounds_mask_8u, kernel, iterations=1)
-                        blur_size = (feather_kernel * 2) | 1
-                        soft_mask = cv2.GaussianBlur(eroded_mask_8u.astype(np.float32) / 255.0, (blur_size, blur_size), 0)
-                        soft_mask = soft_mask * bounds_mask_float
-                    else:
-                        soft_mask = bounds_mask_float
-                        
-                    soft_mask_3d = soft_mask[:, :, np.newaxis]
-                    fg_float = warped_fg.astype(np.float32)
-                    bg_float = img_bg.astype(np.float32)
-                    
-                    blended = (fg_float * soft_mask_3d) + (bg_float * (1.0 - soft_mask_3d))
-                    img_result = np.clip(blended, 0, 255).astype(np.uint8)
-
-                out_tensor = torch.from_numpy(img_result.astype(np.float32) / 255.0)
-                result_images.append(out_tensor)
-
-            except Exception as e:
-                import traceback
-                print(f"[Smart Merge 致命错误] {e}")
-                traceback.print_exc()
-                result_images.append(original_image[i])
-
-        return (torch.stack(result_images),)
-
+                results.append(self._merge_frame_safe(i, *frame_args, tracker=tracker, **frame_kwargs))
+            finally:
+                profile.lap("other")
+                _PROFILE_STATE.profile = None
+        return results
+
+    def smart_merge(self, original_image, edited_crop_B, alignment_mode, color_match, feather_kernel, adapt_thresh, adapt_align, adapt_local_match, original_crop_A=None, workers=1, temporal_mode="Per Frame", keyframe_interval=12, tracking_threshold=0.9, feature_detector="SIFT", detection_resolution="Native", refine_native=True, batch_mode="Shortest Batch", alignment_cache_mb=256, blend_backend="Float32", pyramid_levels=5, color_reference="Per Frame", profiling=False):
+        _ALIGNMENT_CACHE.set_budget(alignment_cache_mb * 1024 * 1024)
+        broadcast = batch_mode == "Broadcast Single Frame"
+        bg_source = _FrameSource(original_image, broadcast)
+        fg_source = _FrameSource(edited_crop_B, broadcast)
+        bridge_source = _FrameSource(original_crop_A, broadcast) if original_crop_A is not None else None
+
+        sizes = [len(bg_source), len(fg_source)]
+        if broadcast and bridge_source is not None:
+            sizes.append(len(bridge_source))
+        batch_size = _resolve_batch_size(sizes, broadcast)
+
+        align_cache = _ALIGNMENT_CACHE
+        if broadcast and not _ALIGNMENT_CACHE.enabled:
+            # 全局缓存关闭时，仍在本次执行内共享广播帧的特征点和匹配索引
+            align_cache = _AlignmentCache(1024 * 1024 * 1024)
+
+        frame_args = (bg_source, fg_source, alignment_mode, color_match, feather_kernel, adapt_thresh, adapt_align, adapt_local_match, bridge_source)
+        frame_kwargs = {
+            "align_options": _AlignmentOptions(feature_detector, _DETECTION_LEVELS.get(detection_resolution, 0), bool(refine_native)),
+            "align_cache": align_cache,
+            "blend_backend": blend_backend,
+            "pyramid_levels": max(1, int(pyramid_levels)),
+            "color_reference": _SharedColorReference() if color_reference == "Batch (First Frame)" else None,
+        }
+
+        if temporal_mode == "Keyframe Tracking":
+            # 每个关键帧片段内部必须串行，片段之间互不依赖，可以并行
+            interval = max(1, int(keyframe_interval))
+            segments = [range(start, min(start + interval, batch_size)) for start in range(0, batch_size, interval)]
+        else:
+            tracking_threshold = None
+            segments = [range(i, i + 1) for i in range(batch_size)]
+
+        worker_count = _resolve_worker_count(workers, len(segments))
+        profiles = {} if profiling else None
+        if profiling:
+            # tracemalloc 可以统计 numpy 与 OpenCV 输出数组的分配；若外部已在追踪则只重置峰值
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            wall_start = time.perf_counter()
+
+        def run_segment(segment):
+            return self._merge_segment(segment, frame_args, frame_kwargs, tracking_threshold, profiles)
+
+        try:
+            segment_results = []
+            if frame_kwargs["color_reference"] is not None and segments:
+                # 整批参考统计量取自第 0 帧：先单独处理首个片段，结果与线程调度无关
+                segment_results.append(run_segment(segments[0]))
+                segments = segments[1:]
+            if worker_count <= 1:
+                segment_results.extend(run_segment(segment) for segment in segments)
+            else:
+                # OpenCV 的大部分运算会释放 GIL，线程池即可让多帧并行；map 保证输出顺序与输入一致。
+                with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="ck_smart_merge") as pool:
+                    segment_results.extend(pool.map(run_segment, segments))
+        finally:
+            if profiling:
+                wall_time = time.perf_counter() - wall_start
+                peak_bytes = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+
+        report = _profile_report(profiles, wall_time, peak_bytes, worker_count) if profiling else ""
+        result_images = [image for segment_images in segment_results for image in segment_images]
+        return (torch.stack(result_images), report)
+
 
 NODE_CLASS_MAPPINGS = {
     "CKSmartMergeImages": SmartMergeImages,
@@ -0,0 +1,95 @@
+"""
+FrameRateMatch 索引计算基准测试。
+
+对比逐帧 Fraction 参考实现与闭式整数张量实现在不同帧数、帧率组合下的耗时，
+并校验两者结果一致，结果写成 JSON。
+
+用法：
+    python benchmarks/frame_rate_benchmark.py --output bench_frame_rate.json
+    python benchmarks/frame_rate_benchmark.py --frames 100000 1000000 --skip-reference-above 200000
+"""
+
+import argparse
+import importlib.util
+import json
+import sys
+import time
+from fractions import Fraction
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+RATES = [(29.97, 23.976), (23.976, 29.97), (60.0, 30.0), (59.94, 24.0), (25.0, 50.0)]
+
+
+def load_module():
+    spec = importlib.util.spec_from_file_location("ck_frame_rate_benchmark", ROOT / "FrameRateMatch.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def reference_indices(module, frame_count, input_fps, output_fps):
+    """原先逐帧构造 Fraction 的实现。"""
+    input_rate = module._fps_fraction(input_fps)
+    output_rate = module._fps_fraction(output_fps)
+    output_count = max(1, module._round_half_up(frame_count * output_rate / input_rate))
+    return [
+        min(module._round_half_up(Fraction(j) * input_rate / output_rate), frame_count - 1)
+        for j in range(output_count)
+    ]
+
+
+def best_of(repeat, function):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(args):
+    module = load_module()
+    results = []
+    for frame_count in args.frames:
+        for input_fps, output_fps in RATES:
+            tensor_s, indices = best_of(args.repeat, lambda: module.calculate_frame_index_tensor(frame_count, input_fps, output_fps))
+            list_s, _ = best_of(args.repeat, lambda: module.calculate_frame_indices(frame_count, input_fps, output_fps))
+            entry = {
+                "frames": frame_count,
+                "input_fps": input_fps,
+                "output_fps": output_fps,
+                "output_frames": len(indices),
+                "tensor_s": round(tensor_s, 6),
+                "list_s": round(list_s, 6),
+            }
+            if frame_count <= args.skip_reference_above:
+                reference_s, expected = best_of(1, lambda: reference_indices(module, frame_count, input_fps, output_fps))
+                entry["reference_s"] = round(reference_s, 6)
+                entry["speedup"] = round(reference_s / tensor_s, 1) if tensor_s > 0 else None
+                entry["identical"] = indices.tolist() == expected
+            results.append(entry)
+            print(f"{frame_count} 帧 {input_fps}->{output_fps}: 张量 {tensor_s * 1000:.2f} ms，列表 {list_s * 1000:.2f} ms"
+                  + (f"，参考 {entry['reference_s'] * 1000:.1f} ms，一致: {entry['identical']}" if "reference_s" in entry else ""),
+                  flush=True)
+    return {"benchmark": "frame_rate_indices", "runs": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FrameRateMatch 索引计算基准测试")
+    parser.add_argument("--frames", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5, help="闭式实现重复次数，取最快一次")
+    parser.add_argument("--skip-reference-above", type=int, default=1_000_000, help="帧数超过该值时不运行参考实现")
+    parser.add_argument("--output", default="bench_frame_rate.json")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"结果已写入 {args.output}")
+    return 0 if all(entry.get("identical", True) for entry in report["runs"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""
+SmartMergeImages CPU 基准测试。
+
+生成 1K/2K/4K 的合成背景与已知单应矩阵下的编辑裁剪图，逐一运行
+alignment_mode × color_match（× adapt_local_match）组合，记录帧率、
+各阶段耗时（来自节点的 Profile 输出）、峰值数组内存和对齐误差，结果写成 JSON，
+便于在不同提交之间比较。
+
+用法：
+    python benchmarks/smart_merge_benchmark.py --output bench_smart_merge.json
+    python benchmarks/smart_merge_benchmark.py --resolutions 1K --frames 2 --color-match "Alpha Soft Blend"
+    python benchmarks/smart_merge_benchmark.py --compare old.json new.json
+"""
+
+import argparse
+import importlib.util
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+
+
+ROOT = Path(__file__).resolve().parents[1]
+RESOLUTIONS = {"1K": (1024, 576), "2K": (2048, 1152), "4K": (3840, 2160)}
+
+
+def load_module():
+    spec = importlib.util.spec_from_file_location("ck_smart_merge_benchmark", ROOT / "Smart_merge_images.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_plate(width, height, seed):
+    """多尺度噪声叠加的纹理背景，各尺度都有足够的特征点。"""
+    rng = np.random.default_rng(seed)
+    plate = np.zeros((height, width, 3), dtype=np.float32)
+    for cell, weight in ((64, 0.45), (16, 0.3), (4, 0.25)):
+        noise = rng.random((max(2, height // cell), max(2, width // cell), 3)).astype(np.float32)
+        plate += cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC) * weight
+    return np.clip(plate, 0.0, 1.0)
+
+
+def known_homography(width, height, crop_w, crop_h, frame):
+    """裁剪图坐标 → 背景坐标的已知单应矩阵：轻微旋转缩放并随帧平移。"""
+    angle = np.deg2rad(2.0 + 0.5 * frame)
+    scale = 1.0 + 0.01 * frame
+    cx, cy = width * 0.4 + 6 * frame, height * 0.35 + 4 * frame
+    cos, sin = np.cos(angle) * scale, np.sin(angle) * scale
+    return np.array([
+        [cos, -sin, cx - (cos * crop_w / 2 - sin * crop_h / 2)],
+        [sin, cos, cy - (sin * crop_w / 2 + cos * crop_h / 2)],
+        [0.0, 0.0, 1.0],
+    ])
+
+
+def make_case(resolution, frames, seed=0):
+    """返回 (背景批次, 编辑裁剪图 B, 原始裁剪图 A, 各帧真实单应矩阵)。"""
+    width, height = RESOLUTIONS[resolution]
+    crop_w, crop_h = width // 4, height // 4
+    plate = make_plate(width, height, seed)
+    backgrounds, crops_b, crops_a, homographies = [], [], [], []
+    for frame in range(frames):
+        shift = np.roll(plate, frame * 3, axis=1)
+        H = known_homography(width, height, crop_w, crop_h, frame)
+        crop = cv2.warpPerspective(shift, np.linalg.inv(H), (crop_w, crop_h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT101)
+        backgrounds.append(shift)
+        # 编辑图：整体调色，中间加一块明显改动
+        edited = np.clip(crop * 0.9 + 0.06, 0.0, 1.0)
+        edited[crop_h // 3:crop_h * 2 // 3, crop_w // 3:crop_w * 2 // 3] *= np.float32([1.0, 0.6, 0.6])
+        crops_b.append(edited)
+        crops_a.append(cv2.resize(crop, (crop_w * 3 // 4, crop_h * 3 // 4), interpolation=cv2.INTER_AREA))
+        homographies.append(H)
+    as_tensor = lambda images: torch.from_numpy(np.stack(images)).contiguous()
+    return as_tensor(backgrounds), as_tensor(crops_b), as_tensor(crops_a), homographies
+
+
+def corner_error(H_est, H_true, crop_w, crop_h):
+    """用裁剪图四角投影位置的平均误差（像素）衡量对齐精度。"""
+    if H_est is None:
+        return None
+    corners = np.float32([[0, 0], [crop_w, 0], [crop_w, crop_h], [0, crop_h]]).reshape(-1, 1, 2)
+    projected = cv2.perspectiveTransform(corners, H_est)
+    expected = cv2.perspectiveTransform(corners, H_true)
+    return float(np.linalg.norm(projected - expected, axis=2).mean())
+
+
+def combinations(module, args):
+    inputs = module.SmartMergeImages.INPUT_TYPES()["required"]
+    alignment_modes = args.alignment_mode or inputs["alignment_mode"][0]
+    color_matches = args.color_match or inputs["color_match"][0]
+    local_matches = args.adapt_local_match or inputs["adapt_local_match"][0]
+    for alignment_mode, color_match in itertools.product(alignment_modes, color_matches):
+        # adapt_local_match 只在自适应模式下生效，其余模式只跑一次
+        for local_match in (local_matches if color_match == "Adaptive Local (strong)" else [local_matches[0]]):
+            yield alignment_mode, color_match, local_match
+
+
+def measure_alignment(module, background, crop_b, homographies):
+    """单独测一次 B→背景 的对齐误差，结果不受颜色模式影响。"""
+    node = module.SmartMergeImages()
+    errors = []
+    for i, H_true in enumerate(homographies):
+        query = (crop_b[i].numpy() * 255).astype(np.uint8)
+        train = (background[i].numpy() * 255).astype(np.uint8)
+        H_est = node.perform_sift_alignment(query, train)
+        errors.append(corner_error(H_est, H_true, query.shape[1], query.shape[0]))
+    return errors
+
+
+def run_case(module, case, alignment_mode, color_match, local_match, args):
+    background, crop_b, crop_a, _ = case
+    node = module.SmartMergeImages()
+    module._ALIGNMENT_CACHE.clear()
+    start = time.perf_counter()
+    _, report = node.smart_merge(
+        background, crop_b, alignment_mode, color_match, args.feather_kernel, 25, 0.0, local_match,
+        original_crop_A=crop_a if alignment_mode != "Force Pixel Snapping (Ref B)" else None,
+        workers=args.workers,
+        alignment_cache_mb=0,
+        blend_backend=args.blend_backend,
+        profiling=True,
+    )
+    elapsed = time.perf_counter() - start
+    aggregate = json.loads(report)["aggregate"]
+    frames = aggregate["frames"]
+    return {
+        "alignment_mode": alignment_mode,
+        "color_match": color_match,
+        "adapt_local_match": local_match,
+        "frames": frames,
+        "seconds": round(elapsed, 6),
+        "fps": round(frames / elapsed, 4) if elapsed > 0 else None,
+        "stages_s": aggregate["stages_s"],
+        "results": aggregate["results"],
+        "peak_traced_bytes": aggregate["peak_traced_bytes"],
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    module = load_module()
+    if args.opencv_threads is not None:
+        cv2.setNumThreads(args.opencv_threads)
+    report = {
+        "benchmark": "smart_merge",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "torch": torch.__version__,
+        "cpu_count": cv2.getNumberOfCPUs(),
+        "settings": {
+            "frames": args.frames,
+            "workers": args.workers,
+            "feather_kernel": args.feather_kernel,
+            "blend_backend": args.blend_backend,
+        },
+        "resolutions": {},
+    }
+    combos = list(combinations(module, args))
+    for resolution in args.resolutions:
+        case = make_case(resolution, args.frames)
+        width, height = RESOLUTIONS[resolution]
+        errors = measure_alignment(module, case[0], case[1], case[3])
+        results = []
+        for alignment_mode, color_match, local_match in combos:
+            result = run_case(module, case, alignment_mode, color_match, local_match, args)
+            results.append(result)
+            print(f"[{resolution}] {alignment_mode} | {color_match} | {local_match}: {result['fps']} fps, "
+                  f"peak {result['peak_traced_bytes'] / 1024 / 1024:.1f} MB", flush=True)
+        report["resolutions"][resolution] = {
+            "width": width,
+            "height": height,
+            "alignment_corner_error_px": errors,
+            "runs": results,
+        }
+    return report
+
+
+def run_key(resolution, run):
+    return resolution, run["alignment_mode"], run["color_match"], run["adapt_local_match"]
+
+
+def compare(baseline_path, candidate_path, threshold):
+    """按组合对比两份结果的帧率，变化超过 threshold 的组合标记出来。"""
+    load = lambda path: json.loads(Path(path).read_text(encoding="utf-8"))
+    baseline, candidate = load(baseline_path), load(candidate_path)
+    baseline_runs = {run_key(res, run): run for res, data in baseline["resolutions"].items() for run in data["runs"]}
+    regressions = 0
+    for resolution, data in candidate["resolutions"].items():
+        for run in data["runs"]:
+            old = baseline_runs.get(run_key(resolution, run))
+            if old is None or not old["fps"] or not run["fps"]:
+                continue
+            change = run["fps"] / old["fps"] - 1.0
+            flag = ""
+            if change < -threshold:
+                flag = "  <-- 回退"
+                regressions += 1
+            elif change > threshold:
+                flag = "  <-- 提升"
+            print(f"[{resolution}] {run['alignment_mode']} | {run['color_match']} | {run['adapt_local_match']}: "
+                  f"{old['fps']:.3f} -> {run['fps']:.3f} fps ({change:+.1%}){flag}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="SmartMergeImages CPU 基准测试")
+    parser.add_argument("--resolutions", nargs="+", choices=sorted(RESOLUTIONS), default=["1K", "2K", "4K"])
+    parser.add_argument("--frames", type=int, default=3, help="每个组合处理的帧数")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--feather-kernel", type=int, default=20)
+    parser.add_argument("--blend-backend", default="Float32")
+    parser.add_argument("--alignment-mode", action="append", help="只运行指定对齐模式，可重复")
+    parser.add_argument("--color-match", action="append", help="只运行指定颜色模式，可重复")
+    parser.add_argument("--adapt-local-match", action="append", help="只运行指定自适应匹配方式，可重复")
+    parser.add_argument("--opencv-threads", type=int, default=None, help="cv2.setNumThreads 的值，默认不修改")
+    parser.add_argument("--output", default="bench_smart_merge.json", help="结果 JSON 路径")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="比较两份结果 JSON，不运行测试")
+    parser.add_argument("--threshold", type=float, default=0.1, help="--compare 时判定回退的帧率变化比例")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        return 1 if compare(*args.compare, args.threshold) else 0
+    report = run(args)
+    Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"结果已写入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
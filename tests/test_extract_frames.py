@@ -0,0 +1,128 @@
+import importlib.util
+from pathlib import Path
+import unittest
+
+import torch
+
+
+ROOT = Path(__file__).resolve().parents[1]
+MODULE_PATH = ROOT / "ExtractFrames.py"
+SPEC = importlib.util.spec_from_file_location("ck_extract_frames_test", MODULE_PATH)
+MODULE = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(MODULE)
+
+
+def extract(image, spec="", **kwargs):
+    options = dict(start_index=0, direction="forward", frame_count=1)
+    options.update(kwargs)
+    return MODULE.ExtractFramesFromBatch().extract_frames(image, range_spec=spec, **options)
+
+
+class RangeSpecTest(unittest.TestCase):
+    def resolve(self, spec, total=300):
+        return [index for range_ in MODULE.parse_range_spec(spec, total) for index in range_]
+
+    def test_inclusive_ranges_steps_and_slices(self):
+        indices = self.resolve("0-3, 120-126:2, -3:")
+        self.assertEqual(indices, [0, 1, 2, 3, 120, 122, 124, 126, 297, 298, 299])
+
+    def test_python_slice_semantics(self):
+        for spec, expected in (("::50", list(range(300))[::50]), ("10:0:-3", list(range(300))[10:0:-3]), ("-5:1000", list(range(295, 300)))):
+            with self.subTest(spec=spec):
+                self.assertEqual(self.resolve(spec), expected)
+
+    def test_descending_range_and_negative_single_index(self):
+        self.assertEqual(self.resolve("5-2, -1"), [5, 4, 3, 2, 299])
+
+    def test_invalid_specs_raise(self):
+        for spec in ("abc", "1-2:0", "::0", "300", "0--400"):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                self.resolve(spec)
+
+
+class ExtractFramesTest(unittest.TestCase):
+    def test_single_slice_returns_view(self):
+        image = torch.rand(64, 2, 2, 3)
+        output, _, _, indices = extract(image, "8:40:4")
+        self.assertEqual(output.data_ptr(), image[8].data_ptr())
+        self.assertTrue(torch.equal(output, image[8:40:4]))
+        self.assertEqual(indices, ",".join(str(i) for i in range(8, 40, 4)))
+
+    def test_adjacent_segments_merge_into_view(self):
+        image = torch.rand(20, 2, 2, 3)
+        output, _, _, _ = extract(image, "0-4, 5-9")
+        self.assertEqual(output.data_ptr(), image.data_ptr())
+        self.assertEqual(output.shape[0], 10)
+
+    def test_multiple_segments_gather_image_mask_and_latent_identically(self):
+        image = torch.arange(30, dtype=torch.float32).view(-1, 1, 1, 1).expand(-1, 2, 2, 3)
+        mask = torch.arange(30, dtype=torch.float32).view(-1, 1, 1).expand(-1, 2, 2)
+        latent = {"samples": torch.arange(30, dtype=torch.float32).view(-1, 1, 1, 1).expand(-1, 4, 1, 1), "batch_index": list(range(100, 130))}
+        output, output_mask, output_latent, indices = extract(image, "2-4, 20-26:3, -1", mask=mask, latent=latent)
+        expected = [2, 3, 4, 20, 23, 26, 29]
+        self.assertEqual(indices, ",".join(map(str, expected)))
+        self.assertEqual(output[:, 0, 0, 0].tolist(), expected)
+        self.assertEqual(output_mask[:, 0, 0].tolist(), expected)
+        self.assertEqual(output_latent["samples"][:, 0, 0, 0].tolist(), expected)
+        self.assertEqual(output_latent["batch_index"], [100 + i for i in expected])
+
+    def test_indices_output_round_trips_as_spec(self):
+        image = torch.rand(50, 1, 1, 3)
+        first, _, _, indices = extract(image, "40-30:5, 1, 7:12")
+        second, _, _, _ = extract(image, indices)
+        self.assertTrue(torch.equal(first, second))
+
+    def test_single_frame_mask_is_shared(self):
+        image = torch.rand(10, 2, 2, 3)
+        mask = torch.rand(1, 2, 2)
+        _, output_mask, _, _ = extract(image, "0-4", mask=mask)
+        self.assertIs(output_mask, mask)
+
+    def test_mismatched_mask_batch_raises(self):
+        with self.assertRaises(ValueError):
+            extract(torch.rand(10, 2, 2, 3), "0-4", mask=torch.rand(3, 2, 2))
+
+    def test_legacy_window_still_applies(self):
+        image = torch.rand(20, 1, 1, 3)
+        output, _, _, indices = extract(image, start_index=10, direction="forward", frame_count=4)
+        self.assertTrue(torch.equal(output, image[7:11]))
+        self.assertEqual(indices, "7,8,9,10")
+        output, _, _, _ = extract(image, start_index=10, direction="backward", frame_count=4)
+        self.assertTrue(torch.equal(output, image[10:14]))
+
+
+    def test_mask_only_extraction(self):
+        mask = torch.arange(12, dtype=torch.float32).view(-1, 1, 1).expand(-1, 2, 2)
+        output, output_mask, output_latent, indices = extract(None, "-3:", mask=mask)
+        self.assertIsNone(output)
+        self.assertIsNone(output_latent)
+        self.assertEqual(output_mask[:, 0, 0].tolist(), [9.0, 10.0, 11.0])
+        self.assertEqual(indices, "9,10,11")
+
+    def test_latent_only_extraction(self):
+        latent = {"samples": torch.arange(8, dtype=torch.float32).view(-1, 1, 1, 1).expand(-1, 4, 2, 2), "batch_index": list(range(8))}
+        _, _, output, _ = extract(None, "1, 5", latent=latent)
+        self.assertEqual(output["samples"][:, 0, 0, 0].tolist(), [1.0, 5.0])
+        self.assertEqual(output["batch_index"], [1, 5])
+
+    def test_video_latent_is_selected_along_frame_axis(self):
+        samples = torch.arange(6, dtype=torch.float32).view(1, 1, 6, 1, 1).expand(2, 16, 6, 3, 3)
+        noise_mask = torch.arange(6, dtype=torch.float32).view(1, 1, 6, 1, 1).expand(2, 1, 6, 3, 3)
+        latent = {"samples": samples, "noise_mask": noise_mask}
+        _, _, output, indices = extract(None, "0-5:2", latent=latent)
+        self.assertEqual(indices, "0,2,4")
+        self.assertEqual(tuple(output["samples"].shape), (2, 16, 3, 3, 3))
+        self.assertEqual(output["samples"][1, 0, :, 0, 0].tolist(), [0.0, 2.0, 4.0])
+        self.assertEqual(output["noise_mask"][0, 0, :, 0, 0].tolist(), [0.0, 2.0, 4.0])
+
+        image = torch.rand(6, 2, 2, 3)
+        output_image, _, output, _ = extract(image, start_index=3, frame_count=2, latent=latent)
+        self.assertTrue(torch.equal(output_image, image[2:4]))
+        self.assertEqual(output["samples"][0, 0, :, 0, 0].tolist(), [2.0, 3.0])
+
+    def test_no_input_raises(self):
+        with self.assertRaises(ValueError):
+            extract(None, "0")
+
+if __name__ == "__main__":
+    unittest.main()
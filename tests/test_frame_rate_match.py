@@ -1,6 +1,9 @@
+from fractions import Fraction
 import importlib.util
 from pathlib import Path
+import random
 import unittest
+import unittest.mock
 
 import torch
 
@@ -12,6 +15,17 @@ MODULE = importlib.util.module_from_spec(SPEC)
 SPEC.loader.exec_module(MODULE)
 
 
+def reference_index(output_index, frame_count, input_fps, output_fps):
+    """原先逐帧构造 Fraction 的实现，用于校验闭式整数公式。"""
+    source_position = Fraction(output_index) * MODULE._fps_fraction(input_fps) / MODULE._fps_fraction(output_fps)
+    return min(MODULE._round_half_up(source_position), frame_count - 1)
+
+
+def reference_count(frame_count, input_fps, output_fps):
+    ratio = MODULE._fps_fraction(output_fps) / MODULE._fps_fraction(input_fps)
+    return max(1, MODULE._round_half_up(frame_count * ratio))
+
+
 class FrameRateMatchTest(unittest.TestCase):
     def test_same_fps_keeps_every_frame(self):
         self.assertEqual(MODULE.calculate_frame_indices(5, 24.0, 24.0), [0, 1, 2, 3, 4])
@@ -51,5 +65,169 @@ class FrameRateMatchTest(unittest.TestCase):
             MODULE.calculate_frame_indices(5, 0, 24)
 
 
+class RegularMappingViewTest(unittest.TestCase):
+    def match(self, frame_count, input_fps, output_fps):
+        images = torch.rand(frame_count, 4, 6, 3)
+        output, _ = MODULE.MatchBatchFrameRate().match_frame_rate(images, input_fps, output_fps)
+        indices = MODULE.calculate_frame_index_tensor(frame_count, input_fps, output_fps)
+        self.assertTrue(torch.equal(output, torch.index_select(images, 0, indices)))
+        return images, output
+
+    def test_identity_returns_input_batch(self):
+        images, output = self.match(12, 24.0, 24.0)
+        self.assertIs(output, images)
+
+    def test_integer_decimation_returns_strided_view(self):
+        for input_fps, output_fps in ((60.0, 30.0), (50.0, 25.0), (120.0, 24.0)):
+            with self.subTest(input_fps=input_fps, output_fps=output_fps):
+                images, output = self.match(600, input_fps, output_fps)
+                self.assertEqual(output.untyped_storage().data_ptr(), images.untyped_storage().data_ptr())
+                self.assertEqual(output.stride(0), images.stride(0) * int(input_fps // output_fps))
+
+    def test_irregular_mapping_falls_back_to_copy(self):
+        images, output = self.match(30, 30.0, 24.0)
+        self.assertNotEqual(output.untyped_storage().data_ptr(), images.untyped_storage().data_ptr())
+
+    def test_regular_slice_detection(self):
+        self.assertEqual(MODULE._regular_slice(torch.tensor([3, 4, 5])), slice(3, 6, 1))
+        self.assertEqual(MODULE._regular_slice(torch.tensor([1, 4, 7, 10])), slice(1, 11, 3))
+        self.assertEqual(MODULE._regular_slice(torch.tensor([7])), slice(7, 8))
+        self.assertIsNone(MODULE._regular_slice(torch.tensor([0, 1, 1, 2])))
+        self.assertIsNone(MODULE._regular_slice(torch.tensor([0, 2, 3])))
+
+
+class FrameIndexScaleTest(unittest.TestCase):
+    RATES = [(29.97, 23.976), (23.976, 29.97), (60.0, 24.0), (25.0, 29.97), (59.94, 50.0), (24.0, 24.0), (30.0, 7.3)]
+
+    def test_matches_reference_exactly(self):
+        for input_fps, output_fps in self.RATES:
+            with self.subTest(input_fps=input_fps, output_fps=output_fps):
+                frame_count = 20011
+                indices = MODULE.calculate_frame_indices(frame_count, input_fps, output_fps)
+                self.assertEqual(len(indices), reference_count(frame_count, input_fps, output_fps))
+                expected = [reference_index(j, frame_count, input_fps, output_fps) for j in range(len(indices))]
+                self.assertEqual(indices, expected)
+
+    def test_million_frame_sequences_match_reference(self):
+        frame_count = 1_000_000
+        for input_fps, output_fps in self.RATES:
+            with self.subTest(input_fps=input_fps, output_fps=output_fps):
+                indices = MODULE.calculate_frame_index_tensor(frame_count, input_fps, output_fps)
+                self.assertEqual(indices.dtype, torch.long)
+                self.assertEqual(len(indices), reference_count(frame_count, input_fps, output_fps))
+                self.assertTrue(bool((indices[1:] >= indices[:-1]).all()))
+                # 抽样校验：均匀分布的采样点加上末尾一段，覆盖 clamp 边界
+                samples = list(range(0, len(indices), 7919)) + list(range(len(indices) - 2000, len(indices)))
+                self.assertEqual(
+                    indices[samples].tolist(),
+                    [reference_index(j, frame_count, input_fps, output_fps) for j in samples],
+                )
+
+    def test_int64_overflow_falls_back_to_python_integers(self):
+        expected = MODULE.calculate_frame_indices(1001, 29.97, 23.976)
+        with unittest.mock.patch.object(MODULE, "_INT64_MAX", 1000):
+            self.assertEqual(MODULE.calculate_frame_indices(1001, 29.97, 23.976), expected)
+
+
+class LinearBlendTest(unittest.TestCase):
+    def blend(self, images, input_fps, output_fps, chunk_size=64):
+        return MODULE.MatchBatchFrameRate().match_frame_rate(images, input_fps, output_fps, "Linear Blend", chunk_size)
+
+    def test_blend_follows_exact_timeline(self):
+        frames = torch.arange(25, dtype=torch.float64).view(-1, 1, 1, 1)
+        output, _ = self.blend(frames, 23.976, 59.94)
+        self.assertEqual(len(output), reference_count(25, 23.976, 59.94))
+        step = MODULE._fps_fraction(23.976) / MODULE._fps_fraction(59.94)
+        expected = [min(float(j * step), 24.0) for j in range(len(output))]
+        self.assertTrue(torch.allclose(output.flatten(), torch.tensor(expected, dtype=torch.float64)))
+
+    def test_integer_positions_copy_source_frames(self):
+        frames = torch.rand(12, 4, 4, 3)
+        output, _ = self.blend(frames, 30.0, 60.0)
+        self.assertTrue(torch.equal(output[0::2], frames))
+        self.assertTrue(torch.allclose(output[1:-1:2], (frames[:-1] + frames[1:]) / 2))
+
+    def test_chunk_size_bounds_intermediates_without_changing_result(self):
+        frames = torch.rand(40, 3, 5, 3)
+        expected, _ = self.blend(frames, 24.0, 60.0, chunk_size=4096)
+        original = torch.index_select
+        largest = []
+
+        def recording_index_select(tensor, dim, index):
+            largest.append(len(index))
+            return original(tensor, dim, index)
+
+        with unittest.mock.patch.object(MODULE.torch, "index_select", side_effect=recording_index_select):
+            output, _ = self.blend(frames, 24.0, 60.0, chunk_size=7)
+        self.assertEqual(max(largest), 7)
+        self.assertTrue(torch.equal(output, expected))
+
+    def test_same_fps_returns_view(self):
+        frames = torch.rand(6, 2, 2, 3)
+        output, _ = self.blend(frames, 25.0, 25.0)
+        self.assertEqual(output.data_ptr(), frames.data_ptr())
+        self.assertTrue(torch.equal(output, frames))
+
+
+class ChunkedStreamingTest(unittest.TestCase):
+    RATES = [(29.97, 23.976), (23.976, 29.97), (60.0, 24.0), (30.0, 24.0), (25.0, 24.0), (24.0, 24.0), (30.0, 7.3), (30.0, 1.0)]
+
+    def run_chunks(self, frames, input_fps, output_fps, chunk_lengths, total_frame_count=0):
+        node = MODULE.MatchBatchFrameRateChunk()
+        outputs, offset = [], 0
+        for i, length in enumerate(chunk_lengths):
+            chunk = frames[offset:offset + length]
+            images, offset, _ = node.match_frame_rate_chunk(
+                chunk, input_fps, output_fps, offset, i == len(chunk_lengths) - 1, total_frame_count
+            )
+            outputs.append(images)
+        return torch.cat(outputs)
+
+    def random_chunks(self, rng, frame_count):
+        lengths, remaining = [], frame_count
+        while remaining:
+            length = min(remaining, rng.randint(0, 37))
+            lengths.append(length)
+            remaining -= length
+        return lengths
+
+    def test_concatenated_chunks_match_full_run(self):
+        rng = random.Random(0)
+        full_node = MODULE.MatchBatchFrameRate()
+        for input_fps, output_fps in self.RATES:
+            for trial in range(6):
+                frame_count = rng.randint(1, 300)
+                frames = torch.arange(frame_count, dtype=torch.float32).view(-1, 1, 1, 1)
+                expected = full_node.match_frame_rate(frames, input_fps, output_fps)[0]
+                lengths = self.random_chunks(rng, frame_count)
+                with self.subTest(input_fps=input_fps, output_fps=output_fps, lengths=lengths):
+                    output = self.run_chunks(frames, input_fps, output_fps, lengths, frame_count)
+                    self.assertTrue(torch.equal(output, expected))
+                    if input_fps / output_fps <= 3:
+                        output = self.run_chunks(frames, input_fps, output_fps, lengths)
+                        self.assertTrue(torch.equal(output, expected))
+
+    def test_first_output_index_continues_across_chunks(self):
+        emitted = 0
+        for offset in range(0, 240, 40):
+            first, indices = MODULE.calculate_chunk_frame_indices(offset, 40, 29.97, 23.976, offset == 200)
+            self.assertEqual(first, emitted)
+            emitted += len(indices)
+        self.assertEqual(emitted, reference_count(240, 29.97, 23.976))
+
+    def test_large_step_without_total_requires_frame_count(self):
+        with self.assertRaises(ValueError):
+            for offset in range(0, 120, 10):
+                MODULE.calculate_chunk_frame_indices(offset, 10, 30.0, 1.0)
+
+    def test_regular_chunks_return_views(self):
+        frames = torch.rand(48, 2, 2, 3)
+        node = MODULE.MatchBatchFrameRateChunk()
+        images, next_offset, _ = node.match_frame_rate_chunk(frames, 60.0, 30.0, 96, False)
+        self.assertEqual(next_offset, 144)
+        self.assertEqual(images.data_ptr(), frames.data_ptr())
+        self.assertTrue(torch.equal(images, frames[::2]))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,135 @@
+import gc
+import importlib.util
+import os
+from pathlib import Path
+import tempfile
+import unittest
+
+import torch
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def load(name, filename):
+    spec = importlib.util.spec_from_file_location(name, ROOT / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+MODULE = load("ck_frame_store_test", "FrameStore.py")
+EXTRACT = load("ck_frame_store_extract_test", "ExtractFrames.py")
+FRAME_RATE = load("ck_frame_store_frame_rate_test", "FrameRateMatch.py")
+
+
+class FrameStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.images = torch.rand(20, 6, 8, 3)
+
+    def spill(self, images, storage_dtype="uint8", store=None, chunk_size=64):
+        return MODULE.SpillFramesToStore().spill(images, storage_dtype, store, self.directory.name, chunk_size, keep_file=True)[0]
+
+    def test_uint8_and_float16_round_trip(self):
+        for storage_dtype, tolerance in (("uint8", 0.5 / 255 + 1e-6), ("float16", 1e-3)):
+            with self.subTest(storage_dtype=storage_dtype):
+                store = self.spill(self.images, storage_dtype, chunk_size=3)
+                self.assertEqual(store.shape, tuple(self.images.shape))
+                frames = store.read(slice(None))
+                self.assertEqual(frames.dtype, torch.float32)
+                self.assertLessEqual(float((frames - self.images).abs().max()), tolerance)
+
+    def test_chunked_appends_match_single_spill(self):
+        whole = self.spill(self.images)
+        store = self.spill(self.images[:7])
+        store = self.spill(self.images[7:], store=store)
+        self.assertEqual(len(store), 20)
+        self.assertTrue(torch.equal(store.read(slice(None)), whole.read(slice(None))))
+        reopened = MODULE.FrameStore.open(store.path)
+        self.assertTrue(torch.equal(reopened.read([3, 15]), whole.read([3, 15])))
+
+    def test_append_leaves_input_store_unchanged(self):
+        first = self.spill(self.images[:7])
+        resident = first.read(slice(None))
+        appended = self.spill(self.images[7:], store=first)
+        self.assertEqual(len(first), 7)
+        self.assertTrue(torch.equal(first.read(slice(None)), resident))
+        self.assertEqual(len(appended), 20)
+
+    def test_branches_from_one_store_do_not_interfere(self):
+        base = self.spill(self.images[:3])
+        branch_a = self.spill(torch.ones(4, 6, 8, 3), store=base)
+        branch_b = self.spill(torch.full((2, 6, 8, 3), 0.5), store=base)
+        self.assertEqual((len(base), len(branch_a), len(branch_b)), (3, 7, 5))
+        self.assertTrue(torch.equal(branch_a.read(slice(3, None)), torch.ones(4, 6, 8, 3)))
+        self.assertTrue(torch.equal(branch_b.read(slice(3, None)), torch.full((2, 6, 8, 3), 128 / 255)))
+        self.assertTrue(torch.equal(branch_a.read(slice(None, 3)), branch_b.read(slice(None, 3))))
+
+    def test_rerun_never_modifies_written_files(self):
+        first = self.spill(self.images[:7])
+        longer = self.spill(self.images[7:], store=first)
+        resident = longer.read(slice(None))
+        sizes = [os.path.getsize(segment.path) for segment in longer.segments]
+        shorter = self.spill(self.images[10:12], store=first)
+        self.assertEqual(len(shorter), 9)
+        self.assertEqual([os.path.getsize(segment.path) for segment in longer.segments], sizes)
+        self.assertTrue(torch.equal(longer.read(slice(None)), resident))
+
+    def test_file_names_are_unique_per_process_and_write(self):
+        first, second = self.spill(self.images), self.spill(self.images)
+        self.assertNotEqual(first.path, second.path)
+        self.assertTrue(os.path.basename(first.path).startswith(f"frames_{os.getpid()}_"))
+
+    def test_temporary_files_are_removed_when_unreferenced(self):
+        node = MODULE.SpillFramesToStore()
+        temporary = node.spill(self.images, "uint8", None, self.directory.name, keep_file=False)[0]
+        temporary.read([0])
+        path = temporary.path
+        del temporary
+        gc.collect()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_keep_file_keeps_whole_chain_for_reopening(self):
+        node = MODULE.SpillFramesToStore()
+        base = node.spill(self.images[:7], "uint8", None, self.directory.name, keep_file=False)[0]
+        kept = node.spill(self.images[7:], "uint8", base, self.directory.name, keep_file=True)[0]
+        path, resident = kept.path, kept.read(slice(None))
+        del base, kept
+        gc.collect()
+        self.assertTrue(torch.equal(MODULE.FrameStore.open(path).read(slice(None)), resident))
+
+    def test_append_rejects_mismatched_frames(self):
+        store = self.spill(self.images)
+        with self.assertRaises(ValueError):
+            self.spill(torch.rand(2, 4, 4, 3), store=store)
+        with self.assertRaises(ValueError):
+            self.spill(self.images, "float16", store=store)
+
+    def test_load_node_reads_requested_range(self):
+        store = self.spill(self.images)
+        images, _ = MODULE.LoadFramesFromStore().load(store, 4, 5, 2)
+        self.assertTrue(torch.equal(images, store.read(slice(None))[4:14:2]))
+        images, _ = MODULE.LoadFramesFromStore().load(store, 15, 0, 1)
+        self.assertEqual(images.shape[0], 5)
+
+    def test_batch_nodes_read_from_store(self):
+        store = self.spill(self.images)
+        resident = store.read(slice(None))
+
+        extracted, _, _, indices = EXTRACT.ExtractFramesFromBatch().extract_frames(range_spec="1-3, -2:", frame_store=store)
+        self.assertEqual(indices, "1,2,3,18,19")
+        self.assertTrue(torch.equal(extracted, resident[[1, 2, 3, 18, 19]]))
+
+        node = FRAME_RATE.MatchBatchFrameRate()
+        for interpolation in ("Nearest (Duplicate)", "Linear Blend"):
+            with self.subTest(interpolation=interpolation):
+                expected, _ = node.match_frame_rate(resident, 24.0, 60.0, interpolation, 4)
+                output, _ = node.match_frame_rate(None, 24.0, 60.0, interpolation, 4, frame_store=store)
+                self.assertTrue(torch.equal(output, expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import importlib.util
+import json
+from pathlib import Path
+import unittest
+import unittest.mock
+
+import numpy as np
+import torch
+from PIL import Image, ImageDraw
+
+
+ROOT = Path(__file__).resolve().parents[1]
+MODULE_PATH = ROOT / "MaskBorderDrawer.py"
+SPEC = importlib.util.spec_from_file_location("ck_mask_border_drawer_test", MODULE_PATH)
+MODULE = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(MODULE)
+
+
+def make_inputs(frames=1, masks=1, size=(64, 80)):
+    height, width = size
+    image = torch.rand(frames, height, width, 3)
+    mask = torch.zeros(masks, height, width)
+    for i in range(masks):
+        mask[i, 10 + i:30 + i, 12:40] = 1.0
+        mask[i, 40:55, 50 + i:70] = 1.0
+    return image, mask
+
+
+def draw(image, mask, **kwargs):
+    return draw_with_bounds(image, mask, **kwargs)[0]
+
+
+def draw_with_bounds(image, mask, **kwargs):
+    options = dict(stroke_width=3, box_type="rectangle", expand_pixels=0, red=255, green=0, blue=0, corner_radius=6, draw_mode="separate")
+    options.update(kwargs)
+    return MODULE.MaskBorderDrawer().draw_border(image, mask, **options)
+
+
+def pil_rectangles(image, bounds_list, stroke_width, color):
+    """原先基于 PIL 的逐像素多线方框实现，作为参考。"""
+    pil_image = Image.fromarray((image.numpy() * 255).astype(np.uint8))
+    canvas = ImageDraw.Draw(pil_image)
+    height, width = image.shape[:2]
+    for x1, y1, x2, y2 in bounds_list:
+        x1, y1 = max(0, min(x1, width - 1)), max(0, min(y1, height - 1))
+        x2, y2 = max(0, min(x2, width - 1)), max(0, min(y2, height - 1))
+        for i in range(stroke_width):
+            offset = i - stroke_width // 2
+            canvas.rectangle([x1 + offset, y1 + offset, x2 - offset, y2 - offset], outline=color)
+    return np.array(pil_image)
+
+
+class MaskBorderDrawerTest(unittest.TestCase):
+    def test_rectangle_stroke_matches_pil_reference(self):
+        image, mask = make_inputs()
+        for stroke_width in (1, 2, 3, 6):
+            with self.subTest(stroke_width=stroke_width):
+                output = draw(image, mask, stroke_width=stroke_width, expand_pixels=2)
+                bounds = MODULE.MaskBorderDrawer().get_mask_bounds(mask[0], 2, "separate")
+                expected = pil_rectangles(image[0], bounds, stroke_width, (255, 0, 0))
+                stroke = np.all(expected == (255, 0, 0), axis=-1)
+                drawn = (output[0] == torch.tensor([1.0, 0.0, 0.0])).all(dim=-1).numpy()
+                self.assertTrue(np.array_equal(drawn, stroke))
+
+    def test_pixels_outside_stroke_are_unchanged(self):
+        image, mask = make_inputs()
+        output = draw(image, mask, box_type="rounded", stroke_width=4)
+        changed = (output[0] != image[0]).any(dim=-1)
+        self.assertTrue(changed.any())
+        self.assertTrue(torch.equal(output[0][~changed], image[0][~changed]))
+
+    def test_single_mask_is_broadcast_across_batch(self):
+        image, mask = make_inputs(frames=5, masks=1)
+        output = draw(image, mask)
+        self.assertEqual(output.shape, image.shape)
+        strokes = (output != image).any(dim=-1)
+        for i in range(1, 5):
+            self.assertTrue(torch.equal(strokes[i], strokes[0]))
+
+    def test_per_frame_masks_draw_each_frame(self):
+        image, mask = make_inputs(frames=3, masks=3)
+        output = draw(image, mask, stroke_width=1)
+        red = (output == torch.tensor([1.0, 0.0, 0.0])).all(dim=-1)
+        for i in range(3):
+            self.assertTrue(red[i, 10 + i, 20].item())
+            self.assertFalse(red[i, 10 + i - 1, 20].item())
+
+    def test_single_image_is_broadcast_across_masks(self):
+        image, mask = make_inputs(frames=1, masks=4)
+        self.assertEqual(draw(image, mask).shape[0], 4)
+
+    def test_empty_mask_returns_original_frames(self):
+        image, _ = make_inputs(frames=2)
+        output = draw(image, torch.zeros(1, 64, 80))
+        self.assertTrue(torch.equal(output, image))
+
+
+class MaskRegionTest(unittest.TestCase):
+    def setUp(self):
+        MODULE._REGION_CACHE.clear()
+
+    def make_mask(self):
+        mask = np.zeros((100, 120), dtype=np.float32)
+        mask[10:40, 10:50] = 1.0
+        mask[60:90, 70:110] = 0.5
+        mask[5:7, 100:102] = 1.0
+        return mask
+
+    def test_regions_match_contour_bounding_boxes(self):
+        regions = MODULE._mask_regions(self.make_mask())
+        self.assertEqual(sorted(region[:4] for region in regions), [(10, 10, 40, 30), (70, 60, 40, 30), (100, 5, 2, 2)])
+        self.assertEqual(sorted(region[4] for region in regions), [4, 1200, 1200])
+
+    def test_min_area_and_max_regions_filter(self):
+        node = MODULE.MaskBorderDrawer()
+        self.assertEqual(len(node.get_mask_bounds(self.make_mask(), min_area=10)), 2)
+        mask = self.make_mask()
+        mask[60:90, 70:80] = 0.0
+        self.assertEqual(node.get_mask_bounds(mask, max_regions=1), [(10, 10, 50, 40)])
+        self.assertEqual(node.get_mask_bounds(mask, mode="combined", min_area=10), [(10, 10, 110, 90)])
+
+    def test_downscaled_analysis_covers_full_resolution_bounds(self):
+        mask = np.zeros((1000, 1600), dtype=np.float32)
+        mask[101:333, 250:901] = 1.0
+        mask[700:703, 1500:1503] = 1.0
+        exact = MODULE._mask_regions(mask)
+        coarse = MODULE._mask_regions(mask, analysis_max_side=200)
+        self.assertEqual(len(coarse), len(exact))
+        for (x, y, w, h, _), (cx, cy, cw, ch, _) in zip(exact, coarse):
+            self.assertLessEqual(cx, x)
+            self.assertLessEqual(cy, y)
+            self.assertGreaterEqual(cx + cw, x + w)
+            self.assertGreaterEqual(cy + ch, y + h)
+            self.assertLess(cx + cw - (x + w) + x - cx, 20)
+
+    def test_static_masks_are_analyzed_once(self):
+        image = torch.rand(6, 100, 120, 3)
+        mask = torch.from_numpy(self.make_mask()).expand(6, -1, -1).contiguous()
+        original = MODULE.cv2.connectedComponentsWithStats
+        with unittest.mock.patch.object(MODULE.cv2, "connectedComponentsWithStats", wraps=original) as analyze:
+            draw(image, mask)
+            draw(image, mask)
+        self.assertEqual(analyze.call_count, 1)
+
+    def test_bounds_json_lists_regions_per_frame(self):
+        image = torch.rand(2, 100, 120, 3)
+        mask = torch.from_numpy(self.make_mask())[None]
+        _, bounds_json = draw_with_bounds(image, mask, min_area=10, expand_pixels=2)
+        bounds = json.loads(bounds_json)
+        self.assertEqual((bounds["width"], bounds["height"]), (120, 100))
+        self.assertEqual([frame["index"] for frame in bounds["frames"]], [0, 1])
+        self.assertEqual(bounds["frames"][1]["regions"][0], {"x1": 8, "y1": 8, "x2": 52, "y2": 42, "area": 1200})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,339 @@
+import contextlib
+import importlib.util
+import io
+import json
+import os
+from pathlib import Path
+import sys
+import tarfile
+import tempfile
+import threading
+import types
+import unittest
+import unittest.mock
+
+import numpy as np
+from PIL import Image, features
+import torch
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _install_comfy_stubs():
+    """SaveImageCK 在导入时依赖 ComfyUI 的 folder_paths 与 comfy.cli_args，测试中用最小替身代替。"""
+    folder_paths = types.ModuleType("folder_paths")
+    folder_paths.get_output_directory = lambda: tempfile.gettempdir()
+    folder_paths.get_save_image_path = lambda prefix, output_dir, width, height: (output_dir, prefix, 1, "", prefix)
+    cli_args = types.ModuleType("comfy.cli_args")
+    cli_args.args = types.SimpleNamespace(disable_metadata=False)
+    comfy = types.ModuleType("comfy")
+    comfy.cli_args = cli_args
+    for name, module in (("folder_paths", folder_paths), ("comfy", comfy), ("comfy.cli_args", cli_args)):
+        sys.modules.setdefault(name, module)
+
+
+_install_comfy_stubs()
+MODULE_PATH = ROOT / "SaveImageCK.py"
+SPEC = importlib.util.spec_from_file_location("ck_save_image_test", MODULE_PATH)
+MODULE = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(MODULE)
+
+
+def make_images(frames=3, height=24, width=32, seed=0):
+    """生成平滑渐变加少量噪声的 IMAGE 批次，既可压缩又能检查像素是否无损。"""
+    generator = torch.Generator().manual_seed(seed)
+    ramp = torch.linspace(0.0, 1.0, width).view(1, 1, width, 1)
+    noise = torch.rand(frames, height, width, 3, generator=generator) * 0.1
+    return (ramp * 0.9 + noise).clamp(0.0, 1.0)
+
+
+class SaveImageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.folder = self.directory.name
+
+    def save(self, images, **kwargs):
+        return MODULE.SaveImageCK().save_images(images, self.folder, "img", **kwargs)
+
+
+class BackgroundWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.writer = MODULE._BackgroundWriter()
+        self.addCleanup(self.writer.shutdown)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def blocked(self):
+        self.release.wait(5)
+
+    def run_in_thread(self, function, *arguments):
+        thread = threading.Thread(target=function, args=arguments, daemon=True)
+        thread.start()
+        return thread
+
+    def test_submit_blocks_when_queue_is_full(self):
+        self.writer.begin(None, 1, 2)
+        self.writer.submit("a", self.blocked)
+        self.writer.submit("b", self.blocked)
+        third = self.run_in_thread(self.writer.submit, "c", self.blocked)
+        third.join(0.2)
+        self.assertTrue(third.is_alive())
+        self.assertEqual(self.writer.pending_count(), 2)
+
+        self.release.set()
+        third.join(5)
+        self.assertFalse(third.is_alive())
+        self.assertEqual(self.writer.flush(), [])
+        self.assertEqual(self.writer.pending_count(), 0)
+
+    def test_errors_are_returned_once_by_flush(self):
+        def fail():
+            raise OSError("disk full")
+
+        self.writer.begin(None, 2, 4)
+        with unittest.mock.patch("builtins.print"):
+            self.writer.submit("img_00001_.png", fail)
+            self.writer.submit("img_00002_.png", lambda: None)
+            self.assertEqual(self.writer.flush(), ["img_00001_.png: disk full"])
+        self.assertEqual(self.writer.flush(), [])
+
+    def test_new_prompt_waits_for_previous_writes(self):
+        first_prompt, second_prompt = {"1": {}}, {"1": {}}
+        self.writer.begin(first_prompt, 1, 4)
+        self.writer.submit("a", self.blocked)
+
+        self.assertEqual(self.writer.begin(first_prompt, 1, 4), [])
+        self.assertEqual(self.writer.pending_count(), 1)
+
+        second = self.run_in_thread(self.writer.begin, second_prompt, 1, 4)
+        second.join(0.2)
+        self.assertTrue(second.is_alive())
+        self.release.set()
+        second.join(5)
+        self.assertFalse(second.is_alive())
+        self.assertEqual(self.writer.pending_count(), 0)
+
+    def test_async_write_errors_reach_report(self):
+        with tempfile.TemporaryDirectory() as folder, unittest.mock.patch.object(MODULE, "_save_frame", side_effect=OSError("disk full")), unittest.mock.patch("builtins.print"):
+            _, report = MODULE.SaveImageCK().save_images(make_images(2), folder, "img", async_write=True)
+        self.assertIn("Write errors (2):", report)
+        self.assertIn("img_00001_.png: disk full", report)
+
+
+class Uint8BatchTest(unittest.TestCase):
+    def reference(self, images):
+        # 逐帧转换的旧实现
+        return np.stack([np.clip(255. * image.cpu().numpy(), 0, 255).astype(np.uint8) for image in images])
+
+    def test_matches_per_image_conversion(self):
+        images = torch.rand(5, 17, 23, 3, generator=torch.Generator().manual_seed(1)) * 1.4 - 0.2
+        images[0, 0, :4, 0] = torch.tensor([0.0, 1.0, 1.0 / 255, 254.5 / 255])
+        for batch in (images, images[:, ::2], images.to(torch.float16)):
+            with self.subTest(shape=tuple(batch.shape), dtype=batch.dtype):
+                pixels = MODULE._to_uint8_batch(batch)
+                self.assertEqual(pixels.dtype, np.uint8)
+                np.testing.assert_array_equal(pixels, self.reference(batch.to(torch.float32)))
+
+    def test_result_does_not_share_memory_with_input(self):
+        images = make_images(2)
+        pixels = MODULE._to_uint8_batch(images)
+        expected = pixels.copy()
+        images.zero_()
+        np.testing.assert_array_equal(pixels, expected)
+
+    @unittest.skipUnless(torch.cuda.is_available(), "需要 CUDA")
+    def test_gpu_matches_cpu(self):
+        images = torch.rand(4, 16, 16, 3) * 1.4 - 0.2
+        np.testing.assert_array_equal(MODULE._to_uint8_batch(images.cuda()), MODULE._to_uint8_batch(images))
+
+
+class ImageEncoderTest(unittest.TestCase):
+    METADATA = [("prompt", '{"1": {"inputs": {}}}'), ("workflow", '{"nodes": []}')]
+
+    def setUp(self):
+        self.pixels = MODULE._to_uint8_batch(make_images(1))[0]
+
+    def decode(self, file_format, metadata=None, **options):
+        encoder = MODULE._ImageEncoder(file_format, **options)
+        data = encoder.encode(self.pixels, metadata)
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return encoder, data, image
+
+    def assertExifMetadata(self, image):
+        exif = image.getexif()
+        self.assertEqual(exif[0x0110], 'prompt:{"1": {"inputs": {}}}')
+        self.assertEqual(exif[0x010F], 'workflow:{"nodes": []}')
+
+    def test_png_levels_are_lossless_and_trade_size(self):
+        sizes = {}
+        for level in (0, 9):
+            with self.subTest(level=level):
+                encoder, data, image = self.decode("PNG", png_compress_level=level)
+                self.assertEqual((image.format, encoder.extension, encoder.label), ("PNG", ".png", f"PNG level {level}"))
+                np.testing.assert_array_equal(np.asarray(image), self.pixels)
+                sizes[level] = len(data)
+        self.assertGreater(sizes[0], sizes[9])
+
+    def test_png_metadata_is_written_as_text_chunks(self):
+        _, _, image = self.decode("PNG", self.METADATA)
+        self.assertEqual(image.text, dict(self.METADATA))
+
+    @unittest.skipUnless(features.check("webp"), "Pillow 未启用 WebP")
+    def test_webp_lossless_and_lossy(self):
+        _, lossless_data, lossless = self.decode("WebP (Lossless)", self.METADATA, quality=10)
+        self.assertEqual(lossless.format, "WEBP")
+        np.testing.assert_array_equal(np.asarray(lossless.convert("RGB")), self.pixels)
+        self.assertExifMetadata(lossless)
+
+        encoder, lossy_data, lossy = self.decode("WebP", self.METADATA, quality=50)
+        self.assertEqual((lossy.format, encoder.label), ("WEBP", "WebP quality 50"))
+        self.assertEqual(lossy.size, lossless.size)
+        self.assertLess(len(lossy_data), len(lossless_data))
+        self.assertExifMetadata(lossy)
+
+    def test_jpeg_metadata_and_rgba_input(self):
+        encoder, _, image = self.decode("JPEG", self.METADATA, quality=95)
+        self.assertEqual((image.format, image.mode, encoder.extension), ("JPEG", "RGB", ".jpg"))
+        self.assertLess(np.abs(np.asarray(image, dtype=np.int16) - self.pixels).mean(), 8)
+        self.assertExifMetadata(image)
+
+        self.pixels = np.concatenate([self.pixels, np.full(self.pixels.shape[:2] + (1,), 255, np.uint8)], axis=-1)
+        _, _, image = self.decode("JPEG")
+        self.assertEqual(image.mode, "RGB")
+
+    def test_jpeg_drops_metadata_over_exif_limit(self):
+        metadata = [("prompt", "x" * (MODULE._JPEG_EXIF_LIMIT + 1))]
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            _, _, image = self.decode("JPEG", metadata)
+        self.assertEqual(image.format, "JPEG")
+        self.assertNotIn(0x0110, image.getexif())
+        self.assertIn("JPEG EXIF limit", output.getvalue())
+
+    def test_tiff_is_uncompressed_and_lossless(self):
+        _, data, image = self.decode("TIFF (Uncompressed)", self.METADATA)
+        self.assertEqual((image.format, image.info["compression"]), ("TIFF", "raw"))
+        self.assertGreaterEqual(len(data), self.pixels.nbytes)
+        np.testing.assert_array_equal(np.asarray(image), self.pixels)
+        self.assertExifMetadata(image)
+
+    def test_unknown_format_raises(self):
+        with self.assertRaises(ValueError):
+            MODULE._ImageEncoder("BMP")
+
+
+class SidecarMetadataTest(SaveImageTestCase):
+    PROMPT = {"1": {"class_type": "SaveImageCK", "inputs": {}}}
+    EXTRA_PNGINFO = {"workflow": {"nodes": [{"id": 1}]}}
+
+    def entries(self, count):
+        return [{"file": f"img_{i:05}_.png", "batch_index": i, "caption": "说明", "caption_file": None} for i in range(count)]
+
+    def read_json(self, name):
+        with open(os.path.join(self.folder, name), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_json_manifest_references_shared_workflow(self):
+        manifest_file = MODULE._write_sidecar(self.folder, "img_%batch_num%", 7, "Sidecar JSON", self.PROMPT, self.EXTRA_PNGINFO, self.entries(2))
+        self.assertEqual(manifest_file, "img_batch_00007_manifest.json")
+        self.assertEqual(self.read_json("img_batch_00007_workflow.json"), {"prompt": self.PROMPT, **self.EXTRA_PNGINFO})
+        manifest = self.read_json(manifest_file)
+        self.assertEqual(manifest["workflow"], "img_batch_00007_workflow.json")
+        self.assertEqual([entry["batch_index"] for entry in manifest["files"]], [0, 1])
+        self.assertTrue(all(entry["workflow"] == manifest["workflow"] and entry["caption"] == "说明" for entry in manifest["files"]))
+
+    def test_jsonl_manifest_appends_one_line_per_file(self):
+        MODULE._write_sidecar(self.folder, "img", 1, "Sidecar JSONL", self.PROMPT, None, self.entries(2))
+        manifest_file = MODULE._write_sidecar(self.folder, "img", 3, "Sidecar JSONL", self.PROMPT, None, self.entries(3))
+        self.assertEqual(manifest_file, "img_manifest.jsonl")
+        with open(os.path.join(self.folder, manifest_file), "r", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["workflow"] for line in lines], ["img_00001_workflow.json"] * 2 + ["img_00003_workflow.json"] * 3)
+        self.assertEqual(self.read_json("img_00003_workflow.json"), {"prompt": self.PROMPT})
+
+    def test_default_embeds_workflow_in_every_png(self):
+        _, report = self.save(make_images(2), prompt=self.PROMPT, extra_pnginfo=self.EXTRA_PNGINFO)
+        self.assertEqual(sorted(os.listdir(self.folder)), ["img_00001_.png", "img_00002_.png"])
+        self.assertNotIn("Metadata manifest", report)
+        with Image.open(os.path.join(self.folder, "img_00002_.png")) as image:
+            self.assertEqual(json.loads(image.text["prompt"]), self.PROMPT)
+            self.assertEqual(json.loads(image.text["workflow"]), self.EXTRA_PNGINFO["workflow"])
+
+    def test_sidecar_mode_writes_manifest_instead_of_embedding(self):
+        _, report = self.save(make_images(2), prompt=self.PROMPT, extra_pnginfo=self.EXTRA_PNGINFO, caption="说明", metadata_mode="Sidecar JSON")
+        self.assertIn("Metadata manifest: img_00001_manifest.json", report)
+        manifest = self.read_json("img_00001_manifest.json")
+        self.assertEqual([entry["caption_file"] for entry in manifest["files"]], ["img_00001_.txt", "img_00002_.txt"])
+        with Image.open(os.path.join(self.folder, "img_00001_.png")) as image:
+            self.assertNotIn("prompt", image.text)
+
+
+class TarShardWriterTest(SaveImageTestCase):
+    def sample(self, counter, size=3000):
+        data = bytes([counter % 256]) * size
+        return f"img_{counter:05}_", [(".png", data), (".txt", f"caption {counter}".encode("utf-8"))]
+
+    def write(self, writer, counters, max_bytes, write_index=False):
+        for counter in counters:
+            writer.add(*self.sample(counter), max_bytes, write_index)
+        writer.close()
+
+    def shard_names(self, shard):
+        with tarfile.open(os.path.join(self.folder, f"img-{shard:06}.tar")) as tar:
+            return tar.getnames()
+
+    def test_rolls_to_new_shard_at_size_limit(self):
+        writer = MODULE._TarShardWriter(self.folder, "img")
+        # 每个样本连同 tar 头约 4.5 KB，上限 10 KB 时每个分片放两个样本
+        self.write(writer, range(1, 6), 10 * 1024)
+        tars = sorted(name for name in os.listdir(self.folder) if name.endswith(".tar"))
+        self.assertEqual(tars, ["img-000000.tar", "img-000001.tar", "img-000002.tar"])
+        self.assertEqual(self.shard_names(0), ["img_00001_.png", "img_00001_.txt", "img_00002_.png", "img_00002_.txt"])
+        self.assertEqual(self.shard_names(2), ["img_00005_.png", "img_00005_.txt"])
+
+    def test_index_offsets_point_at_member_bytes(self):
+        writer = MODULE._TarShardWriter(self.folder, "img")
+        self.write(writer, range(1, 4), 1024 * 1024, write_index=True)
+        with open(os.path.join(self.folder, "img-000000.index.jsonl"), "r", encoding="utf-8") as f:
+            index = [json.loads(line) for line in f]
+        self.assertEqual(len(index), 6)
+        with tarfile.open(os.path.join(self.folder, "img-000000.tar")) as tar, open(os.path.join(self.folder, "img-000000.tar"), "rb") as f:
+            for entry in index:
+                member = tar.getmember(entry["name"])
+                self.assertEqual((entry["offset"], entry["size"]), (member.offset_data, member.size))
+                f.seek(entry["offset"])
+                self.assertEqual(f.read(entry["size"]), tar.extractfile(member).read())
+
+    def test_resume_continues_last_shard_and_counter(self):
+        self.write(MODULE._TarShardWriter(self.folder, "img"), range(1, 4), 1024 * 1024, write_index=True)
+
+        writer = MODULE._TarShardWriter(self.folder, "img")
+        self.assertEqual((writer.shard, writer.next_counter), (0, 4))
+        start = writer.reserve(1, 2)
+        self.assertEqual(start, 4)
+        self.write(writer, range(start, start + 2), 1024 * 1024, write_index=True)
+        self.assertEqual(writer.shards_written, {"img-000000.tar"})
+        self.assertEqual(len(self.shard_names(0)), 10)
+        with tarfile.open(os.path.join(self.folder, "img-000000.tar")) as tar, open(os.path.join(self.folder, "img-000000.index.jsonl"), "r", encoding="utf-8") as f:
+            offsets = {member.name: member.offset_data for member in tar.getmembers()}
+            self.assertEqual({entry["name"]: entry["offset"] for entry in map(json.loads, f)}, offsets)
+
+    def test_save_images_writes_samples_to_shards(self):
+        _, report = self.save(make_images(2), caption="说明", output_mode="Tar Shards")
+        self.assertIn("Tar shards: img-000000.tar", report)
+        self.assertEqual(self.shard_names(0), ["img_00001_.png", "img_00001_.txt", "img_00002_.png", "img_00002_.txt"])
+        with tarfile.open(os.path.join(self.folder, "img-000000.tar")) as tar:
+            self.assertEqual(tar.extractfile("img_00002_.txt").read().decode("utf-8"), "说明")
+
+
+    def test_async_save_closes_shards_before_returning_by_default(self):
+        _, report = self.save(make_images(3), caption="说明", output_mode="Tar Shards", async_write=True)
+        self.assertIn("Saved 3 image(s)", report)
+        self.assertIn("Background writer: 0 file(s) pending", report)
+        self.assertEqual(len(self.shard_names(0)), 6)
+
+if __name__ == "__main__":
+    unittest.main()
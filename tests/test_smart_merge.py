@@ -0,0 +1,592 @@
+import importlib.util
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import threading
+import unittest
+import unittest.mock
+
+import cv2
+import numpy as np
+import torch
+
+
+ROOT = Path(__file__).resolve().parents[1]
+MODULE_PATH = ROOT / "Smart_merge_images.py"
+SPEC = importlib.util.spec_from_file_location("ck_smart_merge_test", MODULE_PATH)
+MODULE = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(MODULE)
+
+
+def make_scene(frames=3, size=160, crop=(40, 40, 64, 64), seed=0):
+    """生成带纹理的背景批次，以及从中裁出并略微调色的编辑裁剪图。"""
+    rng = np.random.default_rng(seed)
+    noise = rng.random((frames, size // 8, size // 8, 3)).astype(np.float32)
+    background = torch.nn.functional.interpolate(
+        torch.from_numpy(noise).movedim(-1, 1), size=(size, size), mode="bicubic", align_corners=False
+    ).movedim(1, -1).clamp(0.0, 1.0)
+    x, y, w, h = crop
+    edited = (background[:, y:y + h, x:x + w] * 0.9 + 0.05).contiguous()
+    return background.contiguous(), edited
+
+
+FIXED_HOMOGRAPHY = np.array([[1.02, -0.03, 40.4], [0.02, 0.97, 39.6], [1e-5, -1e-5, 1.0]])
+
+
+def fixed_alignment(homography):
+    """替换 SIFT 对齐为固定单应矩阵，避免 RANSAC 随机性影响逐像素比较。"""
+    def perform_sift_alignment(self, query_img, train_img, *args, **kwargs):
+        return homography.copy()
+    return unittest.mock.patch.object(MODULE.SmartMergeImages, "perform_sift_alignment", perform_sift_alignment)
+
+
+def merge(background, edited, color_match="Alpha Soft Blend", **kwargs):
+    return MODULE.SmartMergeImages().smart_merge(
+        background,
+        edited,
+        "Auto",
+        color_match,
+        kwargs.pop("feather_kernel", 8),
+        kwargs.pop("adapt_thresh", 25),
+        kwargs.pop("adapt_align", 0.0),
+        kwargs.pop("adapt_local_match", "Histogram"),
+        **kwargs,
+    )[0]
+
+
+def reference_histogram_match(src, ref, mask):
+    """逐通道、逐级查找的原始实现，用于校验向量化版本。"""
+    matched = np.copy(src)
+    mask_bool = mask > 0.5
+    for c in range(src.shape[-1]):
+        src_pixels = src[:, :, c][mask_bool]
+        ref_pixels = ref[:, :, c][mask_bool]
+        if len(src_pixels) == 0:
+            continue
+        src_cdf = np.histogram(src_pixels, 256, [0, 256])[0].cumsum()
+        ref_cdf = np.histogram(ref_pixels, 256, [0, 256])[0].cumsum()
+        src_cdf = src_cdf / (src_cdf[-1] + 1e-8)
+        ref_cdf = ref_cdf / (ref_cdf[-1] + 1e-8)
+        lookup_table = np.zeros(256)
+        j = 0
+        for i in range(256):
+            while j < 256 and ref_cdf[j] < src_cdf[i]:
+                j += 1
+            lookup_table[i] = j
+        src_matched = lookup_table.astype(np.uint8)[src[:, :, c]]
+        matched[:, :, c] = np.where(mask_bool, src_matched, src[:, :, c])
+    return matched
+
+
+class HistogramMatchTest(unittest.TestCase):
+    def test_matches_reference_inside_partial_mask(self):
+        rng = np.random.default_rng(1)
+        src = rng.integers(0, 180, (64, 80, 3), dtype=np.uint8)
+        ref = rng.integers(60, 256, (64, 80, 3), dtype=np.uint8)
+        mask = np.zeros((64, 80), dtype=np.float32)
+        mask[10:40, 20:70] = 1.0
+        mask[12:20, 22:30] = 0.3
+
+        expected = reference_histogram_match(src, ref, mask)
+        actual = MODULE.SmartMergeImages().exact_histogram_match(src, ref, mask)
+        self.assertTrue(np.array_equal(actual, expected))
+        self.assertTrue(np.array_equal(actual[mask <= 0.5], src[mask <= 0.5]))
+
+    def test_two_channel_input_and_empty_mask(self):
+        rng = np.random.default_rng(2)
+        src = rng.integers(0, 256, (32, 32, 2), dtype=np.uint8)
+        ref = rng.integers(0, 256, (32, 32, 2), dtype=np.uint8)
+        mask = np.zeros((32, 32), dtype=np.float32)
+        node = MODULE.SmartMergeImages()
+        self.assertTrue(np.array_equal(node.exact_histogram_match(src, ref, mask), src))
+        mask[4:28, 4:28] = 1.0
+        self.assertTrue(np.array_equal(node.exact_histogram_match(src, ref, mask), reference_histogram_match(src, ref, mask)))
+
+
+class SmartMergeWorkersTest(unittest.TestCase):
+    def test_parallel_output_matches_serial(self):
+        background, edited = make_scene()
+        with fixed_alignment(FIXED_HOMOGRAPHY):
+            serial = merge(background, edited, workers=1)
+            parallel = merge(background, edited, workers=3)
+        self.assertEqual(tuple(parallel.shape), tuple(background.shape))
+        self.assertTrue(torch.equal(serial, parallel))
+
+    def test_failed_frame_falls_back_to_original(self):
+        background, edited = make_scene()
+        node = MODULE.SmartMergeImages()
+        original_merge_frame = node._merge_frame
+
+        def flaky_merge_frame(i, *args, **kwargs):
+            if i == 1:
+                raise RuntimeError("boom")
+            return original_merge_frame(i, *args, **kwargs)
+
+        node._merge_frame = flaky_merge_frame
+        output = node.smart_merge(background, edited, "Auto", "None", 8, 25, 0.0, "Histogram", workers=2)[0]
+        self.assertTrue(torch.equal(output[1], background[1]))
+        self.assertFalse(torch.equal(output[0], background[0]))
+
+    def test_worker_count_is_bounded_by_batch(self):
+        self.assertEqual(MODULE._resolve_worker_count(8, 3), 3)
+        self.assertEqual(MODULE._resolve_worker_count(1, 10), 1)
+        self.assertGreaterEqual(MODULE._resolve_worker_count(0, 10), 1)
+
+
+class SmartMergeRoiTest(unittest.TestCase):
+    def full_frame_blend(self, background, edited, homography):
+        bg = (background.numpy() * 255).astype(np.uint8)
+        fg = (edited.numpy() * 255).astype(np.uint8)
+        size = (bg.shape[1], bg.shape[0])
+        warped_fg = cv2.warpPerspective(fg, homography, size, flags=cv2.INTER_LANCZOS4, borderMode=cv2.BORDER_REFLECT101)
+        mask = cv2.warpPerspective(np.ones(fg.shape[:2], dtype=np.float32), homography, size, flags=cv2.INTER_LINEAR)[:, :, None]
+        blended = warped_fg.astype(np.float32) * mask + bg.astype(np.float32) * (1.0 - mask)
+        return np.clip(blended, 0, 255).astype(np.uint8)
+
+    def assert_matches_full_frame(self, homography):
+        background, edited = make_scene(frames=1, size=192)
+        # 背景取 8 位量化值，使 ROI 外直接沿用的浮点像素与整帧量化结果一致
+        background = (torch.floor(background * 255) + 0.25) / 255
+        with fixed_alignment(homography):
+            output = merge(background, edited, color_match="None", feather_kernel=0)[0]
+        expected = self.full_frame_blend(background[0], edited[0], homography)
+        self.assertTrue(np.array_equal((output.numpy() * 255).round().astype(np.uint8), expected))
+
+    def test_roi_pipeline_matches_full_frame_blend(self):
+        self.assert_matches_full_frame(FIXED_HOMOGRAPHY)
+
+    def test_roi_pipeline_handles_masks_touching_frame_edge(self):
+        self.assert_matches_full_frame(np.array([[1.0, 0.0, -12.5], [0.0, 1.0, 150.25], [0.0, 0.0, 1.0]]))
+
+    def test_warped_bounds_cover_projection_with_margin(self):
+        bounds = MODULE._warped_bounds(np.array([[1.0, 0, 50], [0, 1.0, 60], [0, 0, 1.0]]), 20, 10, 200, 100, 5)
+        self.assertEqual(bounds, (44, 54, 77, 77))
+        self.assertIsNone(MODULE._warped_bounds(np.array([[1.0, 0, 500], [0, 1.0, 60], [0, 0, 1.0]]), 20, 10, 200, 100, 5))
+
+
+def make_panning_clip(frames=6, size=192, crop=64, step=3, seed=5):
+    """背景逐帧平移 step 像素，裁剪图始终取自画面中的同一内容。"""
+    rng = np.random.default_rng(seed)
+    noise = rng.random((1, 3, size // 4, size // 4 + frames)).astype(np.float32)
+    texture = torch.nn.functional.interpolate(
+        torch.from_numpy(noise), size=(size, size + frames * step), mode="bicubic", align_corners=False
+    ).movedim(1, -1).clamp(0.0, 1.0)[0]
+    background = torch.stack([texture[:, k * step:k * step + size] for k in range(frames)]).contiguous()
+    x0 = size // 2
+    edited = torch.stack([background[k, 60:60 + crop, x0 - k * step:x0 - k * step + crop] for k in range(frames)]).contiguous()
+    return background, edited, x0
+
+
+def template_alignment(query_img, train_img, *args):
+    """用模板匹配求纯平移单应矩阵，作为确定性的对齐替身。"""
+    _, _, _, (x, y) = cv2.minMaxLoc(cv2.matchTemplate(train_img, query_img, cv2.TM_CCOEFF_NORMED))
+    return np.array([[1.0, 0.0, x], [0.0, 1.0, y], [0.0, 0.0, 1.0]])
+
+
+class TemporalTrackingTest(unittest.TestCase):
+    def setUp(self):
+        MODULE._ALIGNMENT_CACHE.clear()
+
+    def test_ecc_refines_offset_homography(self):
+        background, edited, x0 = make_panning_clip()
+        bg = (background[1].numpy() * 255).astype(np.uint8)
+        fg = (edited[1].numpy() * 255).astype(np.uint8)
+        guess = np.array([[1.0, 0.0, x0 - 3 + 2.0], [0.0, 1.0, 60 - 1.5], [0.0, 0.0, 1.0]])
+        refined, rho = MODULE._refine_homography_ecc(fg, bg, guess)
+        self.assertGreater(rho, 0.9)
+        self.assertAlmostEqual(refined[0, 2], x0 - 3, delta=0.5)
+        self.assertAlmostEqual(refined[1, 2], 60, delta=0.5)
+
+    def test_keyframe_tracking_only_solves_keyframes(self):
+        background, edited, _ = make_panning_clip()
+        node = MODULE.SmartMergeImages()
+        with unittest.mock.patch.object(node, "perform_sift_alignment", side_effect=template_alignment) as solve:
+            output = node.smart_merge(
+                background, edited, "Auto", "None", 0, 25, 0.0, "Histogram",
+                temporal_mode="Keyframe Tracking", keyframe_interval=3, tracking_threshold=0.9, workers=2,
+            )[0]
+        self.assertEqual(solve.call_count, 2)
+        # 跟踪帧应贴回原位置，结果与原背景几乎一致
+        self.assertLess((output - background).abs().mean().item(), 0.005)
+
+    def test_low_correlation_falls_back_to_full_solve(self):
+        background, edited, _ = make_panning_clip()
+        node = MODULE.SmartMergeImages()
+        with unittest.mock.patch.object(node, "perform_sift_alignment", side_effect=template_alignment) as solve:
+            node.smart_merge(
+                background, edited, "Auto", "None", 0, 25, 0.0, "Histogram",
+                temporal_mode="Keyframe Tracking", keyframe_interval=6, tracking_threshold=1.0,
+            )
+        self.assertEqual(solve.call_count, 6)
+
+
+def make_plate(size=(480, 640), seed=0):
+    """多尺度噪声纹理，保证各类检测器都有足够的特征点。"""
+    rng = np.random.default_rng(seed)
+    plate = np.zeros(size + (3,), dtype=np.float32)
+    for cell in (8, 32, 128):
+        noise = rng.random((size[0] // cell + 1, size[1] // cell + 1, 3)).astype(np.float32)
+        plate += cv2.resize(noise, (size[1], size[0]), interpolation=cv2.INTER_CUBIC)
+    return np.clip(plate / 3 * 255, 0, 255).astype(np.uint8)
+
+
+class FeatureDetectorTest(unittest.TestCase):
+    HOMOGRAPHY = np.array([[1.04, 0.03, 250.0], [-0.02, 0.98, 140.0], [2e-5, 1e-5, 1.0]])
+
+    def setUp(self):
+        MODULE._ALIGNMENT_CACHE.clear()
+        self.plate = make_plate()
+        self.query = cv2.warpPerspective(self.plate, np.linalg.inv(self.HOMOGRAPHY), (240, 200), flags=cv2.INTER_LINEAR)
+        self.corners = np.array([[0, 0], [240, 0], [240, 200], [0, 200]], dtype=np.float64).reshape(-1, 1, 2)
+
+    def corner_error(self, options):
+        H = MODULE.SmartMergeImages().perform_sift_alignment(self.query, self.plate, options)
+        self.assertIsNotNone(H)
+        expected = cv2.perspectiveTransform(self.corners, self.HOMOGRAPHY)
+        return np.abs(cv2.perspectiveTransform(self.corners, H) - expected).max()
+
+    def test_downscaled_detection_is_rescaled_to_native(self):
+        self.assertLess(self.corner_error(MODULE._AlignmentOptions("SIFT", 1, False)), 1.0)
+
+    def test_native_refinement_tightens_downscaled_solution(self):
+        self.assertLess(self.corner_error(MODULE._AlignmentOptions("SIFT", 1, True)), 0.5)
+
+    def test_binary_detectors_use_hamming_matcher(self):
+        for detector in ("ORB", "AKAZE"):
+            with self.subTest(detector=detector):
+                self.assertLess(self.corner_error(MODULE._AlignmentOptions(detector, 0, False)), 8.0)
+
+
+class BroadcastTest(unittest.TestCase):
+    def setUp(self):
+        MODULE._ALIGNMENT_CACHE.clear()
+
+    def make_batch(self, crops=4):
+        plate = make_plate((240, 320))
+        edited = []
+        for k in range(crops):
+            x, y = 40 + 30 * k, 50 + 10 * k
+            edited.append(torch.from_numpy(plate[y:y + 96, x:x + 112].astype(np.float32) / 255.0) * 0.9)
+        return torch.from_numpy(plate.astype(np.float32) / 255.0)[None], torch.stack(edited)
+
+    def test_single_background_is_paired_with_every_crop(self):
+        background, edited = self.make_batch()
+        for color_match in ("Adaptive Local (strong)", "SeamlessClone (PS Auto Blend)", "LAB_Mean"):
+            with self.subTest(color_match=color_match):
+                output = merge(background, edited, color_match=color_match, batch_mode="Broadcast Single Frame", workers=2)
+                self.assertEqual(tuple(output.shape), (4, 240, 320, 3))
+                self.assertFalse(torch.equal(output[0], output[1]))
+
+    def test_shortest_batch_keeps_previous_behaviour(self):
+        background, edited = self.make_batch()
+        self.assertEqual(merge(background, edited).shape[0], 1)
+
+    def test_single_frame_sources_only_broadcast_in_broadcast_mode(self):
+        frame = torch.rand(1, 8, 8, 3)
+        with self.assertRaises(IndexError):
+            MODULE._FrameSource(frame).uint8(1)
+        shared = MODULE._FrameSource(frame, broadcast=True)
+        self.assertIs(shared.uint8(3), shared.uint8(0))
+
+    def test_shortest_batch_does_not_reuse_single_bridge_frame(self):
+        background, edited = make_scene(frames=2)
+        bridge = background[:1, 40:104, 40:104].contiguous()
+        with fixed_alignment(FIXED_HOMOGRAPHY):
+            output = merge(background, edited, original_crop_A=bridge)
+        self.assertFalse(torch.equal(output[0], background[0]))
+        self.assertTrue(torch.equal(output[1], background[1]))
+
+    def test_background_features_are_extracted_once(self):
+        background, edited = self.make_batch()
+        MODULE._ALIGNMENT_CACHE.set_budget(0)
+        self.addCleanup(MODULE._ALIGNMENT_CACHE.set_budget, 256 * 1024 * 1024)
+        node = MODULE.SmartMergeImages()
+        detected_shapes = []
+        original_detect = node._detect_features
+
+        def counting_detect(img, *args):
+            detected_shapes.append(img.shape[:2])
+            return original_detect(img, *args)
+
+        with unittest.mock.patch.object(node, "_detect_features", side_effect=counting_detect):
+            node.smart_merge(background, edited, "Auto", "None", 8, 25, 0.0, "Histogram", batch_mode="Broadcast Single Frame")
+        self.assertEqual(detected_shapes.count((240, 320)), 1)
+        self.assertEqual(len(detected_shapes), 5)
+
+    def test_incompatible_lengths_fall_back_to_shortest(self):
+        self.assertEqual(MODULE._resolve_batch_size([2, 5], True), 2)
+        self.assertEqual(MODULE._resolve_batch_size([1, 5, 5], True), 5)
+        self.assertEqual(MODULE._resolve_batch_size([1, 5], False), 1)
+
+
+class AlignmentCacheTest(unittest.TestCase):
+    def setUp(self):
+        MODULE._ALIGNMENT_CACHE.clear()
+        MODULE._ALIGNMENT_CACHE.set_budget(256 * 1024 * 1024)
+
+    def test_lru_respects_byte_budget(self):
+        cache = MODULE._AlignmentCache(100)
+        cache.put("a", 1, 40)
+        cache.put("b", 2, 40)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3, 40)
+        self.assertIs(cache.get("b"), MODULE._CACHE_MISS)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.total_bytes, 80)
+        cache.put("huge", 4, 1000)
+        self.assertIs(cache.get("huge"), MODULE._CACHE_MISS)
+        cache.set_budget(0)
+        self.assertEqual(cache.total_bytes, 0)
+
+    def test_failed_alignments_count_towards_budget(self):
+        blank = np.zeros((32, 32, 3), dtype=np.uint8)
+        cache = MODULE._AlignmentCache(MODULE._ENTRY_OVERHEAD_BYTES * 4)
+        node = MODULE.SmartMergeImages()
+        for value in range(4):
+            self.assertIsNone(node.perform_sift_alignment(blank + value, blank, cache=cache))
+        self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+        self.assertLessEqual(len(cache._entries), 4)
+
+    def test_concurrent_misses_compute_once(self):
+        cache = MODULE._AlignmentCache(1000)
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "value"
+
+        with ThreadPoolExecutor(4) as pool:
+            futures = [pool.submit(cache.get_or_compute, "key", compute, lambda value: 10) for _ in range(4)]
+            started.wait(5)
+            release.set()
+            results = [future.result(5) for future in futures]
+        self.assertEqual(results, ["value"] * 4)
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_computation_lets_waiters_retry(self):
+        cache = MODULE._AlignmentCache(1000)
+        with self.assertRaises(RuntimeError):
+            cache.get_or_compute("key", unittest.mock.Mock(side_effect=RuntimeError), lambda value: 10)
+        self.assertEqual(cache.get_or_compute("key", lambda: 1, lambda value: 10), 1)
+        self.assertEqual(cache._pending, {})
+
+    def test_repeated_alignment_skips_feature_detection(self):
+        rng = np.random.default_rng(3)
+        train = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+        query = np.ascontiguousarray(train[30:90, 40:120])
+        node = MODULE.SmartMergeImages()
+        with unittest.mock.patch.object(node, "_detect_features", wraps=node._detect_features) as detect:
+            first = node.perform_sift_alignment(query, train)
+            second = node.perform_sift_alignment(query.copy(), train.copy())
+            self.assertEqual(detect.call_count, 2)
+        if first is None:
+            self.assertIsNone(second)
+        else:
+            self.assertTrue(np.array_equal(first, second))
+
+    def test_disabled_cache_detects_every_time(self):
+        rng = np.random.default_rng(4)
+        train = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+        MODULE._ALIGNMENT_CACHE.set_budget(0)
+        self.addCleanup(MODULE._ALIGNMENT_CACHE.set_budget, 256 * 1024 * 1024)
+        node = MODULE.SmartMergeImages()
+        with unittest.mock.patch.object(node, "_detect_features", wraps=node._detect_features) as detect:
+            node.perform_sift_alignment(train, train)
+            node.perform_sift_alignment(train, train)
+            self.assertEqual(detect.call_count, 4)
+
+
+class FixedPointBlendTest(unittest.TestCase):
+    def test_blend_uint8_matches_rounded_float_blend(self):
+        rng = np.random.default_rng(8)
+        fg = rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)
+        bg = rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)
+        alpha = rng.integers(0, 256, (32, 32), dtype=np.uint8)
+        alpha[0, 0], alpha[0, 1] = 0, 255
+        expected = np.round((fg * (alpha[:, :, None] / 255.0)) + bg * (1 - alpha[:, :, None] / 255.0))
+        self.assertTrue(np.array_equal(MODULE._blend_uint8(fg, bg, alpha), expected.astype(np.uint8)))
+
+    def test_fixed_point_backend_stays_within_rounding_of_float(self):
+        background, edited = make_scene(frames=2, size=192)
+        # 每次混合最多差 1 级灰度；LAB_Mean 与自适应模式各多一次混合
+        for color_match, levels in (("Alpha Soft Blend", 1), ("LAB_Mean", 2), ("Adaptive Local (strong)", 2)):
+            with self.subTest(color_match=color_match), fixed_alignment(FIXED_HOMOGRAPHY):
+                reference = merge(background, edited, color_match=color_match)
+                fixed = merge(background, edited, color_match=color_match, blend_backend="Fixed-point uint8")
+                self.assertEqual(fixed.shape, reference.shape)
+                self.assertLessEqual((fixed - reference).abs().max().item() * 255, levels + 1e-4)
+
+    def test_pixels_outside_roi_pass_through_unchanged(self):
+        background, edited = make_scene(frames=1, size=192)
+        with fixed_alignment(FIXED_HOMOGRAPHY):
+            output = merge(background, edited, blend_backend="Fixed-point uint8")
+        self.assertTrue(torch.equal(output[0, :, 150:], background[0, :, 150:]))
+
+
+class LaplacianBlendTest(unittest.TestCase):
+    def test_constant_masks_select_one_input(self):
+        rng = np.random.default_rng(9)
+        fg = rng.integers(0, 256, (45, 61, 3), dtype=np.uint8)
+        bg = rng.integers(0, 256, (45, 61, 3), dtype=np.uint8)
+        ones = np.ones((45, 61), dtype=np.float32)
+        self.assertLessEqual(np.abs(MODULE._laplacian_blend(fg, bg, ones, ones, 4).astype(int) - fg).max(), 1)
+        self.assertTrue(np.array_equal(MODULE._laplacian_blend(fg, bg, ones, np.zeros_like(ones), 4), bg))
+
+    def test_pyramid_blend_handles_mask_touching_frame_edge(self):
+        background, edited = make_scene(frames=1, size=192)
+        homography = np.array([[1.0, 0.0, -12.5], [0.0, 1.0, 150.25], [0.0, 0.0, 1.0]])
+        with fixed_alignment(homography):
+            output = merge(background, edited, color_match="Laplacian Pyramid Blend", feather_kernel=6, pyramid_levels=6)[0]
+        # 遮罩之外只有 8 位量化误差
+        self.assertLessEqual((output[:140] - background[0, :140]).abs().max().item(), 1 / 255 + 1e-6)
+        self.assertLessEqual((output[:, 60:] - background[0, :, 60:]).abs().max().item(), 1 / 255 + 1e-6)
+        edited_region = output[165:, :40]
+        self.assertFalse(torch.equal(edited_region, background[0, 165:, :40]))
+        expected = edited[0, 15:42, 13:53]
+        self.assertLess((edited_region - expected).abs().mean().item(), 0.03)
+
+
+    def test_uniform_crop_has_no_seam_step_and_keeps_colour(self):
+        background = torch.full((1, 160, 160, 3), 0.5)
+        edited = torch.full((1, 64, 64, 3), 0.3)
+        homography = np.array([[1.0, 0.0, 40.0], [0.0, 1.0, 48.0], [0.0, 0.0, 1.0]])
+        rows = {}
+        for color_match in ("Alpha Soft Blend", "Laplacian Pyramid Blend"):
+            with fixed_alignment(homography):
+                output = merge(background, edited, color_match=color_match, feather_kernel=8, pyramid_levels=5, adapt_thresh=0)[0]
+            rows[color_match] = (output[80, :, 0] * 255).round().numpy()
+        pyramid = rows["Laplacian Pyramid Blend"]
+        # 裁剪图左边缘在第 40 列：边缘外与 Alpha 混合一样保持背景，边缘处没有台阶，整体过渡不比 Alpha 混合更陡
+        self.assertTrue(np.array_equal(pyramid[:40], rows["Alpha Soft Blend"][:40]))
+        self.assertEqual(pyramid[40], pyramid[39])
+        self.assertLessEqual(np.abs(np.diff(pyramid)).max(), np.abs(np.diff(rows["Alpha Soft Blend"])).max())
+        self.assertLessEqual(abs(pyramid[72] - 76), 1)
+
+    def test_pyramid_never_changes_pixels_outside_bounds(self):
+        rng = np.random.default_rng(21)
+        fg = rng.integers(0, 256, (150, 170, 3), dtype=np.uint8)
+        bg = rng.integers(0, 256, (150, 170, 3), dtype=np.uint8)
+        bounds = np.zeros((150, 170), dtype=np.float32)
+        bounds[20:130, 30:150] = 1.0
+        bounds = cv2.warpAffine(bounds, cv2.getRotationMatrix2D((85, 75), 17, 1.0), (170, 150))
+        mask = cv2.erode((bounds >= 0.999).astype(np.uint8), np.ones((9, 9), np.uint8)).astype(np.float32)
+        output = MODULE._laplacian_blend(fg, bg, mask, bounds, 6)
+        outside = bounds < 0.999
+        self.assertTrue(np.array_equal(output[outside], bg[outside]))
+        self.assertFalse(np.array_equal(output[~outside], bg[~outside]))
+
+
+class ColorStatsTest(unittest.TestCase):
+    def count_calls(self, function_name, **kwargs):
+        background, edited = make_scene(frames=kwargs.pop("frames", 1), size=160)
+        original = getattr(cv2, function_name)
+        with fixed_alignment(FIXED_HOMOGRAPHY), unittest.mock.patch.object(MODULE.cv2, function_name, wraps=original) as wrapped:
+            output = merge(background, edited, **kwargs)
+        return wrapped, output
+
+    def test_adaptive_mode_converts_each_image_to_lab_once(self):
+        for match_mode in ("LAB_Mean", "Reinhard", "Adaptive Histogram"):
+            with self.subTest(match_mode=match_mode):
+                cvt, _ = self.count_calls("cvtColor", color_match="Adaptive Local (strong)", adapt_local_match=match_mode)
+                to_lab = [call for call in cvt.call_args_list if call.args[1] == cv2.COLOR_RGB2LAB]
+                self.assertEqual(len(to_lab), 2)
+
+    def test_batch_reference_computes_background_stats_once(self):
+        per_frame, per_frame_output = self.count_calls("meanStdDev", frames=3, color_match="LAB_Mean")
+        batch, batch_output = self.count_calls("meanStdDev", frames=3, color_match="LAB_Mean", color_reference="Batch (First Frame)", workers=3)
+        self.assertEqual(per_frame.call_count, 6)
+        self.assertEqual(batch.call_count, 4)
+        self.assertTrue(torch.equal(per_frame_output[0], batch_output[0]))
+        self.assertFalse(torch.equal(per_frame_output[2], batch_output[2]))
+
+    def test_batch_reference_without_first_frame_falls_back_per_frame(self):
+        background, edited = make_scene(frames=4, size=160)
+        with fixed_alignment(FIXED_HOMOGRAPHY):
+            expected = merge(background, edited, color_match="LAB_Mean")
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                node = MODULE.SmartMergeImages()
+                original_merge_frame = node._merge_frame
+
+                def failing_first_frame(i, *args, **kwargs):
+                    if i == 0:
+                        raise RuntimeError("boom")
+                    return original_merge_frame(i, *args, **kwargs)
+
+                node._merge_frame = failing_first_frame
+                with fixed_alignment(FIXED_HOMOGRAPHY):
+                    output = node.smart_merge(background, edited, "Auto", "LAB_Mean", 8, 25, 0.0, "Histogram", workers=workers, color_reference="Batch (First Frame)")[0]
+                self.assertTrue(torch.equal(output[0], background[0]))
+                self.assertTrue(torch.equal(output[1:], expected[1:]))
+
+    def test_histogram_match_accepts_precomputed_reference(self):
+        rng = np.random.default_rng(12)
+        src = rng.integers(0, 256, (40, 50, 3), dtype=np.uint8)
+        ref = rng.integers(0, 200, (40, 50, 3), dtype=np.uint8)
+        mask = np.zeros((40, 50), dtype=np.float32)
+        mask[5:35, 10:45] = 1.0
+        stats = MODULE._ColorStats(ref, (mask * 255).astype(np.uint8), mask)
+        node = MODULE.SmartMergeImages()
+        self.assertTrue(np.array_equal(
+            node.exact_histogram_match(src, None, mask, ref_cdf=stats.cdf("rgb")),
+            node.exact_histogram_match(src, ref, mask),
+        ))
+
+
+class ProfilingTest(unittest.TestCase):
+    def setUp(self):
+        MODULE._ALIGNMENT_CACHE.clear()
+
+    def run_profiled(self, background, edited, **kwargs):
+        return MODULE.SmartMergeImages().smart_merge(
+            background, edited, "Auto", "Alpha Soft Blend", 8, 25, 0.0, "Histogram", profiling=True, **kwargs
+        )
+
+    def test_profile_reports_stages_alignment_and_peak_memory(self):
+        background, edited = make_scene(frames=3, size=192)
+        with fixed_alignment(FIXED_HOMOGRAPHY):
+            output, report = self.run_profiled(background, edited, workers=2)
+        profile = json.loads(report)
+        self.assertEqual(output.shape, background.shape)
+        self.assertEqual([frame["index"] for frame in profile["frames"]], [0, 1, 2])
+        aggregate = profile["aggregate"]
+        self.assertEqual(aggregate["frames"], 3)
+        self.assertEqual(aggregate["results"], {"aligned": 3})
+        self.assertEqual(aggregate["alignment"], {"B": {"aligned": 3}})
+        self.assertGreater(aggregate["peak_traced_bytes"], 192 * 192 * 3)
+        for stage in ("uint8", "warp", "color_match", "feather", "blend", "output"):
+            self.assertIn(stage, aggregate["stages_s"])
+        frame = profile["frames"][0]
+        self.assertAlmostEqual(sum(frame["stages_s"].values()), frame["total_s"], places=4)
+
+    def test_profile_records_detector_stages_and_fallback(self):
+        background, edited = make_scene(frames=1, size=96)
+        flat = torch.full_like(edited, 0.5)
+        _, report = self.run_profiled(background, flat)
+        frame = json.loads(report)["frames"][0]
+        self.assertEqual(frame["result"], "fallback")
+        self.assertEqual(frame["alignment"], {"B": "failed"})
+        self.assertIn("detect", frame["stages_s"])
+
+    def test_profile_records_errors(self):
+        background, edited = make_scene(frames=1, size=96)
+        with unittest.mock.patch.object(MODULE.SmartMergeImages, "_align", side_effect=RuntimeError("boom")):
+            output, report = self.run_profiled(background, edited)
+        frame = json.loads(report)["frames"][0]
+        self.assertEqual(frame["result"], "error")
+        self.assertIn("boom", frame["error"])
+        self.assertTrue(torch.equal(output[0], background[0]))
+
+    def test_profile_output_is_empty_when_disabled(self):
+        background, edited = make_scene(frames=1, size=96)
+        with fixed_alignment(FIXED_HOMOGRAPHY):
+            _, report = MODULE.SmartMergeImages().smart_merge(background, edited, "Auto", "None", 8, 25, 0.0, "Histogram")
+        self.assertEqual(report, "")
+
+
+if __name__ == "__main__":
+    unittest.main()